@@ -1,98 +1,162 @@
+import time
+_script_start = time.perf_counter()
+
 import streamlit as st
 import tempfile, os
-import numpy as np
-from PIL import Image
-import gdown  # type: ignore
 from pathlib import Path
 
-# Try to import cv2, but provide fallback if not available
-try:
-    import cv2
-    CV2_AVAILABLE = True
-except ImportError:
-    CV2_AVAILABLE = False
-    st.warning("⚠️ OpenCV not available in this environment. Some image processing features may be limited.")
-
-# Import health check functionality
-try:
-    from health_check import start_health_check_server
-    health_server = start_health_check_server(8081)
-except ImportError:
-    health_server = None
-    print("Health check module not available")
-
-# Global variable to store the model
-model = None
+# Configure the page before anything else so the browser gets a first paint right away
+st.set_page_config(page_title="YOLOv8 Object Detection", layout="wide")
+
+# Only the (stdlib-only) registry is imported eagerly; numpy, OpenCV, torch and
+# ultralytics are imported on first use or on the background loader thread
+from utils.model_registry import get_model_registry
 
 @st.cache_resource
+def start_health_server():
+    """
+    Make sure the health check server is running. serve.py starts it before
+    Streamlit; this covers a plain `streamlit run app.py`.
+    """
+    try:
+        from health_check import start_health_check_server
+        return start_health_check_server()
+    except ImportError:
+        print("Health check module not available")
+        return None
+
+health_server = start_health_server()
+
 def download_model():
-    """Download model from Google Drive if not exists"""
-    save_dest = Path('models')
-    save_dest.mkdir(exist_ok=True)
-    
-    model_path = save_dest / "best.pt"
-    
-    if not model_path.exists():
-        with st.spinner("⏳ Downloading model weights from Google Drive... This may take a minute!"):
-            # Using the provided Google Drive file ID
-            file_id = "1Wk1cHp2eR6oiVdZd4CJu-ZFHc-HybHgS"
-            url = f'https://drive.google.com/uc?id={file_id}'
-            
-            try:
-                gdown.download(url, str(model_path), quiet=False)
-                st.success("✅ Model downloaded successfully!")
-            except Exception as e:
-                st.error(f"❌ Error downloading model: {e}")
-                return None
-    
-    return model_path
-
-def load_yolo_model():
-    """Load YOLO model with deferred import and comprehensive error handling"""
-    global model
+    """Fetch model weights into the shared artifact cache if not already there"""
+    from utils.artifact_fetch import fetch_model_weights
+    return Path(fetch_model_weights())
+
+@st.cache_resource
+def start_model_loading():
+    """
+    Kick off the weights download, load and warm-up once per process, in
+    the background (a no-op when serve.py already started it)
+    """
+    registry = get_model_registry()
+    registry.load_in_background(download_model)
+    return registry
+
+def load_yolo_model(wait=False):
+    """Return this session's handle to the shared YOLO model, optionally waiting for warm-up"""
+    registry = start_model_loading()
+    if wait and registry.state == "loading":
+        with st.spinner("⏳ Waiting for the model to finish warming up..."):
+            registry.wait_until_loaded()
+    return registry.get()
+
+def session_client_id():
+    """Identify this browser session for per-client admission limits"""
     try:
-        # Import YOLO only when needed to avoid issues in cloud environments
-        from ultralytics import YOLO  # type: ignore
-         
-        model_path = download_model()
-        if model_path and model_path.exists():
-            try:
-                model = YOLO(str(model_path))
-                st.success("✅ Model loaded successfully!")
-                return model
-            except Exception as e:
-                st.error(f"❌ Error loading model: {e}")
-                st.info("ℹ️ The application will run in demo mode without object detection")
-                return None
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+    except ImportError:
+        ctx = None
+    return f"ui-{ctx.session_id}" if ctx is not None else "ui"
+
+def admitted_batches():
+    """admit(fn, stop) for video and bulk jobs: each batch takes one of this session's detection slots"""
+    from utils.admission import get_admission
+    client = session_client_id()
+
+    def admit(fn, stop):
+        # A long job waits out a burst instead of failing on it
+        return get_admission().run_patiently(client, fn, stop)
+
+    return admit
+
+def run_video_detection(video_file, model):
+    """Stream a video through the detector, showing annotated frames and a per-object summary"""
+    from utils.detection import CV2_AVAILABLE
+    if not CV2_AVAILABLE:
+        st.warning("❌ Video detection needs OpenCV, which is not available in this environment.")
+        return
+
+    from utils.video import IoUTracker, stream_detections
+
+    # OpenCV can only read videos from a path, so this mode still spools to disk
+    suffix = '.' + video_file.name.split('.')[-1].lower()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+        temp_file.write(video_file.getvalue())
+    try:
+        tracker = IoUTracker()
+        frame_slot = st.empty()
+        status = st.empty()
+        processed = 0
+        for frame_result in stream_detections(model, temp_file.name, conf=0.4, tracker=tracker,
+                                              admit=admitted_batches()):
+            processed += 1
+            frame_slot.image(frame_result.frame, channels="BGR",
+                             caption=f"Frame {frame_result.frame_index} ({frame_result.timestamp:.1f}s)",
+                             use_container_width=True)
+            status.write(f"🔍 Processed {processed} frames, tracking {len(tracker.tracks)} objects")
+
+        objects = tracker.summary()
+        if objects:
+            st.success(f"✅ Detected {len(objects)} distinct objects in {processed} processed frames")
+            st.dataframe(objects, use_container_width=True)
         else:
-            st.error("Model file not found. Please check your Google Drive link.")
-            return None
-    except ImportError as e:
-        st.error(f"Failed to import YOLO: {e}")
-        st.info("ℹ️ The application will run in demo mode without object detection")
-        return None
+            st.info("ℹ️ No industrial safety objects detected in this video.")
     except Exception as e:
-        st.error(f"Unexpected error loading model: {e}")
-        st.info("ℹ️ The application will run in demo mode without object detection")
-        return None
+        st.error(f"Error during video detection: {str(e)}")
+    finally:
+        os.unlink(temp_file.name)
 
-# Function to convert BGR to RGB (fallback if cv2 not available)
-def bgr_to_rgb(image_array):
-    """Convert BGR to RGB with fallback for environments without OpenCV"""
-    # Always use manual conversion to avoid OpenCV dependency
-    if len(image_array.shape) == 3 and image_array.shape[2] == 3:
-        return image_array[:, :, ::-1]  # Reverse the last dimension to convert BGR to RGB
-    return image_array
-
-# Load the model when the app starts
-try:
-    model = load_yolo_model()
-except Exception as e:
-    st.error(f"Error initializing model: {e}")
-    st.info("ℹ️ The application will run in demo mode without object detection")
-    model = None
+def run_bulk_detection(model, archive, folder, formats, resume, site=None):
+    """Stream a ZIP upload or a server-side folder through the detector, writing results as it goes"""
+    import hashlib
+    import shutil
+    from utils.bulk import BULK_OUTPUT_DIR, output_files, run_bulk_job
+    from utils.detection_store import get_detection_store
+    from utils.worker_pool import get_worker_pool
 
-st.set_page_config(page_title="YOLOv8 Object Detection", layout="wide")
+    if archive is not None:
+        source = archive
+        identity = f"{archive.name}:{archive.size}"
+        stem = Path(archive.name).stem
+    else:
+        if not os.path.isdir(folder):
+            st.error(f"❌ {folder} is not a directory on the server")
+            return
+        source = folder
+        identity = os.path.abspath(folder)
+        stem = Path(identity).name
+    # The same upload or folder maps to the same job directory, so a rerun resumes it
+    output_dir = os.path.join(BULK_OUTPUT_DIR, f"{stem}-{hashlib.sha256(identity.encode()).hexdigest()[:8]}")
+    if not resume and os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+
+    progress_bar = st.progress(0.0, text="Starting bulk detection...")
+    try:
+        for progress in run_bulk_job(model, source, output_dir, formats=formats, conf=0.4,
+                                     worker_pool=get_worker_pool(get_model_registry().model_path),
+                                     store=get_detection_store(), site=site, admit=admitted_batches()):
+            rate = progress.processed / progress.elapsed_s if progress.elapsed_s else 0.0
+            progress_bar.progress(progress.processed / max(progress.total, 1),
+                                  text=f"🔍 {progress.processed}/{progress.total} images, "
+                                       f"{progress.detections} detections ({rate:.1f} img/s)")
+    except Exception as e:
+        st.error(f"Error during bulk detection: {e}")
+        st.info("ℹ️ Results up to the last checkpoint are kept; run the job again to resume.")
+        return
+
+    st.success(f"✅ Processed {progress.processed} images: {progress.detections} detections, "
+               f"{progress.failed} images could not be read")
+    for path in output_files(output_dir):
+        # Large exports stay on the server rather than being loaded into the page
+        if os.path.getsize(path) <= 200 * (1 << 20):
+            with open(path, "rb") as f:
+                st.download_button(f"⬇️ {os.path.basename(path)}", f, file_name=os.path.basename(path))
+        else:
+            st.write(f"📄 {path}")
+
+# This session's handle to the process-wide model (None while it is still warming up)
+model = load_yolo_model()
 
 st.title("🚀 Smart Object Detection (YOLOv8 + Falcon)")
 st.write("Upload an image to test the trained model on cluttered/uncluttered environments.")
@@ -100,101 +164,237 @@ st.write("Upload an image to test the trained model on cluttered/uncluttered env
 # Show supported classes
 st.info("This model detects the following industrial safety objects: OxygenTank, NitrogenTank, FirstAidBox, FireAlarm, SafetySwitchPanel, EmergencyPhone, FireExtinguisher")
 
+registry = get_model_registry()
+if registry.state == "loading":
+    st.info("⏳ Model warming up... You can upload now; detection starts as soon as the model is ready.")
+elif registry.state == "failed":
+    error = registry.error
+    if isinstance(error, ImportError):
+        st.error(f"Failed to import YOLO: {error}")
+    else:
+        st.error(f"❌ Error loading model: {error}")
+    st.info("ℹ️ The application will run in demo mode without object detection")
+elif model is not None:
+    st.success("✅ Model loaded successfully!")
+
+if model is not None:
+    # Start the inference worker processes (if INFERENCE_WORKERS is set) as soon as the weights are known
+    from utils.worker_pool import get_worker_pool
+    get_worker_pool(registry.model_path)
+
+@st.cache_resource
+def start_model_updater():
+    """Start the background Falcon updater once per process"""
+    from utils.falcon_update import FalconUpdater
+    return FalconUpdater(get_model_registry()).start()
+
 # Manual model refresh button
 if st.button("🔄 Check for Model Updates"):
-    with st.spinner("Checking for model updates..."):
-        if model is None:
-            st.warning("❌ No model available. Cannot check for updates.")
-        else:
-            try:
-                # Import the update function only when needed
-                from utils.falcon_update import check_falcon_update
-                
-                # Get current model path - handle cases where it might not exist
-                current_model_path = "runs/detect/exp_rtx4060_150epoch/weights/best.pt"
-                if hasattr(model, 'overrides') and model.overrides.get('model'):
-                    current_model_path = str(model.overrides.get('model', current_model_path))
-                
-                new_model_path = check_falcon_update(current_model_path)
-                if new_model_path != current_model_path:
-                    # Import YOLO here as well for model update
-                    from ultralytics import YOLO  # type: ignore
-                    model = YOLO(new_model_path)
-                    st.success("✅ Model updated successfully!")
-                    st.rerun()
-                else:
-                    st.info("ℹ️ Your model is already up to date")
-            except Exception as e:
-                st.error(f"Error updating model: {e}")
+    if model is None:
+        st.warning("❌ No model available. Cannot check for updates.")
+    else:
+        try:
+            # The check, download and warm-up run in the background; this session keeps serving
+            start_model_updater().trigger()
+            st.info("ℹ️ Checking for model updates in the background. New weights are used as soon as they are ready.")
+        except Exception as e:
+            st.error(f"Error updating model: {e}")
+
+if model is not None:
+    updater_status = start_model_updater().status
+    if updater_status["state"] != "idle":
+        st.caption(f"🔄 Model update in progress ({updater_status['state']})")
+    elif updater_status["last_error"]:
+        st.caption(f"⚠️ Last model update check failed: {updater_status['last_error']}")
+
+mode = st.radio("Detection mode", ["📷 Image", "🎞️ Video", "📦 Bulk"], horizontal=True)
 
 # File uploader
-uploaded_file = st.file_uploader("📷 Upload an image", type=["jpg", "png", "jpeg"])
+uploaded_file = None
+if mode == "📦 Bulk":
+    archive = st.file_uploader("📦 Upload a ZIP of images", type=["zip"])
+    folder = st.text_input("...or the path of an image folder on the server")
+    formats = st.multiselect("Export formats", ["csv", "jsonl", "coco"], default=["csv", "jsonl"])
+    resume = st.checkbox("Resume from the last checkpoint", value=True)
+    bulk_site = st.text_input("📍 Site", value="", help="Stored with the results for historical queries")
+    if (archive or folder) and formats and st.button("▶️ Run bulk detection"):
+        model = load_yolo_model(wait=True)
+        if model is None:
+            st.warning("❌ No model available for object detection. Running in demo mode.")
+        else:
+            run_bulk_detection(model, archive, folder.strip(), formats, resume, site=bulk_site.strip() or None)
+elif mode == "🎞️ Video":
+    video_file = st.file_uploader("🎞️ Upload a video", type=["mp4", "avi", "mov", "mkv"])
+    if video_file:
+        model = load_yolo_model(wait=True)
+        if model is None:
+            st.warning("❌ No model available for object detection. Running in demo mode.")
+        else:
+            run_video_detection(video_file, model)
+else:
+    uploaded_file = st.file_uploader("📷 Upload an image", type=["jpg", "png", "jpeg"])
 
 if uploaded_file:
-    # Get the file extension
-    file_extension = uploaded_file.name.split('.')[-1].lower()
-    
-    # Create a temporary file with the correct extension
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=f'.{file_extension}')
-    temp_file.write(uploaded_file.getvalue())
-    temp_file.close()  # Close the file so YOLO can access it
-
-    # Display uploaded image
-    st.image(uploaded_file, caption="Uploaded Image", use_container_width=True)
-    
-    if model is None:
-        st.warning("❌ No model available for object detection. Running in demo mode.")
-        st.info("In a deployed environment, make sure the model files are included in the deployment package.")
-    else:
-        st.write("🔍 Detecting objects...")
+    from utils.detection import CV2_AVAILABLE, DEFAULT_DEVICE, detections_to_table, draw_detections, result_to_detections
+    from utils.adaptive import adaptive_detect, adaptive_enabled
+    from utils.admission import Rejected, get_admission
+    from utils.detection_store import DEFAULT_SITE, get_detection_store
+    from utils.ingest import INGEST_MODEL_SIDE, encode_preview, ingest_image, probe_size
+    from utils.result_cache import get_result_cache, model_digest
+    from utils.tiling import TILING_MIN_PIXELS, tiled_detect
+    from utils.tracing import RequestTrace
+
+    if not CV2_AVAILABLE:
+        st.warning("⚠️ OpenCV not available in this environment. Some image processing features may be limited.")
+
+    profile_request = st.checkbox("🔬 Profile this detection (cProfile)", value=False)
+    # Every stage of this rerun's detection path is timed under one request ID
+    trace = RequestTrace("ui.detect", profile=profile_request)
+
+    try:
+        # Decode the upload once (cached across reruns): a model input, plus a
+        # size-capped rendition that goes to the browser as a compressed preview
+        ingested = None
         try:
-            # Use the temporary file path for prediction
-            with st.spinner('Processing image...'):
-                results = model.predict(source=temp_file.name, conf=0.4, device="cpu")
-            
-            # Plot the results
-            result_image = results[0].plot()
-            
-            # Ensure the image is in the correct format for display
-            if len(result_image.shape) == 3:
-                # If it's a 3-channel image, it's likely BGR, convert to RGB
-                result_image_rgb = bgr_to_rgb(result_image)
-            else:
-                # Grayscale image
-                result_image_rgb = result_image
-                
-            # Display detection result
-            st.image(result_image_rgb, caption="Detection Result", use_container_width=True)
-            
-            # Show detection details
-            boxes = results[0].boxes
-            if boxes is not None and len(boxes) > 0:
-                st.success(f"✅ Detected {len(boxes)} objects")
-                
-                # Show details of detected objects
-                class_names = model.names
-                # Convert boxes to numpy for easier handling
-                boxes_data = boxes.cpu().numpy()
-                
-                # Access box data directly using numpy array indexing
-                cls_data = boxes_data.cls if boxes_data.cls.ndim > 0 else np.array([boxes_data.cls])
-                conf_data = boxes_data.conf if boxes_data.conf.ndim > 0 else np.array([boxes_data.conf])
-                
-                for i in range(len(cls_data)):
-                    class_id = int(cls_data[i])
-                    confidence = float(conf_data[i])
-                    class_name = class_names.get(class_id, f"Class {class_id}")
-                    st.write(f"Object {i+1}: {class_name} (Confidence: {confidence:.2f})")
-            else:
-                st.info("ℹ️ No industrial safety objects detected. This model only detects: OxygenTank, NitrogenTank, FirstAidBox, FireAlarm, SafetySwitchPanel, EmergencyPhone, FireExtinguisher")
-                
-        except Exception as e:
-            st.error(f"Error during detection: {str(e)}")
-            st.info("ℹ️ The application will continue to run in demo mode")
-            st.write("This might happen if the image format is not supported or if there's an issue with the model.")
+            with trace.span("read_upload"):
+                image_bytes = uploaded_file.getvalue()
+            with trace.span("probe"):
+                width, height = probe_size(image_bytes)
+            # Small objects vanish when large photos are downscaled, so tile those by default
+            tiled = st.checkbox("🧩 Tiled inference (better for small objects in high-resolution photos)",
+                                value=width * height > TILING_MIN_PIXELS)
+            with trace.span("ingest"):
+                # Tiling needs every pixel; otherwise JPEGs are decoded straight at a reduced scale
+                ingested = ingest_image(image_bytes, model_side=None if tiled else INGEST_MODEL_SIDE)
+        except ValueError as e:
+            st.error(f"Error reading image: {e}")
+
+        if ingested is not None:
+            # Display uploaded image
+            with trace.span("display_upload"):
+                st.image(ingested.preview, caption=f"Uploaded Image ({ingested.width}×{ingested.height})",
+                         use_container_width=True)
+
+            with trace.span("wait_for_model"):
+                model = load_yolo_model(wait=True)
+
+        if ingested is None:
+            st.info("ℹ️ Please upload a valid JPG or PNG image.")
+        elif model is None:
+            st.warning("❌ No model available for object detection. Running in demo mode.")
+            st.info("In a deployed environment, make sure the model files are included in the deployment package.")
+        else:
+            image_bgr = ingested.model_input
+            adaptive = adaptive_enabled() and not tiled
+            st.write("🔍 Detecting objects...")
+            try:
+                # Reuse results for identical image bytes, weights and settings
+                with trace.span("cache_lookup"):
+                    cache = get_result_cache()
+                    cache_key = cache.make_key(ingested.content_hash, model_digest(model), 0.4,
+                                               imgsz="tiled" if tiled else "adaptive" if adaptive else None)
+                    detections = cache.get(cache_key)
+                if detections is None:
+                    # Runs on a detection slot; no st.* calls in here, it is not on the script thread
+                    def detect():
+                        decision = None
+                        if tiled:
+                            detections = tiled_detect(model, image_bgr, conf=0.4)
+                        elif adaptive:
+                            from utils.worker_pool import get_worker_pool
+                            worker_pool = None if trace.profiling else get_worker_pool(get_model_registry().model_path)
+                            if worker_pool is not None:
+                                detections = worker_pool.submit(image_bgr, conf=0.4, adaptive=True)
+                            else:
+                                # Low-res pass first, escalating to full resolution or tiles only when needed
+                                from utils.batching import get_batcher
+                                predict = None if trace.profiling else (
+                                    lambda imgs, c, size: get_batcher().submit_many(model, imgs, conf=c, imgsz=size))
+                                [(detections, decision)] = adaptive_detect(model, [image_bgr], conf=0.4, predict=predict)
+                        else:
+                            if trace.profiling:
+                                # cProfile only sees this thread, so skip the shared batcher while profiling
+                                result = model.predict(source=image_bgr, conf=0.4, device=DEFAULT_DEVICE, verbose=False)[0]
+                            else:
+                                from utils.worker_pool import get_worker_pool
+                                result = None
+                                worker_pool = get_worker_pool(get_model_registry().model_path)
+                                if worker_pool is not None:
+                                    # Run in a worker process, off this server's GIL
+                                    detections = worker_pool.submit(image_bgr, conf=0.4)
+                                else:
+                                    # Queue through the shared batcher so concurrent sessions share forward passes
+                                    from utils.batching import get_batcher
+                                    result = get_batcher().submit(model, image_bgr, conf=0.4)
+                            if result is not None:
+                                trace.add_ultralytics_speed(result)
+                                detections = result_to_detections(result, model.names)
+                        # Boxes are cached and shown in the coordinates of the original upload
+                        return ingested.to_original(detections), decision
+
+                    try:
+                        with st.spinner('Processing image...'), trace.span("predict"):
+                            # Sessions share a bounded number of detection slots; bursts queue or are turned away.
+                            # A profiled detection is profiled on the slot's thread too.
+                            detections, decision = get_admission().run(session_client_id(), trace.profiled(detect))
+                    except Rejected as e:
+                        detections = None
+                        st.warning(f"⏳ The detector is busy right now ({e.reason}). Please try again in {e.retry_after} s.")
+                    else:
+                        cache.put(cache_key, detections)
+                        if decision:
+                            st.caption(f"Adaptive resolution: {decision} pass")
+
+                if detections is not None:
+                    with trace.span("render"):
+                        # Annotate a copy of the display rendition, not the full-size image
+                        annotated = draw_detections(ingested.display, ingested.to_display(detections))
+                        result_preview, _ = encode_preview(annotated)
+
+                    # Display detection result
+                    with trace.span("display_result"):
+                        st.image(result_preview, caption="Detection Result", use_container_width=True)
+
+                    # Show detection details
+                    if detections:
+                        st.success(f"✅ Detected {len(detections)} objects")
 
-    # Clean up the temporary file
-    os.unlink(temp_file.name)
+                        # Show details of detected objects as a single table
+                        with trace.span("display_table"):
+                            st.dataframe(detections_to_table(detections), use_container_width=True)
+                    else:
+                        st.info("ℹ️ No industrial safety objects detected. This model only detects: OxygenTank, NitrogenTank, FirstAidBox, FireAlarm, SafetySwitchPanel, EmergencyPhone, FireExtinguisher")
+
+                    # Results are kept only on request, once the site is filled in, so reruns and
+                    # half-typed sites never end up in the history
+                    store = get_detection_store()
+                    if store is not None:
+                        site = st.text_input("📍 Site", value=DEFAULT_SITE,
+                                             help="Stored with the results for historical queries")
+                        site = site.strip() or DEFAULT_SITE
+                        saved_key = (ingested.content_hash, model_digest(model))
+                        if st.button("💾 Save to detection history"):
+                            with trace.span("store"):
+                                store.record(ingested.content_hash, detections, model_digest(model), site=site,
+                                             source=uploaded_file.name, width=ingested.width, height=ingested.height)
+                            st.session_state["saved_detection"] = (saved_key, site)
+                        if st.session_state.get("saved_detection", (None, None))[0] == saved_key:
+                            st.caption(f"💾 Saved to the detection history for site "
+                                       f"'{st.session_state['saved_detection'][1]}'")
+
+            except Exception as e:
+                st.error(f"Error during detection: {str(e)}")
+                st.info("ℹ️ The application will continue to run in demo mode")
+                st.write("This might happen if the image format is not supported or if there's an issue with the model.")
+    finally:
+        # Always close the trace: a widget change or stop mid-detection must not leave cProfile running
+        trace.finish(file=uploaded_file.name)
+    with st.expander(f"⏱️ Timings (request {trace.request_id})"):
+        st.write(f"Total: {trace.total_ms:.1f} ms")
+        st.dataframe(trace.spans, use_container_width=True)
+        if trace.profile_summary:
+            st.caption(f"cProfile stats saved to {trace.profile_path}")
+            st.code(trace.profile_summary)
 
 st.markdown("---")
 st.subheader("📊 Model Summary")
@@ -206,4 +406,11 @@ st.json({
     "mAP@0.5:0.95": 0.7151
 })
 
+with st.expander("🩺 Startup diagnostics"):
+    st.write(f"This page rendered in {(time.perf_counter() - _script_start) * 1000:.0f} ms; model state: {registry.state}")
+    if st.button("Profile import times"):
+        from utils.import_profile import profile_imports
+        with st.spinner("Importing modules in a fresh interpreter with -X importtime..."):
+            st.dataframe(profile_imports(), use_container_width=True)
+
 st.caption("Built by Sagar | CodeAlchemy Hackathon 2025")
\ No newline at end of file
@@ -1,40 +1,89 @@
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import json
+import os
+import sys
 import threading
 import time
 
+from utils.metrics import REGISTRY
+from utils.model_registry import get_model_registry
+
+HEALTH_HOST = os.environ.get("HEALTH_HOST", "0.0.0.0")
+HEALTH_PORT = int(os.environ.get("HEALTH_PORT", 8081))
+
 class HealthCheckHandler(BaseHTTPRequestHandler):
     def do_GET(self):
-        if self.path == '/healthz':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            
-            health_data = {
+        path = self.path.split('?', 1)[0]
+        if path in ('/healthz', '/livez'):
+            # Liveness: the process is up and serving requests
+            self.send_json(200, {
                 "status": "healthy",
                 "timestamp": time.time(),
                 "service": "SSOD Detection App"
+            })
+        elif path == '/readyz':
+            # Readiness: only route traffic here once the model is loaded and warmed up
+            registry = get_model_registry()
+            # A worker pool only exists if its module was imported; don't import numpy here just to ask
+            worker_pool = sys.modules.get("utils.worker_pool")
+            admission = sys.modules.get("utils.admission")
+            admission = admission.admission_stats() if admission is not None else None
+            # A full admission queue means new work would be rejected; let the load balancer go elsewhere
+            ready = (registry.ready and (worker_pool is None or worker_pool.pool_ready())
+                     and not (admission and admission["saturated"]))
+            body = {
+                "status": "ready" if ready else "not ready",
+                "model_state": registry.state,
+                "model_path": registry.model_path,
+                "timestamp": time.time()
             }
-            
-            self.wsgi_write(json.dumps(health_data))
+            if admission is not None:
+                body["admission"] = admission
+            if registry.error:
+                body["error"] = str(registry.error)
+            self.send_json(200 if ready else 503, body)
+        elif path == '/metrics':
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.end_headers()
+            self.wsgi_write(REGISTRY.render())
         else:
             self.send_response(404)
             self.end_headers()
-    
+
+    def send_json(self, status, payload):
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wsgi_write(json.dumps(payload))
+
     def wsgi_write(self, content):
         self.wfile.write(content.encode('utf-8'))
 
-def start_health_check_server(port=8081):
-    """Start a simple health check server on a separate thread"""
-    try:
-        server = HTTPServer(('localhost', port), HealthCheckHandler)
-        thread = threading.Thread(target=server.serve_forever, daemon=True)
-        thread.start()
-        print(f"Health check server started on port {port}")
-        return server
-    except Exception as e:
-        print(f"Failed to start health check server: {e}")
-        return None
+    def log_message(self, format, *args):
+        # Probes and scrapes hit these endpoints constantly; keep them out of the logs
+        pass
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_health_check_server(port=HEALTH_PORT, host=HEALTH_HOST):
+    """Start the health, readiness and metrics server on a separate thread, once per process"""
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return _server
+        try:
+            server = ThreadingHTTPServer((host, port), HealthCheckHandler)
+            server.daemon_threads = True
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            print(f"Health check server started on {host}:{port}")
+            _server = server
+            return server
+        except Exception as e:
+            print(f"Failed to start health check server: {e}")
+            return None
 
 if __name__ == "__main__":
     server = start_health_check_server()
@@ -43,4 +92,4 @@ if __name__ == "__main__":
             while True:
                 time.sleep(1)
         except KeyboardInterrupt:
-            server.shutdown()
\ No newline at end of file
+            server.shutdown()
@@ -0,0 +1,427 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import base64
+import json
+import os
+import threading
+import time
+
+from utils.adaptive import adaptive_detect, adaptive_enabled
+from utils.admission import REQUEST_DEADLINE_MS, Rejected, admission_stats, get_admission
+from utils.artifact_fetch import ARTIFACT_CACHE_DIR
+from utils.batching import get_batcher
+from utils.detection_store import DEFAULT_SITE, get_detection_store
+from utils.detection import DEFAULT_CONF, DEFAULT_DEVICE, decode_image_array, result_to_detections
+from utils.metrics import REGISTRY
+from utils.model_registry import get_model_registry
+from utils.model_router import PRIMARY, VARIANT_HEADER, get_model_router
+from utils.near_duplicate import get_near_duplicate_cache
+from utils.result_cache import content_hash, get_result_cache, model_digest
+from utils.tiling import tiled_detect
+from utils.tracing import RequestTrace
+from utils.worker_pool import get_worker_pool, pool_ready
+
+# Upper bound on images accepted by a single /detect/batch request
+MAX_BATCH_IMAGES = 64
+# Largest request body read into memory, in MB
+MAX_BODY_MB = float(os.environ.get("MAX_BODY_MB", 64))
+
+
+class BadImage(ValueError):
+    """An uploaded image could not be decoded (answered with 400)"""
+
+
+class BadBody(ValueError):
+    """The request body can't be read: a bad Content-Length (400) or one over MAX_BODY_MB (413)"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def resolve_model_path():
+    """Pick the weights to serve: MODEL_PATH, the downloaded weights, then any run"""
+    env_path = os.environ.get("MODEL_PATH")
+    if env_path and os.path.exists(env_path):
+        return env_path
+    downloaded = os.path.join(ARTIFACT_CACHE_DIR, "best.pt")
+    if os.path.exists(downloaded):
+        return downloaded
+    from model_locator import find_model_file
+    return find_model_file(".")
+
+
+def get_model():
+    """Return the process-wide model, loading and warming it up on first use"""
+    registry = get_model_registry()
+    model = registry.get()
+    if model is None:
+        model_path = resolve_model_path()
+        if not model_path:
+            raise FileNotFoundError("No model (.pt) file found. Please add your trained weights.")
+        model = registry.load(model_path)
+    return model
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path in ('/healthz', '/livez'):
+            self.send_json(200, {
+                "status": "healthy",
+                "timestamp": time.time(),
+                "service": "SSOD Inference API",
+                "model_loaded": get_model_registry().ready
+            })
+        elif path == '/readyz':
+            registry = get_model_registry()
+            admission = admission_stats()
+            # A full admission queue means new work would be rejected; let the load balancer go elsewhere
+            ready = registry.ready and pool_ready() and not (admission and admission["saturated"])
+            self.send_json(200 if ready else 503, {
+                "status": "ready" if ready else "not ready",
+                "model_state": registry.state,
+                "admission": admission
+            })
+        elif path.startswith('/store/'):
+            self.handle_store_query(path, parse_qs(urlparse(self.path).query))
+        elif path == '/models':
+            # Which models are resident, how traffic is split and how each one is doing
+            self.send_json(200, get_model_router().stats())
+        elif path == '/metrics':
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        try:
+            conf = float(query.get("conf", [DEFAULT_CONF])[0])
+        except ValueError:
+            self.send_json(400, {"error": "conf must be a number"})
+            return
+        # ?tiled=1 runs sliced inference for high-resolution images
+        self.tiled = query.get("tiled", ["0"])[0].lower() in ("1", "true", "yes")
+        # ?site= tags the stored results with the site the images came from; results are
+        # only kept in the detection store when a site or source is given
+        self.site = query.get("site", [None])[0]
+        # ?source= (or X-Source-ID) names a camera or stream so near-duplicate frames can skip inference
+        self.source = query.get("source", [None])[0] or self.headers.get("X-Source-ID")
+        # ?profile=1 runs this one request under cProfile; X-Request-ID is propagated into the trace
+        profile = query.get("profile", ["0"])[0].lower() in ("1", "true", "yes")
+        self.trace = RequestTrace(url.path, request_id=self.headers.get("X-Request-ID"), profile=profile or None)
+        self.trace_fields = {}
+
+        try:
+            if url.path == '/detect':
+                self.handle_detect(conf)
+            elif url.path == '/detect/batch':
+                self.handle_detect_batch(conf)
+            else:
+                self.send_json(404, {"error": "not found"})
+        except BadBody as e:
+            # The body was left unread, so don't try to reuse the connection
+            self.close_connection = True
+            self.send_json(e.status, {"error": str(e)})
+        finally:
+            # Always close the trace so a failed request still logs and releases the profiler
+            record = self.trace.finish(**self.trace_fields)
+            if "profile" in record:
+                print(f"[Inference API] Profile for request {self.trace.request_id} written to {record['profile']}")
+
+    def handle_store_query(self, path, query):
+        """GET /store/detections, /store/counts and /store/missing - historical queries over stored results"""
+        store = get_detection_store()
+        if store is None:
+            self.send_json(404, {"error": "the detection store is disabled"})
+            return
+
+        def first(name):
+            return query.get(name, [None])[0]
+
+        try:
+            filters = {"start": first("start"), "end": first("end"), "sites": query.get("site"),
+                       "min_conf": float(first("min_conf")) if first("min_conf") else None}
+            if path == '/store/detections':
+                rows = store.detections(classes=query.get("class"), image_hash=first("image_hash"),
+                                        limit=int(first("limit") or 1000), **filters)
+            elif path == '/store/counts':
+                by = tuple((first("by") or "site,class_name").split(","))
+                rows = store.counts(classes=query.get("class"), by=by, **filters)
+            elif path == '/store/missing':
+                if not first("class"):
+                    self.send_json(400, {"error": "class is required"})
+                    return
+                rows = store.sites_without(first("class"), **filters)
+            else:
+                self.send_json(404, {"error": "not found"})
+                return
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        self.send_json(200, {"results": rows, "count": len(rows)})
+
+    def handle_detect(self, conf):
+        """POST /detect - the request body is the raw image file"""
+        with self.trace.span("read_body"):
+            body = self.read_body()
+        if not body:
+            self.send_json(400, {"error": "empty request body"})
+            return
+        self.respond_with_detections([body], conf, single=True)
+
+    def handle_detect_batch(self, conf):
+        """POST /detect/batch - body is {"images": [<base64 image>, ...]}"""
+        with self.trace.span("read_body"):
+            body = self.read_body()
+        try:
+            payload = json.loads(body or b"{}")
+            encoded_images = payload["images"]
+        except (ValueError, KeyError, TypeError):
+            self.send_json(400, {"error": "expected a JSON body with an 'images' list"})
+            return
+        if not isinstance(encoded_images, list) or not encoded_images:
+            self.send_json(400, {"error": "'images' must be a non-empty list"})
+            return
+        if len(encoded_images) > MAX_BATCH_IMAGES:
+            self.send_json(413, {"error": f"at most {MAX_BATCH_IMAGES} images per batch"})
+            return
+
+        blobs = []
+        with self.trace.span("base64_decode"):
+            for index, encoded in enumerate(encoded_images):
+                try:
+                    blobs.append(base64.b64decode(encoded, validate=True))
+                except Exception as e:
+                    self.send_json(400, {"error": f"could not decode image {index}: {e}"})
+                    return
+        self.respond_with_detections(blobs, conf, single=False)
+
+    def respond_with_detections(self, blobs, conf, single):
+        trace = self.trace
+        router = get_model_router()
+        variant, ensemble = PRIMARY, False
+        if router.enabled:
+            # A variant named in the header pins the request to that model, in either mode
+            requested = self.headers.get(VARIANT_HEADER)
+            ensemble = router.mode == "ensemble" and requested not in router.names and not self.tiled
+            if not ensemble:
+                variant = router.route(trace.request_id, requested)
+        try:
+            model = get_model()
+            if variant != PRIMARY:
+                model = router.model(variant)
+        except Exception as e:
+            self.send_json(503, {"error": f"model unavailable: {e}"})
+            return
+
+        start = time.perf_counter()
+        with trace.span("cache_lookup"):
+            cache = get_result_cache()
+            digest = router.ensemble_digest(model_digest) if ensemble else model_digest(model)
+            adaptive = adaptive_enabled() and not self.tiled and not ensemble
+            # Results from different inference paths can differ, so they are cached separately
+            imgsz = "tiled" if self.tiled else "adaptive" if adaptive else None
+            keys = [cache.make_key(content_hash(blob), digest, conf, imgsz) for blob in blobs]
+            detections = [cache.get(key) for key in keys]
+
+        # Only decode and run the images that missed the cache
+        missing = [i for i, d in enumerate(detections) if d is None]
+
+        sizes = {}
+        reused_indexes = set()
+
+        def detect_missing():
+            images = []
+            with trace.span("decode"):
+                for index in missing:
+                    try:
+                        images.append(decode_image_array(blobs[index]))
+                    except ValueError as e:
+                        raise BadImage(f"could not decode image {index}: {e}")
+                    sizes[index] = images[-1].shape[1], images[-1].shape[0]
+
+            def run(images):
+                # Profiled requests stay in-process so cProfile can see the forward pass
+                worker_pool = None
+                if not trace.profiling and variant == PRIMARY and not ensemble:
+                    worker_pool = get_worker_pool(get_model_registry().model_path)
+                predict_start = time.perf_counter()
+                if self.tiled:
+                    # Tiles of each image are already batched inside tiled_detect
+                    with trace.span("predict"):
+                        computed = [tiled_detect(model, image, conf=conf) for image in images]
+                elif images and ensemble:
+                    with trace.span("predict"):
+                        # Shared decode and letterbox, models run side by side, boxes fused
+                        computed = router.ensemble_detect(images, conf=conf)
+                elif images and worker_pool is not None:
+                    with trace.span("predict"):
+                        # Worker processes hand back finished detections
+                        # Bounded by what is left of the request's deadline, in case a worker is wedged
+                        remaining = (self.deadline_ms() or REQUEST_DEADLINE_MS) / 1000 - (time.perf_counter() - start)
+                        computed = worker_pool.submit_many(images, conf=conf, adaptive=adaptive,
+                                                           timeout=max(remaining, 0))
+                elif images and adaptive:
+                    with trace.span("predict"):
+                        # Low-res pass first; only uncertain or small-object images pay for more
+                        predict = None if trace.profiling else (
+                            lambda imgs, c, size: get_batcher().submit_many(model, imgs, conf=c, imgsz=size))
+                        outputs = adaptive_detect(model, images, conf=conf, predict=predict)
+                    computed = [image_detections for image_detections, _ in outputs]
+                    self.trace_fields["adaptive"] = [decision for _, decision in outputs]
+                elif images:
+                    with trace.span("predict"):
+                        if trace.profiling:
+                            # cProfile only sees this thread, so skip the shared batcher while profiling
+                            results = model.predict(source=images, conf=conf, device=DEFAULT_DEVICE, verbose=False)
+                        else:
+                            # Concurrent requests are coalesced into shared forward passes
+                            results = get_batcher().submit_many(model, images, conf=conf)
+                    for result in results:
+                        trace.add_ultralytics_speed(result)
+                    with trace.span("postprocess"):
+                        computed = [result_to_detections(result, model.names) for result in results]
+                else:
+                    computed = []
+                if router.enabled and images and not ensemble:
+                    router.record(variant, time.perf_counter() - predict_start, len(images))
+                return computed
+
+            # Frames from a known source that barely changed reuse the detections of a recent frame
+            near_duplicates = get_near_duplicate_cache() if self.source else None
+            if near_duplicates is None or not images:
+                return run(images)
+            computed, reused = near_duplicates.detect(self.source, (digest, conf, imgsz), images, run)
+            reused_indexes.update(missing[i] for i in reused)
+            self.trace_fields["near_duplicates"] = len(reused)
+            return computed
+
+        try:
+            if not missing:
+                computed = []
+            else:
+                # At most ADMISSION_CONCURRENCY detections run at once; the rest queue or are turned away.
+                # Profiled requests are admitted like any other and profiled on the slot's thread.
+                computed = get_admission().run(self.client_id(), trace.profiled(detect_missing), self.deadline_ms())
+            for index, image_detections in zip(missing, computed):
+                detections[index] = image_detections
+                # Reused detections are an approximation, so only real inference results are cached by content
+                if index not in reused_indexes:
+                    cache.put(keys[index], image_detections)
+        except Rejected as e:
+            self.send_json(e.status, {"error": f"server busy ({e.reason}), retry later", "retry_after": e.retry_after},
+                           headers={"Retry-After": str(e.retry_after)})
+            return
+        except BadImage as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        except TimeoutError as e:
+            self.send_json(503, {"error": f"detection timed out: {e}"})
+            return
+        except Exception as e:
+            self.send_json(500, {"error": f"error during detection: {e}"})
+            return
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+
+        per_image = [{"count": len(d), "detections": d} for d in detections]
+        if single:
+            payload = dict(per_image[0], inference_ms=elapsed_ms)
+        else:
+            payload = {"results": per_image, "inference_ms": elapsed_ms}
+        payload["request_id"] = trace.request_id
+        if router.enabled:
+            payload["model"] = self.trace_fields["model"] = "ensemble" if ensemble else variant
+        payload["timings"] = trace.timings()
+        self.trace_fields.update(images=len(blobs), cache_misses=len(missing))
+        with trace.span("respond"):
+            self.send_json(200, payload)
+
+        if self.site or self.source:
+            # After responding, so the client never waits on the store
+            self.store_detections([{
+                "image_hash": key[0], "detections": image_detections, "model": digest,
+                "site": self.site or DEFAULT_SITE, "source": self.source,
+                "width": sizes.get(index, (None, None))[0], "height": sizes.get(index, (None, None))[1],
+            } for index, (key, image_detections) in enumerate(zip(keys, detections))])
+
+    def store_detections(self, records):
+        """Keep results for historical queries, whether they were computed or cached"""
+        store = get_detection_store()
+        if store is None:
+            return
+        try:
+            with self.trace.span("store"):
+                store.record_many(records)
+        except Exception as e:
+            # The detections were already delivered; a locked or full store only loses history
+            print(f"[Inference API] Could not store detections for request {self.trace.request_id}: {e}")
+
+    def read_body(self):
+        """Read the request body, refusing anything over MAX_BODY_MB before buffering it"""
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            raise BadBody(400, "Content-Length must be a number")
+        if length > MAX_BODY_MB * (1 << 20):
+            raise BadBody(413, f"request body is larger than {MAX_BODY_MB:g} MB")
+        return self.rfile.read(length) if length > 0 else b""
+
+    def client_id(self):
+        """Who a request counts against for per-client limits: X-Client-ID, else the peer address"""
+        return self.headers.get("X-Client-ID") or self.client_address[0]
+
+    def deadline_ms(self):
+        """The request's time budget from X-Deadline-Ms, or None for the server default"""
+        try:
+            return float(self.headers.get("X-Deadline-Ms"))
+        except (TypeError, ValueError):
+            return None
+
+    def send_json(self, status, data, headers=None):
+        if getattr(self, 'trace_fields', None) is not None:
+            self.trace_fields["status"] = status
+        content = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        if getattr(self, 'trace', None) is not None:
+            self.send_header('X-Request-ID', self.trace.request_id)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def start_inference_server(port=8082, host='0.0.0.0'):
+    """Start the inference API server on a separate thread"""
+    try:
+        server = ThreadingHTTPServer((host, port), InferenceHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        print(f"Inference API server started on port {port}")
+        return server
+    except Exception as e:
+        print(f"Failed to start inference API server: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    # Load the model (and start any worker processes) up front so the first request doesn't pay for it
+    get_model()
+    get_worker_pool(get_model_registry().model_path)
+    if get_model_router().enabled:
+        get_model_router().load()
+    server = start_inference_server(int(os.environ.get("INFERENCE_PORT", 8082)))
+    if server:
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            server.shutdown()
@@ -1,4 +1,265 @@
+import csv
+import hashlib
 import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Where the model catalog lives and how often it rescans the tree
+MODEL_INDEX_DB = os.environ.get("MODEL_INDEX_DB")
+MODEL_INDEX_TTL = float(os.environ.get("MODEL_INDEX_TTL", 30))
+# Hash every weights file while indexing (otherwise hashes are computed on demand)
+MODEL_INDEX_HASH = os.environ.get("MODEL_INDEX_HASH", "0") == "1"
+
+# Column names ultralytics writes to each run's results.csv
+RESULT_COLUMNS = {
+    "precision": "metrics/precision(B)",
+    "recall": "metrics/recall(B)",
+    "map50": "metrics/mAP50(B)",
+    "map50_95": "metrics/mAP50-95(B)",
+}
+METRICS = tuple(RESULT_COLUMNS)
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS models (
+        path TEXT PRIMARY KEY, mtime REAL NOT NULL, size INTEGER NOT NULL, sha256 TEXT,
+        precision REAL, recall REAL, map50 REAL, map50_95 REAL, metrics_mtime REAL
+    );
+    CREATE INDEX IF NOT EXISTS models_mtime ON models (mtime);
+    CREATE INDEX IF NOT EXISTS models_map50 ON models (map50);
+    CREATE INDEX IF NOT EXISTS models_map50_95 ON models (map50_95);
+    CREATE TABLE IF NOT EXISTS dirs (
+        path TEXT PRIMARY KEY, mtime REAL NOT NULL, subdirs TEXT NOT NULL, weights TEXT NOT NULL
+    );
+"""
+
+
+def _sha256(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def parse_run_metrics(weights_path):
+    """
+    Read metrics for a weights file from its run's results.csv
+    (runs/detect/<run>/weights/best.pt -> runs/detect/<run>/results.csv).
+    best.pt gets the epoch with the best fitness, other files the last epoch.
+    """
+    run_dir = os.path.dirname(os.path.dirname(os.path.abspath(weights_path)))
+    results_path = os.path.join(run_dir, "results.csv")
+    if not os.path.exists(results_path):
+        return {}
+    try:
+        with open(results_path, newline="") as f:
+            rows = [{k.strip(): v.strip() for k, v in row.items() if k} for row in csv.DictReader(f)]
+    except (OSError, csv.Error):
+        return {}
+
+    parsed = []
+    for row in rows:
+        try:
+            parsed.append({name: float(row[column]) for name, column in RESULT_COLUMNS.items()})
+        except (KeyError, ValueError):
+            continue
+    if not parsed:
+        return {}
+    if os.path.basename(weights_path) == "best.pt":
+        # Same fitness ultralytics uses to pick best.pt
+        return max(parsed, key=lambda m: 0.1 * m["map50"] + 0.9 * m["map50_95"])
+    return parsed[-1]
+
+
+class ModelIndex:
+    """
+    Persistent SQLite catalog of .pt files under a base path.
+
+    Each entry records path, mtime, size, content hash and the metrics of
+    its run. refresh() is incremental: a directory whose mtime hasn't
+    changed is not re-listed (its stored subdirectories are reused), and
+    only .pt files whose size or mtime changed are re-read. Lookups such
+    as newest() or best("map50") are plain indexed queries.
+
+    If the catalog can't be opened or written where it is configured
+    (e.g. a read-only container filesystem), it moves to the temp
+    directory, and failing that into memory.
+    """
+
+    def __init__(self, base_path=".", db_path=None, ttl=MODEL_INDEX_TTL):
+        self.base_path = os.path.abspath(base_path)
+        db_path = db_path or MODEL_INDEX_DB or os.path.join(self.base_path, ".model_index.sqlite")
+        self.ttl = ttl
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        tag = hashlib.sha256(self.base_path.encode()).hexdigest()[:12]
+        self._locations = [db_path, os.path.join(tempfile.gettempdir(), f"ssod-model-index-{tag}.sqlite"), ":memory:"]
+        self._db = None
+        self._open_next()
+
+    def _open_next(self, error=None):
+        """Open the catalog at the next usable location, dropping the current one"""
+        if self._db is not None:
+            print(f"[Model Index] Cannot use {self._locations.pop(0)} ({error}); falling back to {self._locations[0]}")
+            self._db.close()
+        while True:
+            try:
+                self._db = sqlite3.connect(self._locations[0], check_same_thread=False)
+                self._db.executescript(_SCHEMA)
+                self._db.commit()
+                return
+            except sqlite3.OperationalError as e:
+                # An in-memory catalog always opens, so this ends
+                print(f"[Model Index] Cannot use {self._locations.pop(0)} ({e}); falling back to {self._locations[0]}")
+
+    def refresh(self, force=False):
+        """Bring the index up to date with the filesystem (at most once per ttl seconds)"""
+        with self._lock:
+            if not force and time.time() - self._last_refresh < self.ttl:
+                return
+            try:
+                self._rescan()
+            except sqlite3.OperationalError as e:
+                # A read-only catalog may open fine and only fail on the first write
+                self._open_next(e)
+                self._rescan()
+            self._last_refresh = time.time()
+
+    def _rescan(self):
+        seen = set()
+        self._scan_dir(self.base_path, seen)
+        known = {row[0] for row in self._db.execute("SELECT path FROM models")}
+        for stale in known - seen:
+            self._db.execute("DELETE FROM models WHERE path = ?", (stale,))
+        self._db.commit()
+
+    def _scan_dir(self, path, seen):
+        try:
+            dir_mtime = os.stat(path).st_mtime
+        except OSError:
+            return
+        row = self._db.execute("SELECT mtime, subdirs, weights FROM dirs WHERE path = ?", (path,)).fetchone()
+
+        if row is not None and row[0] == dir_mtime:
+            # Unchanged directory: reuse its stored listing instead of reading it again
+            subdirs = [name for name in row[1].split("\n") if name]
+            weights = [os.path.join(path, name) for name in row[2].split("\n") if name]
+        else:
+            subdirs, weights = [], []
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not entry.name.startswith(".") and entry.name != "__pycache__":
+                                subdirs.append(entry.name)
+                        elif entry.name.endswith(".pt"):
+                            weights.append(entry.path)
+            except OSError:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO dirs (path, mtime, subdirs, weights) VALUES (?, ?, ?, ?)",
+                (path, dir_mtime, "\n".join(subdirs), "\n".join(os.path.basename(w) for w in weights))
+            )
+
+        for weights_path in weights:
+            self._index_file(weights_path)
+            seen.add(weights_path)
+        for name in subdirs:
+            self._scan_dir(os.path.join(path, name), seen)
+
+    def _index_file(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        results_path = os.path.join(os.path.dirname(os.path.dirname(path)), "results.csv")
+        metrics_mtime = os.path.getmtime(results_path) if os.path.exists(results_path) else None
+
+        row = self._db.execute(
+            "SELECT mtime, size, metrics_mtime, sha256 FROM models WHERE path = ?", (path,)
+        ).fetchone()
+        file_unchanged = row is not None and row[0] == stat.st_mtime and row[1] == stat.st_size
+        if file_unchanged and row[2] == metrics_mtime and (row[3] or not MODEL_INDEX_HASH):
+            return
+
+        sha256 = row[3] if file_unchanged else None
+        if sha256 is None and MODEL_INDEX_HASH:
+            sha256 = _sha256(path)
+        metrics = parse_run_metrics(path)
+        self._db.execute(
+            "INSERT OR REPLACE INTO models "
+            "(path, mtime, size, sha256, precision, recall, map50, map50_95, metrics_mtime) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, stat.st_mtime, stat.st_size, sha256,
+             metrics.get("precision"), metrics.get("recall"), metrics.get("map50"), metrics.get("map50_95"),
+             metrics_mtime)
+        )
+
+    def _row_to_entry(self, row):
+        if row is None:
+            return None
+        keys = ("path", "mtime", "size", "sha256") + METRICS
+        return dict(zip(keys, row))
+
+    def newest(self):
+        """Most recently modified weights file, or None"""
+        self.refresh()
+        return self._row_to_entry(self._db.execute(
+            "SELECT path, mtime, size, sha256, precision, recall, map50, map50_95 "
+            "FROM models ORDER BY mtime DESC LIMIT 1"
+        ).fetchone())
+
+    def best(self, metric="map50"):
+        """Weights file with the highest value of a run metric, or None"""
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+        self.refresh()
+        return self._row_to_entry(self._db.execute(
+            f"SELECT path, mtime, size, sha256, precision, recall, map50, map50_95 "
+            f"FROM models WHERE {metric} IS NOT NULL ORDER BY {metric} DESC, mtime DESC LIMIT 1"
+        ).fetchone())
+
+    def entries(self):
+        """Every indexed weights file, newest first"""
+        self.refresh()
+        return [self._row_to_entry(row) for row in self._db.execute(
+            "SELECT path, mtime, size, sha256, precision, recall, map50, map50_95 FROM models ORDER BY mtime DESC"
+        )]
+
+    def content_hash(self, path):
+        """SHA-256 of an indexed file, computed once and stored in the catalog"""
+        path = os.path.abspath(path)
+        self.refresh()
+        with self._lock:
+            row = self._db.execute("SELECT sha256 FROM models WHERE path = ?", (path,)).fetchone()
+            if row is None:
+                return None
+            if row[0] is None:
+                sha256 = _sha256(path)
+                try:
+                    self._db.execute("UPDATE models SET sha256 = ? WHERE path = ?", (sha256, path))
+                    self._db.commit()
+                except sqlite3.OperationalError as e:
+                    self._open_next(e)
+                    self._last_refresh = 0.0
+                return sha256
+            return row[0]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_model_index(base_path="."):
+    """Return the process-wide ModelIndex for a base path"""
+    key = os.path.abspath(base_path)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = ModelIndex(base_path)
+        return _indexes[key]
+
 
 def find_model_file(base_path="."):
     """
@@ -19,18 +280,10 @@ def find_model_file(base_path="."):
             print(f"Found priority model at: {model_path}")
             return model_path
     
-    # If no priority models found, search for any .pt file
-    model_files = []
-    for root, dirs, files in os.walk(base_path):
-        for file in files:
-            if file.endswith(".pt"):
-                full_path = os.path.join(root, file)
-                model_files.append((full_path, os.path.getmtime(full_path)))
-    
-    # Sort by modification time (newest first)
-    if model_files:
-        model_files.sort(key=lambda x: x[1], reverse=True)
-        return model_files[0][0]  # Return path of newest model
+    # If no priority models found, ask the index for the newest .pt file
+    newest = get_model_index(base_path).newest()
+    if newest:
+        return newest["path"]
     
     return None
 
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Container entrypoint for the Streamlit app.
+
+Streamlit only executes app.py when a browser session connects, so the
+health server and the model load are started here first, in the same
+process. /livez and /readyz answer from boot and the weights are warm
+before the first visitor arrives. Arguments are passed on to
+`streamlit run app.py`.
+"""
+import os
+import sys
+
+from health_check import start_health_check_server
+from utils.artifact_fetch import fetch_model_weights
+from utils.model_registry import get_model_registry
+
+
+def main():
+    start_health_check_server()
+    # app.py picks up the same registry and sees the load already under way
+    get_model_registry().load_in_background(fetch_model_weights)
+
+    from streamlit.web import cli as stcli
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    sys.argv = ["streamlit", "run", app_path, *sys.argv[1:]]
+    sys.exit(stcli.main())
+
+
+if __name__ == "__main__":
+    main()
@@ -4,5 +4,5 @@
 # Install dependencies
 python3 -m pip install -r requirements.txt
 
-# Run the Streamlit app
-streamlit run app.py --server.port=8080 --server.address=0.0.0.0
+# Run the Streamlit app, with the health server and model load started up front
+python3 serve.py --server.port=8080 --server.address=0.0.0.0
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("ultralytics")
+pytest.importorskip("onnxruntime")
+
+from utils.backends import PROBE_IMGSZ, export_model, load_backend_model  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def weights(tmp_path_factory):
+    """Randomly initialised nano weights, so the test needs no download"""
+    from ultralytics import YOLO
+    path = tmp_path_factory.mktemp("weights") / "nano.pt"
+    YOLO("yolov8n.yaml").save(str(path))
+    return path
+
+
+def test_onnx_export_accepts_batches_and_smaller_inputs(weights):
+    export_model(weights, "onnx")
+    model = load_backend_model(weights, "onnx")
+    # Served by ONNX Runtime, not the PyTorch fallback
+    assert not model.predictor.model.pt
+
+    frames = [np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(2)]
+    results = model.predict(source=frames, imgsz=PROBE_IMGSZ, conf=0.25, verbose=False)
+
+    assert len(results) == 2
+    assert all(result.orig_shape == (480, 640) for result in results)
@@ -0,0 +1,9 @@
+from utils.model_router import parse_variants
+
+
+def test_parse_variants_with_and_without_percentages():
+    assert parse_variants("a=x.pt:10,b=y.pt") == [("a", "x.pt", 10.0), ("b", "y.pt", 0.0)]
+
+
+def test_parse_variants_keeps_colons_inside_paths():
+    assert parse_variants("c=C:/w/best.pt") == [("c", "C:/w/best.pt", 0.0)]
@@ -0,0 +1,115 @@
+from collections import namedtuple
+import os
+
+import numpy as np
+
+from utils.detection import DEFAULT_CONF, DEFAULT_DEVICE, arrays_to_detections, result_to_arrays
+from utils.metrics import REGISTRY
+from utils.tiling import TILING_MIN_PIXELS, tiled_detect_arrays
+
+# "fixed" always runs one full-resolution pass; "adaptive" starts low-res and escalates when needed
+INFERENCE_POLICY = os.environ.get("INFERENCE_POLICY", "fixed").lower()
+
+# Adaptive policy knobs, overridable per deployment
+ADAPTIVE_LOW_IMGSZ = int(os.environ.get("ADAPTIVE_LOW_IMGSZ", 320))
+ADAPTIVE_FULL_IMGSZ = int(os.environ.get("ADAPTIVE_FULL_IMGSZ", 640))
+# Low-res detections within this distance of the conf threshold are too close to call
+ADAPTIVE_UNCERTAIN_BAND = float(os.environ.get("ADAPTIVE_UNCERTAIN_BAND", 0.15))
+# Boxes covering less than this fraction of the image are too small to trust at low resolution
+ADAPTIVE_SMALL_FRACTION = float(os.environ.get("ADAPTIVE_SMALL_FRACTION", 0.005))
+
+ADAPTIVE_DECISIONS = REGISTRY.counter(
+    "ssod_adaptive_decisions_total", "Images by the pass that produced their result and why it escalated")
+
+AdaptiveOutput = namedtuple("AdaptiveOutput", ["xyxy", "conf", "cls", "decision", "reason"])
+
+
+def adaptive_enabled():
+    return INFERENCE_POLICY == "adaptive"
+
+
+class AdaptivePolicy:
+    """
+    Decides whether the result of a low-resolution pass can be kept, or
+    which more expensive pass the image needs:
+
+    - "low":   no detection is near the threshold or small; keep the low-res result
+    - "full":  something is uncertain or small; rerun at full resolution
+    - "tiled": small objects in a high-resolution photo; run tiled inference
+    """
+
+    def __init__(self, low_imgsz=ADAPTIVE_LOW_IMGSZ, full_imgsz=ADAPTIVE_FULL_IMGSZ,
+                 uncertain_band=ADAPTIVE_UNCERTAIN_BAND, small_fraction=ADAPTIVE_SMALL_FRACTION,
+                 tile_min_pixels=TILING_MIN_PIXELS):
+        self.low_imgsz = low_imgsz
+        self.full_imgsz = full_imgsz
+        self.uncertain_band = uncertain_band
+        self.small_fraction = small_fraction
+        self.tile_min_pixels = tile_min_pixels
+
+    def prepass_conf(self, conf):
+        """Threshold for the low-res pass, low enough to see candidates just under conf"""
+        return max(0.01, conf - self.uncertain_band)
+
+    def decide(self, xyxy, scores, conf, image_shape):
+        """Return (decision, reason) for one image's low-res detections"""
+        height, width = image_shape[:2]
+        uncertain = np.abs(scores - conf) < self.uncertain_band
+        areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+        small = areas < self.small_fraction * height * width
+        if small.any():
+            return ("tiled" if height * width > self.tile_min_pixels else "full"), "small"
+        if uncertain.any():
+            return "full", "uncertain"
+        return "low", "confident"
+
+
+DEFAULT_POLICY = AdaptivePolicy()
+
+
+def _direct_predict(model):
+    def predict(images, conf, imgsz):
+        return model.predict(source=images, conf=conf, imgsz=imgsz, device=DEFAULT_DEVICE, verbose=False)
+    return predict
+
+
+def adaptive_detect_arrays(model, images, conf=DEFAULT_CONF, policy=None, predict=None):
+    """
+    Run the adaptive policy over a list of BGR images and return one
+    AdaptiveOutput per image.
+
+    All images get one batched low-res pass; those that need it are then
+    rerun together at full resolution, or tiled one by one. predict(images,
+    conf, imgsz) may be given to route passes through the shared batcher.
+    """
+    policy = policy or DEFAULT_POLICY
+    predict = predict or _direct_predict(model)
+
+    low_results = predict(images, policy.prepass_conf(conf), policy.low_imgsz)
+    outputs = [None] * len(images)
+    escalate_full = []
+    for i, (image, result) in enumerate(zip(images, low_results)):
+        xyxy, scores, classes = result_to_arrays(result)
+        decision, reason = policy.decide(xyxy, scores, conf, image.shape)
+        ADAPTIVE_DECISIONS.inc(decision=decision, reason=reason)
+        if decision == "low":
+            keep = scores >= conf
+            outputs[i] = AdaptiveOutput(xyxy[keep], scores[keep], classes[keep], decision, reason)
+        elif decision == "tiled":
+            outputs[i] = AdaptiveOutput(*tiled_detect_arrays(model, image, conf=conf), decision, reason)
+        else:
+            escalate_full.append((i, reason))
+
+    if escalate_full:
+        full_results = predict([images[i] for i, _ in escalate_full], conf, policy.full_imgsz)
+        for (i, reason), result in zip(escalate_full, full_results):
+            outputs[i] = AdaptiveOutput(*result_to_arrays(result), "full", reason)
+    return outputs
+
+
+def adaptive_detect(model, images, conf=DEFAULT_CONF, policy=None, predict=None):
+    """adaptive_detect_arrays, returning (detections, decision) per image"""
+    return [
+        (arrays_to_detections(out.xyxy, out.conf, out.cls, model.names), out.decision)
+        for out in adaptive_detect_arrays(model, images, conf, policy, predict)
+    ]
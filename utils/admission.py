@@ -0,0 +1,224 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import math
+import os
+import threading
+import time
+
+from utils.batching import DEFAULT_MAX_BATCH_SIZE
+from utils.metrics import REGISTRY
+
+# Detections allowed to run at once; enough to fill a micro-batch by default
+ADMISSION_CONCURRENCY = int(os.environ.get("ADMISSION_CONCURRENCY", DEFAULT_MAX_BATCH_SIZE))
+# Admitted requests allowed to wait for a slot; beyond this new work is turned away
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", 32))
+# Requests one client (API caller or Streamlit session) may have queued or running
+ADMISSION_PER_CLIENT = int(os.environ.get("ADMISSION_PER_CLIENT", 4))
+# Default time budget of a request; clients can send a shorter one
+REQUEST_DEADLINE_MS = float(os.environ.get("REQUEST_DEADLINE_MS", 15000))
+
+# Weight of the newest sample in the running estimate of service time
+_EWMA_ALPHA = 0.2
+
+ADMISSION_REJECTED = REGISTRY.counter(
+    "ssod_admission_rejected_total", "Detection requests turned away before inference, by reason")
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "ssod_admission_wait_seconds", "Time admitted requests waited for a detection slot")
+
+
+class Rejected(Exception):
+    """
+    Raised instead of running a request. status is the HTTP status to
+    answer with and retry_after the suggested wait in whole seconds.
+    """
+
+    def __init__(self, reason, retry_after, status=429):
+        super().__init__(f"request rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status = status
+
+
+class _Job:
+    __slots__ = ("fn", "client", "deadline", "future", "enqueued_at")
+
+    def __init__(self, fn, client, deadline, future):
+        self.fn = fn
+        self.client = client
+        self.deadline = deadline
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class AdmissionQueue:
+    """
+    Asyncio admission layer in front of the detector.
+
+    Work is queued on an event loop running in its own thread and run by
+    `concurrency` workers on a thread pool, so at most that many
+    detections (and their decoded images) are in memory at once. A request
+    is rejected up front when the queue is full, when its client already
+    has per_client requests outstanding, or when the estimated wait means
+    it would miss its deadline; one that has waited past the point where
+    it can still finish is dropped before inference. The wait estimate is
+    a running average of recent service times.
+
+    Callers on other threads use run(); asyncio code can await submit().
+    """
+
+    def __init__(self, concurrency=ADMISSION_CONCURRENCY, max_queue=ADMISSION_MAX_QUEUE,
+                 per_client=ADMISSION_PER_CLIENT):
+        self.concurrency = max(1, int(concurrency))
+        self.max_queue = max(1, int(max_queue))
+        self.per_client = max(1, int(per_client))
+        self.running = 0
+        self.service_time = None
+        self._outstanding = {}
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="admitted")
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="admission", daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        for _ in range(self.concurrency):
+            self._loop.create_task(self._worker())
+        self._loop.call_soon(self._started.set)
+        self._loop.run_forever()
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    @property
+    def saturated(self):
+        return self._queue.full()
+
+    def estimated_wait(self, position=None):
+        """Seconds until a request queued now would start running"""
+        if self.service_time is None:
+            return 0.0
+        position = self._queue.qsize() if position is None else position
+        if self.running + position < self.concurrency:
+            return 0.0
+        return math.ceil((position + 1) / self.concurrency) * self.service_time
+
+    def retry_after(self):
+        """Whole seconds a rejected client should wait before trying again"""
+        return max(1, math.ceil(self.estimated_wait()))
+
+    def _reject(self, reason, status=429):
+        ADMISSION_REJECTED.inc(reason=reason)
+        return Rejected(reason, self.retry_after(), status)
+
+    async def submit(self, client, fn, deadline=None):
+        """
+        Run fn() on a detection slot and return its result. deadline is a
+        time.monotonic() value after which the result is no longer wanted.
+        """
+        if self._outstanding.get(client, 0) >= self.per_client:
+            raise self._reject("client_limit")
+        if self._queue.full():
+            raise self._reject("queue_full")
+        if deadline is not None and time.monotonic() + self.estimated_wait() + (self.service_time or 0) > deadline:
+            raise self._reject("deadline")
+
+        job = _Job(fn, client, deadline, self._loop.create_future())
+        self._queue.put_nowait(job)
+        self._outstanding[client] = self._outstanding.get(client, 0) + 1
+        try:
+            return await job.future
+        finally:
+            self._outstanding[client] -= 1
+            if not self._outstanding[client]:
+                del self._outstanding[client]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if job.future.done():
+                continue
+            now = time.monotonic()
+            ADMISSION_WAIT_SECONDS.observe(now - job.enqueued_at)
+            if job.deadline is not None and now + (self.service_time or 0) > job.deadline:
+                # It would finish too late to be useful: free the slot for someone who can still make it
+                job.future.set_exception(self._reject("expired", status=503))
+                continue
+
+            self.running += 1
+            try:
+                result = await self._loop.run_in_executor(self._executor, job.fn)
+            except BaseException as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self.running -= 1
+                elapsed = time.monotonic() - now
+                self.service_time = elapsed if self.service_time is None else (
+                    _EWMA_ALPHA * elapsed + (1 - _EWMA_ALPHA) * self.service_time)
+
+    def run(self, client, fn, deadline_ms=None):
+        """Blocking submit() for callers on other threads (HTTP handlers, Streamlit sessions)"""
+        budget = (REQUEST_DEADLINE_MS if deadline_ms is None else deadline_ms) / 1000
+        deadline = time.monotonic() + budget if budget > 0 else None
+        future = asyncio.run_coroutine_threadsafe(self.submit(client, fn, deadline), self._loop)
+        return future.result()
+
+    def run_patiently(self, client, fn, stop=None):
+        """
+        run() for long jobs (video streams, bulk folders) that submit one
+        batch at a time: a rejected batch waits out its Retry-After and is
+        tried again instead of failing the job. Gives up with the last
+        rejection once the stop event is set.
+        """
+        while True:
+            try:
+                return self.run(client, fn)
+            except Rejected as e:
+                if stop is not None and stop.wait(e.retry_after):
+                    raise
+                if stop is None:
+                    time.sleep(e.retry_after)
+
+    def stats(self):
+        return {
+            "queue_depth": self.depth,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "concurrency": self.concurrency,
+            "saturated": self.saturated,
+            "estimated_wait_s": round(self.estimated_wait(), 3),
+        }
+
+
+_admission = None
+_admission_lock = threading.Lock()
+
+
+def get_admission():
+    """Return the process-wide AdmissionQueue, starting its event loop on first use"""
+    global _admission
+    if _admission is None:
+        with _admission_lock:
+            if _admission is None:
+                _admission = AdmissionQueue()
+    return _admission
+
+
+def admission_stats():
+    """Queue stats for health endpoints, without starting the queue if nothing has used it yet"""
+    if _admission is None:
+        return None
+    return _admission.stats()
+
+
+REGISTRY.gauge("ssod_admission_queue_depth", "Detection requests waiting for a slot",
+               callback=lambda: _admission.depth if _admission is not None else 0)
+REGISTRY.gauge("ssod_admission_running", "Detection requests currently running",
+               callback=lambda: _admission.running if _admission is not None else 0)
@@ -0,0 +1,251 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import threading
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+# Shared cache directory for downloaded artifacts; point every worker on a node at the same path
+ARTIFACT_CACHE_DIR = os.environ.get("ARTIFACT_CACHE_DIR", "models")
+DEFAULT_PARALLELISM = int(os.environ.get("ARTIFACT_FETCH_PARALLELISM", 4))
+DEFAULT_CHUNK_SIZE = int(os.environ.get("ARTIFACT_FETCH_CHUNK_MB", 8)) * (1 << 20)
+
+# Google Drive file holding the released best.pt
+MODEL_DRIVE_FILE_ID = "1Wk1cHp2eR6oiVdZd4CJu-ZFHc-HybHgS"
+
+_READ_SIZE = 1 << 20
+
+
+class ArtifactSource:
+    """
+    Where an artifact is fetched from. Sources that can report their size
+    and serve byte ranges are downloaded in parallel chunks and resumed
+    chunk by chunk; the rest are fetched as one stream.
+    """
+
+    def size(self):
+        """Total size in bytes, or None if unknown"""
+        return None
+
+    def supports_ranges(self):
+        return False
+
+    def fetch_range(self, start, end, fileobj):
+        """Write bytes [start, end] (inclusive) to fileobj"""
+        raise NotImplementedError
+
+    def fetch_all(self, path):
+        """Write the whole artifact to path"""
+        raise NotImplementedError
+
+
+class HttpSource(ArtifactSource):
+    """Plain HTTP(S) URL; uses Range requests when the server advertises them"""
+
+    def __init__(self, url, timeout=30):
+        self.url = url
+        self.timeout = timeout
+        self._head = None
+
+    def _probe(self):
+        if self._head is None:
+            import requests
+            response = requests.head(self.url, allow_redirects=True, timeout=self.timeout)
+            response.raise_for_status()
+            self._head = response.headers
+        return self._head
+
+    def size(self):
+        length = self._probe().get("Content-Length")
+        return int(length) if length else None
+
+    def supports_ranges(self):
+        return self._probe().get("Accept-Ranges", "").lower() == "bytes" and self.size() is not None
+
+    def fetch_range(self, start, end, fileobj):
+        import requests
+        headers = {"Range": f"bytes={start}-{end}"}
+        with requests.get(self.url, headers=headers, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise IOError(f"{self.url} ignored the Range request")
+            fileobj.seek(start)
+            for chunk in response.iter_content(chunk_size=_READ_SIZE):
+                fileobj.write(chunk)
+
+    def fetch_all(self, path):
+        import requests
+        with requests.get(self.url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            with open(path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=_READ_SIZE):
+                    f.write(chunk)
+
+
+class GoogleDriveSource(ArtifactSource):
+    """Google Drive file, fetched through gdown (no ranged downloads)"""
+
+    def __init__(self, file_id):
+        self.url = f"https://drive.google.com/uc?id={file_id}"
+
+    def fetch_all(self, path):
+        import gdown  # type: ignore
+        if gdown.download(self.url, path, quiet=False) is None:
+            raise IOError(f"gdown could not download {self.url}")
+
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_READ_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class _FileLock:
+    """Exclusive advisory lock on a sidecar file, shared by every process on the node"""
+
+    _thread_locks = {}
+    _thread_locks_guard = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        with self._thread_locks_guard:
+            self._thread_lock = self._thread_locks.setdefault(path, threading.Lock())
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if FCNTL_AVAILABLE:
+            self._fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+
+def _read_marker(dest_path):
+    """The {"sha256", "size"} recorded when dest_path was finished, or None"""
+    try:
+        with open(dest_path + ".complete") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_complete(dest_path, sha256):
+    if not os.path.exists(dest_path):
+        return False
+    marker = _read_marker(dest_path)
+    finished = marker is not None and marker.get("size") == os.path.getsize(dest_path)
+    if sha256 is None:
+        # Without a checksum, only trust a file this module finished, e.g. not one
+        # truncated by an older non-resumable download
+        return finished
+    if finished and marker.get("sha256") == sha256:
+        return True
+    return file_sha256(dest_path) == sha256
+
+
+def _fetch_ranged(source, part_path, total_size, parallelism, chunk_size):
+    """Download missing chunks in parallel; completed chunks are recorded so a restart resumes"""
+    state_path = part_path + ".json"
+    chunks = [(start, min(start + chunk_size, total_size) - 1) for start in range(0, total_size, chunk_size)]
+
+    done = set()
+    if os.path.exists(part_path) and os.path.exists(state_path):
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+            if state.get("size") == total_size and state.get("chunk_size") == chunk_size:
+                done = set(state.get("done", []))
+        except (OSError, ValueError):
+            done = set()
+    if not done:
+        with open(part_path, "wb") as f:
+            f.truncate(total_size)
+
+    state_lock = threading.Lock()
+
+    def fetch_chunk(index):
+        start, end = chunks[index]
+        with open(part_path, "r+b") as f:
+            source.fetch_range(start, end, f)
+        with state_lock:
+            done.add(index)
+            with open(state_path, "w") as f:
+                json.dump({"size": total_size, "chunk_size": chunk_size, "done": sorted(done)}, f)
+
+    pending = [i for i in range(len(chunks)) if i not in done]
+    if pending:
+        print(f"[Artifact Fetch] Downloading {len(pending)}/{len(chunks)} chunks with {parallelism} workers")
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as pool:
+        for future in [pool.submit(fetch_chunk, i) for i in pending]:
+            future.result()
+
+    if os.path.exists(state_path):
+        os.remove(state_path)
+
+
+def fetch_artifact(source, name, sha256=None, cache_dir=ARTIFACT_CACHE_DIR,
+                   parallelism=DEFAULT_PARALLELISM, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Fetch an artifact into the shared cache directory and return its path.
+
+    Concurrent callers on the node (threads or processes) serialize on a
+    file lock, so one downloads and the rest reuse the result. Data is
+    written to a .part file, verified against sha256 when given, and only
+    then renamed into place, so an interrupted download is never mistaken
+    for a complete one and is resumed on the next call. A .complete
+    marker records the digest and size of every finished file; without
+    sha256, a file at the destination that has no matching marker is
+    fetched again.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    dest_path = os.path.join(cache_dir, name)
+    sha256 = sha256.lower() if sha256 else None
+
+    if _is_complete(dest_path, sha256):
+        return dest_path
+
+    with _FileLock(dest_path + ".lock"):
+        # Another worker may have finished the download while we waited
+        if _is_complete(dest_path, sha256):
+            return dest_path
+
+        part_path = dest_path + ".part"
+        total_size = source.size()
+        if total_size and source.supports_ranges():
+            _fetch_ranged(source, part_path, total_size, parallelism, chunk_size)
+        else:
+            source.fetch_all(part_path)
+
+        digest = file_sha256(part_path)
+        if sha256 and digest != sha256:
+            os.remove(part_path)
+            raise ValueError(f"Checksum mismatch for {name}: expected {sha256}, got {digest}")
+
+        size = os.path.getsize(part_path)
+        os.replace(part_path, dest_path)
+        with open(dest_path + ".complete", "w") as f:
+            json.dump({"sha256": digest, "size": size}, f)
+        print(f"[Artifact Fetch] {name} ready ({digest[:12]})")
+        return dest_path
+
+
+def fetch_model_weights():
+    """Fetch the served best.pt into the shared artifact cache if not already there"""
+    # MODEL_URL overrides the Google Drive file, e.g. for a local mirror
+    model_url = os.environ.get("MODEL_URL")
+    source = HttpSource(model_url) if model_url else GoogleDriveSource(MODEL_DRIVE_FILE_ID)
+    return fetch_artifact(source, "best.pt", sha256=os.environ.get("MODEL_SHA256"))
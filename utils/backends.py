@@ -0,0 +1,205 @@
+import importlib.util
+import os
+
+import numpy as np
+
+from utils.detection import DEFAULT_DEVICE
+
+# Which runtime serves the model: "pytorch", "onnx", "openvino" or "auto"
+# ("auto" uses ONNX Runtime when it is installed and falls back to PyTorch)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "auto").lower()
+
+# Thread tuning for CPU inference; intra-op defaults to every core
+INTRA_OP_THREADS = int(os.environ.get("INFERENCE_THREADS", os.cpu_count() or 1))
+INTER_OP_THREADS = int(os.environ.get("INFERENCE_INTER_OP_THREADS", 1))
+
+SUPPORTED_BACKENDS = ("pytorch", "onnx", "openvino")
+
+# Shapes an exported model must accept before it is served: micro-batches,
+# /detect/batch and tile batches hold several images, and the adaptive
+# first pass runs below the export size
+PROBE_BATCH = 2
+PROBE_IMGSZ = 320
+
+
+def exported_artifact_path(weights_path, backend):
+    """Where ultralytics writes the exported artifact for a .pt file"""
+    stem, _ = os.path.splitext(str(weights_path))
+    if backend == "onnx":
+        return stem + ".onnx"
+    if backend == "openvino":
+        return stem + "_openvino_model"
+    raise ValueError(f"Unsupported export backend: {backend}")
+
+
+def is_export_stale(weights_path, artifact_path):
+    """An export is stale if it is missing or older than the weights it came from"""
+    if not os.path.exists(artifact_path):
+        return True
+    return os.path.getmtime(artifact_path) < os.path.getmtime(weights_path)
+
+
+def export_model(weights_path, backend, force=False):
+    """
+    Export a .pt file to ONNX or OpenVINO IR with a dynamic batch and input
+    size, reusing the artifact cached next to the weights when it is still
+    up to date (or re-exporting anyway when force is set)
+    """
+    artifact_path = exported_artifact_path(weights_path, backend)
+    if not force and not is_export_stale(weights_path, artifact_path):
+        return artifact_path
+
+    from ultralytics import YOLO  # type: ignore
+    print(f"[Backends] Exporting {weights_path} to {backend}...")
+    exported = YOLO(str(weights_path)).export(format=backend, device=DEFAULT_DEVICE, dynamic=True)
+    return str(exported) if exported else artifact_path
+
+
+def _onnx_session_options():
+    import onnxruntime as ort  # type: ignore
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = INTRA_OP_THREADS
+    options.inter_op_num_threads = INTER_OP_THREADS
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return options
+
+
+def _tune_onnx_session(model, onnx_path):
+    """
+    Replace the ONNX Runtime session ultralytics created with one using our
+    thread settings. The predictor is only built on the first predict call,
+    so run a tiny one first.
+    """
+    import onnxruntime as ort  # type: ignore
+    model.predict(source=np.zeros((32, 32, 3), dtype=np.uint8), device=DEFAULT_DEVICE, verbose=False)
+    backend = model.predictor.model
+    session = ort.InferenceSession(
+        str(onnx_path), sess_options=_onnx_session_options(), providers=["CPUExecutionProvider"]
+    )
+    backend.session = session
+    backend.output_names = [x.name for x in session.get_outputs()]
+    backend.dynamic = isinstance(session.get_outputs()[0].shape[0], str)
+    if not backend.dynamic and hasattr(backend, "io"):
+        # Static graphs run through an IO binding, which belongs to the session that created it
+        _rebind_onnx_outputs(backend, session)
+
+
+def _rebind_onnx_outputs(backend, session):
+    """Rebuild ultralytics' IO binding and output buffers for a replacement session"""
+    import torch  # type: ignore
+    fp16 = getattr(backend, "fp16", False)
+    device = getattr(backend, "device", torch.device("cpu"))
+    io = session.io_binding()
+    bindings = []
+    for output in session.get_outputs():
+        buffer = torch.empty(output.shape, dtype=torch.float16 if fp16 else torch.float32).to(device)
+        io.bind_output(
+            name=output.name,
+            device_type=device.type,
+            device_id=device.index if device.type == "cuda" else 0,
+            element_type=np.float16 if fp16 else np.float32,
+            shape=tuple(buffer.shape),
+            buffer_ptr=buffer.data_ptr(),
+        )
+        bindings.append(buffer)
+    backend.io, backend.bindings = io, bindings
+
+
+def check_dynamic_shapes(model):
+    """
+    Run a PROBE_BATCH-image predict at PROBE_IMGSZ and raise unless one
+    result per image comes back, so a graph frozen at batch 1 or at its
+    export size is caught at load time instead of on the first batch
+    """
+    frames = [np.zeros((PROBE_IMGSZ, PROBE_IMGSZ * 4 // 3, 3), dtype=np.uint8) for _ in range(PROBE_BATCH)]
+    results = model.predict(source=frames, imgsz=PROBE_IMGSZ, device=DEFAULT_DEVICE, verbose=False)
+    if len(results) != PROBE_BATCH:
+        raise RuntimeError(f"expected {PROBE_BATCH} results from a batched predict, got {len(results)}")
+
+
+def _load_pytorch(weights_path):
+    from ultralytics import YOLO  # type: ignore
+    try:
+        import torch  # type: ignore
+        torch.set_num_threads(INTRA_OP_THREADS)
+    except (ImportError, RuntimeError):
+        pass
+    return YOLO(str(weights_path))
+
+
+def _open_exported(artifact_path, backend):
+    from ultralytics import YOLO  # type: ignore
+    model = YOLO(artifact_path, task="detect")
+    if backend == "onnx":
+        _tune_onnx_session(model, artifact_path)
+    check_dynamic_shapes(model)
+    return model
+
+
+def _load_exported(weights_path, backend):
+    artifact_path = export_model(weights_path, backend)
+    try:
+        return _open_exported(artifact_path, backend)
+    except Exception as e:
+        # Most likely a fixed-shape artifact from an older export; rebuild it once
+        print(f"[Backends] Cached {backend} export failed the shape check ({e}), re-exporting")
+    return _open_exported(export_model(weights_path, backend, force=True), backend)
+
+
+def _load_promoted_variant(weights_path):
+    """Load the INT8 variant if utils.quantize promoted one for these weights"""
+    try:
+        from utils.quantize import promoted_variant_path
+        variant_path = promoted_variant_path(weights_path)
+        if variant_path is None:
+            return None
+        from ultralytics import YOLO  # type: ignore
+        model = YOLO(variant_path, task="detect")
+        _tune_onnx_session(model, variant_path)
+        check_dynamic_shapes(model)
+        print(f"[Backends] Serving promoted INT8 variant {variant_path}")
+        return model
+    except Exception as e:
+        print(f"[Backends] Could not load promoted variant ({e}), using fp32 weights")
+        return None
+
+
+def resolve_backend(requested=None):
+    """Turn the configured backend name into one we can actually serve"""
+    backend = (requested or INFERENCE_BACKEND).lower()
+    if backend == "auto":
+        return "onnx" if importlib.util.find_spec("onnxruntime") is not None else "pytorch"
+    if backend not in SUPPORTED_BACKENDS:
+        print(f"[Backends] Unknown backend '{backend}', using pytorch")
+        return "pytorch"
+    return backend
+
+
+def load_backend_model(weights_path, backend=None):
+    """
+    Load weights with the configured inference backend.
+
+    A promoted INT8 variant (see utils.quantize) takes precedence unless
+    the pytorch backend is forced. Non-.pt
+    files (e.g. an already exported .onnx) are loaded as-is.
+    Any failure to export or load an optimized runtime falls back to
+    PyTorch eager so the app keeps serving.
+    """
+    backend = resolve_backend(backend)
+    if backend != "pytorch" and str(weights_path).endswith(".pt"):
+        model = _load_promoted_variant(weights_path)
+        if model is not None:
+            return model
+
+    if backend == "pytorch" or not str(weights_path).endswith(".pt"):
+        return _load_pytorch(weights_path)
+
+    try:
+        model = _load_exported(weights_path, backend)
+        print(f"[Backends] Serving {weights_path} with {backend} "
+              f"(intra-op threads={INTRA_OP_THREADS}, inter-op threads={INTER_OP_THREADS})")
+        return model
+    except Exception as e:
+        print(f"[Backends] {backend} backend unavailable ({e}), falling back to pytorch")
+        return _load_pytorch(weights_path)
@@ -0,0 +1,144 @@
+from concurrent.futures import Future
+import os
+import queue
+import threading
+import time
+
+from utils.detection import DEFAULT_CONF, DEFAULT_DEVICE
+from utils.metrics import BATCH_SIZE, INFERENCE_SECONDS, REQUEST_LATENCY_SECONDS
+
+# Batching window, overridable per deployment
+DEFAULT_MAX_BATCH_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 8))
+DEFAULT_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 10))
+
+
+class _Request:
+    __slots__ = ("model", "source", "conf", "imgsz", "future", "enqueued_at")
+
+    def __init__(self, model, source, conf, imgsz=None):
+        self.model = model
+        self.source = source
+        self.conf = conf
+        self.imgsz = imgsz
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent detection requests into batched predict calls.
+
+    Requests that arrive within max_wait_ms of the first queued request
+    (up to max_batch_size of them) are run together. Requests are only
+    batched with others for the same model instance, conf threshold and
+    imgsz, and each caller gets back its own ultralytics result.
+    """
+
+    def __init__(self, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit_async(self, model, source, conf=DEFAULT_CONF, imgsz=None):
+        """Queue one image (path, array or PIL image) and return a Future for its result"""
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        request = _Request(model, source, conf, imgsz)
+        self._queue.put(request)
+        return request.future
+
+    def submit(self, model, source, conf=DEFAULT_CONF, timeout=None, imgsz=None):
+        """Queue one image and block until its result is available"""
+        return self.submit_async(model, source, conf, imgsz).result(timeout)
+
+    def submit_many(self, model, sources, conf=DEFAULT_CONF, timeout=None, imgsz=None):
+        """Queue several images at once and return their results in input order"""
+        futures = [self.submit_async(model, source, conf, imgsz) for source in sources]
+        return [future.result(timeout) for future in futures]
+
+    def queue_depth(self):
+        """Number of requests waiting to be batched"""
+        return self._queue.qsize()
+
+    def close(self):
+        """Stop the worker thread once the queue has drained"""
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Re-queue the sentinel so the loop exits after this batch
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            # Group by model, threshold and input size, keeping arrival order within each group
+            groups = {}
+            for request in batch:
+                groups.setdefault((id(request.model), request.conf, request.imgsz), []).append(request)
+
+            for requests in groups.values():
+                self._predict(requests)
+
+    def _predict(self, requests):
+        model = requests[0].model
+        start = time.perf_counter()
+        # Leave imgsz unset unless asked, so the model's own default applies
+        extra = {"imgsz": requests[0].imgsz} if requests[0].imgsz else {}
+        try:
+            results = model.predict(
+                source=[r.source for r in requests],
+                conf=requests[0].conf,
+                device=DEFAULT_DEVICE,
+                verbose=False,
+                **extra
+            )
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+
+        finished = time.perf_counter()
+        INFERENCE_SECONDS.observe(finished - start)
+        BATCH_SIZE.observe(len(requests))
+        for request, result in zip(requests, results):
+            REQUEST_LATENCY_SECONDS.observe(finished - request.enqueued_at)
+            request.future.set_result(result)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """Return the process-wide MicroBatcher, starting it on first use"""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher()
+    return _batcher
@@ -0,0 +1,274 @@
+"""
+Inference benchmark and regression harness.
+
+Runs the full detection pipeline (decode -> predict -> post-process ->
+render) over an image set for every combination of backend, thread
+count, imgsz and batch size. Each combination runs in its own
+subprocess so thread settings and peak memory are measured in
+isolation. Throughput, p50/p95/p99 latency, per-stage means and peak
+RSS are written to a JSON report. When a baseline report is given, the
+run fails if any configuration is slower than the baseline beyond the
+tolerance.
+
+Usage:
+    python -m utils.benchmark --images bus.jpg --batch-sizes 1 4 8 --imgsz 640 --threads 4 --backends pytorch onnx
+    python -m utils.benchmark --baseline benchmarks/baseline.json --tolerance 0.1
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from utils.detection import DEFAULT_CONF, DEFAULT_DEVICE
+
+DEFAULT_IMAGES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bus.jpg")
+DEFAULT_ITERATIONS = 20
+DEFAULT_WARMUP = 3
+# Allowed relative slowdown against the baseline before a configuration counts as a regression
+DEFAULT_TOLERANCE = float(os.environ.get("BENCHMARK_TOLERANCE", 0.10))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def collect_images(spec):
+    """Resolve a file, directory or glob into a sorted list of image paths"""
+    if os.path.isdir(spec):
+        paths = [os.path.join(spec, name) for name in os.listdir(spec)]
+    else:
+        paths = glob.glob(spec)
+    paths = sorted(p for p in paths if p.lower().endswith(IMAGE_EXTENSIONS))
+    if not paths:
+        raise FileNotFoundError(f"No images found for {spec}")
+    return paths
+
+
+def config_key(config):
+    return f"{config['backend']}/threads={config['threads']}/imgsz={config['imgsz']}/batch={config['batch_size']}"
+
+
+def _peak_rss_bytes():
+    import resource
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _served_backend(model):
+    """Which runtime actually served the run (load_backend_model may have fallen back)"""
+    backend = getattr(getattr(model, "predictor", None), "model", None)
+    for name, flag in (("onnx", "onnx"), ("openvino", "xml"), ("pytorch", "pt")):
+        if getattr(backend, flag, False):
+            return name
+    return "unknown"
+
+
+def run_config(weights, image_paths, config, iterations=DEFAULT_ITERATIONS, warmup=DEFAULT_WARMUP,
+               conf=DEFAULT_CONF):
+    """
+    Benchmark one configuration in this process and return its stats.
+    Latency is measured per batch over the whole pipeline.
+    """
+    from utils import backends
+    from utils.detection import arrays_to_detections, decode_image_array, draw_detections, result_to_arrays
+
+    # The loaders read the thread settings at call time
+    backends.INTRA_OP_THREADS = config["threads"]
+    load_start = time.perf_counter()
+    model = backends.load_backend_model(weights, config["backend"])
+    load_seconds = time.perf_counter() - load_start
+    class_names = model.names
+
+    blobs = []
+    for path in image_paths:
+        with open(path, "rb") as f:
+            blobs.append(f.read())
+    batch_size = config["batch_size"]
+
+    def run_batch(index):
+        batch = [blobs[(index * batch_size + i) % len(blobs)] for i in range(batch_size)]
+        stages = {}
+        start = time.perf_counter()
+        images = [decode_image_array(data) for data in batch]
+        stages["decode"] = time.perf_counter() - start
+
+        mark = time.perf_counter()
+        results = model.predict(source=images, conf=conf, imgsz=config["imgsz"],
+                                device=DEFAULT_DEVICE, verbose=False)
+        stages["predict"] = time.perf_counter() - mark
+
+        mark = time.perf_counter()
+        detections = [arrays_to_detections(*result_to_arrays(r), class_names) for r in results]
+        stages["postprocess"] = time.perf_counter() - mark
+
+        mark = time.perf_counter()
+        for image, image_detections in zip(images, detections):
+            draw_detections(image, image_detections, inplace=True)
+        stages["render"] = time.perf_counter() - mark
+        return time.perf_counter() - start, stages
+
+    for i in range(warmup):
+        run_batch(i)
+
+    latencies = []
+    stage_totals = {}
+    wall_start = time.perf_counter()
+    for i in range(iterations):
+        latency, stages = run_batch(warmup + i)
+        latencies.append(latency)
+        for name, seconds in stages.items():
+            stage_totals[name] = stage_totals.get(name, 0.0) + seconds
+    wall_seconds = time.perf_counter() - wall_start
+
+    latencies_ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {
+        **config,
+        "served_backend": _served_backend(model),
+        "iterations": iterations,
+        "images_per_second": round(iterations * batch_size / wall_seconds, 3),
+        "latency_ms": {
+            "mean": round(float(latencies_ms.mean()), 3),
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3),
+        },
+        "stage_ms": {name: round(total / iterations * 1000, 3) for name, total in stage_totals.items()},
+        "load_seconds": round(load_seconds, 3),
+        "peak_rss_mb": round(_peak_rss_bytes() / (1 << 20), 1),
+    }
+
+
+def run_config_isolated(weights, image_paths, config, iterations, warmup, conf, timeout=None):
+    """Run one configuration in a fresh interpreter so threads and peak memory don't leak across runs"""
+    job = {"weights": weights, "images": image_paths, "config": config,
+           "iterations": iterations, "warmup": warmup, "conf": conf}
+    completed = subprocess.run(
+        [sys.executable, "-m", "utils.benchmark", "--worker", json.dumps(job)],
+        capture_output=True, text=True, timeout=timeout,
+        env={**os.environ, "OMP_NUM_THREADS": str(config["threads"])}
+    )
+    # Libraries may print to stdout; the result is always the last line
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        error = (completed.stderr.strip().splitlines() or ["no output"])[-1]
+        return {**config, "error": error}
+    return json.loads(lines[-1])
+
+
+def sweep(weights, image_paths, backends=("pytorch",), threads=(None,), imgsz=(640,), batch_sizes=(1,),
+          iterations=DEFAULT_ITERATIONS, warmup=DEFAULT_WARMUP, conf=DEFAULT_CONF):
+    """Benchmark every combination and return the results keyed by configuration"""
+    results = {}
+    for backend in backends:
+        for thread_count in threads:
+            for size in imgsz:
+                for batch_size in batch_sizes:
+                    config = {"backend": backend, "threads": thread_count or os.cpu_count() or 1,
+                              "imgsz": size, "batch_size": batch_size}
+                    key = config_key(config)
+                    print(f"[Benchmark] {key}", file=sys.stderr)
+                    results[key] = run_config_isolated(weights, image_paths, config, iterations, warmup, conf)
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Return a list of regression messages. A configuration regresses when
+    its throughput drops, or its p95 latency grows, by more than tolerance
+    relative to the baseline. Configurations missing from either side are
+    skipped.
+    """
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None or "error" in previous:
+            continue
+        if "error" in current:
+            regressions.append(f"{key}: failed ({current['error']})")
+            continue
+        min_throughput = previous["images_per_second"] * (1 - tolerance)
+        if current["images_per_second"] < min_throughput:
+            regressions.append(f"{key}: throughput {current['images_per_second']} img/s "
+                               f"< baseline {previous['images_per_second']} img/s")
+        max_p95 = previous["latency_ms"]["p95"] * (1 + tolerance)
+        if current["latency_ms"]["p95"] > max_p95:
+            regressions.append(f"{key}: p95 {current['latency_ms']['p95']} ms "
+                               f"> baseline {previous['latency_ms']['p95']} ms")
+    return regressions
+
+
+def _environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.time(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the detection pipeline across runtime settings")
+    parser.add_argument("--weights", default=None, help="weights to benchmark (default: the model the API serves)")
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="image file, directory or glob")
+    parser.add_argument("--backends", nargs="+", default=["pytorch"], choices=("pytorch", "onnx", "openvino"))
+    parser.add_argument("--threads", nargs="+", type=int, default=[None])
+    parser.add_argument("--imgsz", nargs="+", type=int, default=[640])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1])
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP)
+    parser.add_argument("--conf", type=float, default=DEFAULT_CONF)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None, help="report to compare against; exits 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        job = json.loads(args.worker)
+        result = run_config(job["weights"], job["images"], job["config"],
+                            iterations=job["iterations"], warmup=job["warmup"], conf=job["conf"])
+        print(json.dumps(result))
+        return
+
+    weights = args.weights
+    if weights is None:
+        from inference_api import resolve_model_path
+        weights = resolve_model_path()
+        if not weights:
+            parser.error("no weights found; pass --weights")
+    image_paths = collect_images(args.images)
+
+    results = sweep(weights, image_paths, backends=args.backends, threads=args.threads, imgsz=args.imgsz,
+                    batch_sizes=args.batch_sizes, iterations=args.iterations, warmup=args.warmup, conf=args.conf)
+    report = {"weights": weights, "images": len(image_paths), "environment": _environment(), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for key, result in results.items():
+        if "error" in result:
+            print(f"{key:<48} FAILED: {result['error']}")
+        else:
+            latency = result["latency_ms"]
+            print(f"{key:<48} {result['images_per_second']:>8.2f} img/s  p50 {latency['p50']:>8.1f} ms  "
+                  f"p95 {latency['p95']:>8.1f} ms  p99 {latency['p99']:>8.1f} ms  peak {result['peak_rss_mb']} MB")
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline.get("results", {}), args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,478 @@
+"""
+Bulk detection over a folder or ZIP archive.
+
+Images are listed lazily, read and decoded by a pool of prefetch
+threads, run through the detector in batches and written out as they
+complete (CSV, JSONL and/or COCO JSON). Results are written in listing
+order, so a checkpoint is just the number of images done plus the byte
+offset of every output file; an interrupted job resumes by truncating
+the outputs to those offsets and skipping that many images. At most
+queue_size decoded images are held in memory at any time.
+
+Usage:
+    python -m utils.bulk photos.zip --output bulk_results/audit --formats csv jsonl coco
+"""
+from collections import namedtuple
+import argparse
+import csv
+import itertools
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import zipfile
+
+from utils.detection import DEFAULT_CONF, DEFAULT_DEVICE, decode_image_array, result_to_detections
+from utils.result_cache import content_hash, model_digest
+
+# Bulk job defaults, overridable per deployment
+DEFAULT_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", 8))
+DEFAULT_DECODE_THREADS = int(os.environ.get("BULK_DECODE_THREADS", 4))
+DEFAULT_QUEUE_SIZE = int(os.environ.get("BULK_QUEUE_SIZE", 32))
+DEFAULT_CHECKPOINT_EVERY = int(os.environ.get("BULK_CHECKPOINT_EVERY", 50))
+BULK_OUTPUT_DIR = os.environ.get("BULK_OUTPUT_DIR", "bulk_results")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+CHECKPOINT_NAME = "checkpoint.json"
+
+BulkProgress = namedtuple("BulkProgress", ["processed", "total", "failed", "detections", "elapsed_s", "done"])
+
+_END = object()
+
+
+def _is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not os.path.basename(name).startswith(".")
+
+
+class DirectorySource:
+    """Images under a server-side directory, walked in sorted order"""
+
+    def __init__(self, root):
+        self.root = root
+        self.description = os.path.abspath(root)
+
+    def __iter__(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if _is_image(filename):
+                    yield os.path.relpath(os.path.join(dirpath, filename), self.root)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def read(self, name):
+        with open(os.path.join(self.root, name), "rb") as f:
+            return f.read()
+
+    def close(self):
+        pass
+
+
+class ZipSource:
+    """Images inside a ZIP archive (path or seekable file object), in archive order"""
+
+    def __init__(self, archive, description=None):
+        self._zip = zipfile.ZipFile(archive)
+        self.description = description or str(archive)
+
+    def __iter__(self):
+        for info in self._zip.infolist():
+            if not info.is_dir() and _is_image(info.filename):
+                yield info.filename
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def read(self, name):
+        return self._zip.read(name)
+
+    def close(self):
+        self._zip.close()
+
+
+def open_source(source):
+    """A DirectorySource for directories, a ZipSource for archives and file objects"""
+    if isinstance(source, (DirectorySource, ZipSource)):
+        return source
+    if isinstance(source, str) and os.path.isdir(source):
+        return DirectorySource(source)
+    if isinstance(source, str) and not zipfile.is_zipfile(source):
+        raise ValueError(f"{source} is neither a directory nor a ZIP archive")
+    return ZipSource(source, getattr(source, "name", None))
+
+
+class _Writer:
+    """An incrementally written output file whose position can be checkpointed and restored"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def open(self, state=None):
+        """Start a fresh file, or truncate an existing one to a checkpointed state"""
+        if state is None:
+            self._file = open(self.path, "w", newline="", encoding="utf-8")
+            self.start()
+        else:
+            self._file = open(self.path, "r+", newline="", encoding="utf-8")
+            self._file.truncate(state["offset"])
+            self._file.seek(state["offset"])
+            self.restore(state)
+
+    def start(self):
+        pass
+
+    def restore(self, state):
+        pass
+
+    def state(self):
+        return {"offset": self._file.tell()}
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def finish(self):
+        self._file.close()
+
+
+class CsvWriter(_Writer):
+    """One row per detection; images without detections get a row with empty detection fields"""
+    name = "csv"
+    COLUMNS = ["image", "width", "height", "class_id", "class_name", "confidence", "x1", "y1", "x2", "y2"]
+
+    def __init__(self, output_dir, class_names):
+        super().__init__(os.path.join(output_dir, "detections.csv"))
+        self._csv = None
+
+    def start(self):
+        self._csv = csv.writer(self._file)
+        self._csv.writerow(self.COLUMNS)
+
+    def restore(self, state):
+        self._csv = csv.writer(self._file)
+
+    def write(self, record):
+        if record.get("error"):
+            return
+        base = [record["image"], record["width"], record["height"]]
+        if not record["detections"]:
+            self._csv.writerow(base + [""] * 7)
+        for d in record["detections"]:
+            self._csv.writerow(base + [d["class_id"], d["class_name"], d["confidence"], *d["box"]])
+
+
+class JsonlWriter(_Writer):
+    """One JSON object per image, including images that failed to decode"""
+    name = "jsonl"
+
+    def __init__(self, output_dir, class_names):
+        super().__init__(os.path.join(output_dir, "detections.jsonl"))
+
+    def write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+
+
+class CocoWriter(_Writer):
+    """
+    COCO detection JSON. Images and annotations are streamed to line-per-
+    entry part files and stitched into one document when the job ends.
+    """
+    name = "coco"
+
+    def __init__(self, output_dir, class_names):
+        super().__init__(os.path.join(output_dir, "coco.images.part"))
+        self.final_path = os.path.join(output_dir, "coco.json")
+        self._annotations_path = os.path.join(output_dir, "coco.annotations.part")
+        self._annotations = None
+        self.class_names = class_names
+        self._next_image_id = 1
+        self._next_annotation_id = 1
+
+    def start(self):
+        self._annotations = open(self._annotations_path, "w", encoding="utf-8")
+
+    def restore(self, state):
+        self._annotations = open(self._annotations_path, "r+", encoding="utf-8")
+        self._annotations.truncate(state["annotations_offset"])
+        self._annotations.seek(state["annotations_offset"])
+        self._next_image_id = state["next_image_id"]
+        self._next_annotation_id = state["next_annotation_id"]
+
+    def state(self):
+        return dict(super().state(), annotations_offset=self._annotations.tell(),
+                    next_image_id=self._next_image_id, next_annotation_id=self._next_annotation_id)
+
+    def write(self, record):
+        if record.get("error"):
+            return
+        image_id = self._next_image_id
+        self._next_image_id += 1
+        self._file.write(json.dumps({"id": image_id, "file_name": record["image"],
+                                     "width": record["width"], "height": record["height"]}) + "\n")
+        for d in record["detections"]:
+            x1, y1, x2, y2 = d["box"]
+            self._annotations.write(json.dumps({
+                "id": self._next_annotation_id, "image_id": image_id, "category_id": d["class_id"],
+                "bbox": [x1, y1, round(x2 - x1, 2), round(y2 - y1, 2)], "area": round((x2 - x1) * (y2 - y1), 2),
+                "score": d["confidence"], "iscrowd": 0,
+            }) + "\n")
+            self._next_annotation_id += 1
+
+    def sync(self):
+        super().sync()
+        self._annotations.flush()
+        os.fsync(self._annotations.fileno())
+
+    def finish(self):
+        super().finish()
+        self._annotations.close()
+        categories = [{"id": int(k), "name": v} for k, v in sorted(self.class_names.items())]
+        with open(self.final_path + ".tmp", "w", encoding="utf-8") as out:
+            out.write('{"info": {"description": "SSOD bulk detection"}, "categories": ')
+            out.write(json.dumps(categories))
+            for key, part in (("images", self.path), ("annotations", self._annotations_path)):
+                out.write(f', "{key}": [')
+                with open(part, encoding="utf-8") as f:
+                    for i, line in enumerate(f):
+                        out.write(("," if i else "") + line.rstrip("\n"))
+                out.write("]")
+            out.write("}\n")
+        os.replace(self.final_path + ".tmp", self.final_path)
+        os.remove(self.path)
+        os.remove(self._annotations_path)
+
+
+WRITERS = {"csv": CsvWriter, "jsonl": JsonlWriter, "coco": CocoWriter}
+
+
+def _read_checkpoint(output_dir):
+    path = os.path.join(output_dir, CHECKPOINT_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_checkpoint(output_dir, checkpoint):
+    path = os.path.join(output_dir, CHECKPOINT_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+
+
+def run_bulk_job(model, source, output_dir, formats=("csv", "jsonl"), conf=DEFAULT_CONF,
+                 batch_size=DEFAULT_BATCH_SIZE, decode_threads=DEFAULT_DECODE_THREADS,
+                 queue_size=DEFAULT_QUEUE_SIZE, checkpoint_every=DEFAULT_CHECKPOINT_EVERY,
+                 resume=True, worker_pool=None, store=None, site=None, admit=None):
+    """
+    Run detection over every image in a directory or ZIP archive, writing
+    results to output_dir, and yield a BulkProgress after every batch.
+
+    With resume=True a checkpoint left in output_dir by an interrupted run
+    of the same job is picked up; otherwise output_dir is started fresh.
+    Pass a WorkerPool to run inference in worker processes, and a
+    DetectionStore to also keep every result for historical queries.
+    admit(fn, stop), if given, runs each batch's inference, e.g. on an
+    admission slot (AdmissionQueue.run_patiently).
+    """
+    unknown = set(formats) - set(WRITERS)
+    if unknown:
+        raise ValueError(f"Unknown output formats: {', '.join(sorted(unknown))}")
+    source = open_source(source)
+    os.makedirs(output_dir, exist_ok=True)
+
+    job = {"source": source.description, "formats": sorted(formats), "conf": round(float(conf), 4)}
+    checkpoint = _read_checkpoint(output_dir) if resume else None
+    if checkpoint is not None and checkpoint.get("job") != job:
+        raise ValueError(f"{output_dir} holds a different job ({checkpoint.get('job')}); "
+                         f"use another output directory or disable resume")
+
+    total = len(source)
+    writers = [WRITERS[name](output_dir, model.names) for name in sorted(formats)]
+    if checkpoint is not None and checkpoint.get("complete"):
+        source.close()
+        yield BulkProgress(checkpoint["processed"], total, checkpoint["failed"], checkpoint["detections"], 0.0, True)
+        return
+
+    for writer in writers:
+        writer.open(checkpoint["writers"][writer.name] if checkpoint else None)
+    processed = checkpoint["processed"] if checkpoint else 0
+    failed = checkpoint["failed"] if checkpoint else 0
+    detection_count = checkpoint["detections"] if checkpoint else 0
+    if processed:
+        print(f"[Bulk] Resuming {source.description} at image {processed}/{total}")
+
+    # Bounded prefetch: a permit is taken per image before it is read and
+    # returned once its results are written, so memory does not grow with the archive
+    queue_size = max(queue_size, batch_size + decode_threads)
+    permits = threading.Semaphore(queue_size)
+    work = enumerate(itertools.islice(iter(source), processed, None), processed)
+    work_lock = threading.Lock()
+    decoded = queue.Queue()
+    stop = threading.Event()
+
+    def decode_stage():
+        try:
+            while not stop.is_set():
+                if not permits.acquire(timeout=0.1):
+                    continue
+                with work_lock:
+                    item = next(work, None)
+                if item is None:
+                    permits.release()
+                    break
+                index, name = item
+                try:
+                    data = source.read(name)
+                    image, error = decode_image_array(data), None
+                    image_hash = content_hash(data) if store is not None else None
+                except Exception as e:
+                    image, error, image_hash = None, str(e), None
+                decoded.put((index, name, image, error, image_hash))
+        finally:
+            decoded.put(_END)
+
+    threads = [threading.Thread(target=decode_stage, name=f"bulk-decode-{i}", daemon=True)
+               for i in range(max(1, decode_threads))]
+    for thread in threads:
+        thread.start()
+
+    digest = model_digest(model) if store is not None else None
+
+    def predict(images):
+        if worker_pool is not None:
+            return worker_pool.submit_many(images, conf=conf)
+        results = model.predict(source=images, conf=conf, device=DEFAULT_DEVICE, verbose=False)
+        return [result_to_detections(result, model.names) for result in results]
+
+    def detect(images):
+        if admit is not None:
+            return admit(lambda: predict(images), stop)
+        return predict(images)
+
+    start = time.perf_counter()
+    last_checkpoint = processed
+    try:
+        reorder = {}
+        next_index = processed
+        pending = []
+        finished_threads = 0
+        while finished_threads < len(threads) or pending:
+            if finished_threads < len(threads):
+                item = decoded.get()
+                if item is _END:
+                    finished_threads += 1
+                else:
+                    reorder[item[0]] = item
+                    while next_index in reorder:
+                        pending.append(reorder.pop(next_index))
+                        next_index += 1
+                if len(pending) < batch_size and finished_threads < len(threads):
+                    continue
+
+            batch, pending = pending[:batch_size], pending[batch_size:]
+            if not batch:
+                continue
+            valid = [item for item in batch if item[2] is not None]
+            detections = dict(zip((item[0] for item in valid), detect([item[2] for item in valid]))) if valid else {}
+            stored = []
+            for index, name, image, error, image_hash in batch:
+                if error is not None:
+                    record = {"image": name, "error": error}
+                    failed += 1
+                else:
+                    record = {"image": name, "width": int(image.shape[1]), "height": int(image.shape[0]),
+                              "detections": detections[index]}
+                    detection_count += len(detections[index])
+                    if store is not None:
+                        stored.append({"image_hash": image_hash, "detections": detections[index], "model": digest,
+                                       "site": site, "source": f"{source.description}:{name}",
+                                       "width": record["width"], "height": record["height"]})
+                for writer in writers:
+                    writer.write(record)
+            if stored:
+                store.record_many(stored)
+            processed += len(batch)
+            # These images are written out; let the decoders fetch more
+            permits.release(len(batch))
+
+            if processed - last_checkpoint >= checkpoint_every:
+                _checkpoint(output_dir, job, writers, processed, failed, detection_count)
+                last_checkpoint = processed
+            yield BulkProgress(processed, total, failed, detection_count, time.perf_counter() - start, False)
+
+        for writer in writers:
+            writer.finish()
+        _write_checkpoint(output_dir, {"job": job, "complete": True, "processed": processed,
+                                       "failed": failed, "detections": detection_count})
+        yield BulkProgress(processed, total, failed, detection_count, time.perf_counter() - start, True)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=5)
+        source.close()
+
+
+def _checkpoint(output_dir, job, writers, processed, failed, detection_count):
+    for writer in writers:
+        writer.sync()
+    _write_checkpoint(output_dir, {
+        "job": job, "complete": False, "processed": processed, "failed": failed,
+        "detections": detection_count, "writers": {w.name: w.state() for w in writers},
+    })
+
+
+def output_files(output_dir):
+    """Finished result files of a job"""
+    names = ("detections.csv", "detections.jsonl", "coco.json")
+    return [os.path.join(output_dir, n) for n in names if os.path.exists(os.path.join(output_dir, n))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run detection over a folder or ZIP archive of images")
+    parser.add_argument("source", help="directory or .zip archive")
+    parser.add_argument("--output", default=None, help=f"output directory (default: {BULK_OUTPUT_DIR}/<source name>)")
+    parser.add_argument("--formats", nargs="+", default=["csv", "jsonl"], choices=sorted(WRITERS))
+    parser.add_argument("--weights", default=None)
+    parser.add_argument("--conf", type=float, default=DEFAULT_CONF)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--decode-threads", type=int, default=DEFAULT_DECODE_THREADS)
+    parser.add_argument("--no-resume", action="store_true", help="discard any checkpoint and start over")
+    parser.add_argument("--site", default=None, help="site stored with the results in the detection store")
+    args = parser.parse_args()
+
+    from inference_api import resolve_model_path
+    from utils.detection_store import get_detection_store
+    from utils.model_registry import get_model_registry
+    from utils.worker_pool import get_worker_pool
+    weights = args.weights or resolve_model_path()
+    if not weights:
+        parser.error("no weights found; pass --weights")
+    model = get_model_registry().load(weights)
+
+    output_dir = args.output or os.path.join(BULK_OUTPUT_DIR, os.path.splitext(os.path.basename(
+        os.path.normpath(args.source)))[0])
+    if args.no_resume and os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+
+    for progress in run_bulk_job(model, args.source, output_dir, formats=args.formats, conf=args.conf,
+                                 batch_size=args.batch_size, decode_threads=args.decode_threads,
+                                 worker_pool=get_worker_pool(weights), store=get_detection_store(),
+                                 site=args.site):
+        rate = (progress.processed / progress.elapsed_s) if progress.elapsed_s else 0.0
+        print(f"\r[Bulk] {progress.processed}/{progress.total} images, {progress.detections} detections, "
+              f"{progress.failed} failed ({rate:.1f} img/s)", end="", flush=True)
+    print()
+    for path in output_files(output_dir):
+        print(f"[Bulk] Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import io
+
+import numpy as np
+from PIL import Image, ImageOps
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+# Default inference settings shared by the Streamlit UI and the HTTP API
+DEFAULT_CONF = 0.4
+DEFAULT_DEVICE = "cpu"
+
+
+def decode_image_array(data: bytes, use_cv2=None):
+    """
+    Decode raw image bytes in memory into a BGR uint8 array, the layout
+    YOLO expects for numpy sources. Uses OpenCV when available and falls
+    back to PIL otherwise. EXIF orientation is applied either way. Raises
+    ValueError if the bytes aren't an image.
+    """
+    if use_cv2 is None:
+        use_cv2 = CV2_AVAILABLE
+
+    if use_cv2:
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("unsupported or corrupt image data")
+        return image
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        # OpenCV applies EXIF orientation on decode; PIL needs to be asked
+        image = np.asarray(ImageOps.exif_transpose(image).convert("RGB"))
+    except Exception as e:
+        raise ValueError(f"unsupported or corrupt image data: {e}")
+    # PIL decodes to RGB; flip into a contiguous BGR array for the model
+    return np.ascontiguousarray(image[:, :, ::-1])
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU between two (N, 4) and (M, 4) xyxy arrays"""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def result_to_arrays(result):
+    """Return (xyxy, conf, cls) numpy arrays for a single ultralytics result"""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+    boxes_data = boxes.cpu().numpy()
+    return (
+        boxes_data.xyxy.reshape(-1, 4).astype(np.float32),
+        boxes_data.conf.reshape(-1).astype(np.float32),
+        boxes_data.cls.reshape(-1).astype(np.int64),
+    )
+
+
+def class_name_lookup(class_names, size):
+    """Array mapping class id -> class name, for vectorized name lookup"""
+    size = max(size, max(class_names, default=-1) + 1)
+    return np.array([class_names.get(i, f"Class {i}") for i in range(size)], dtype=object)
+
+
+def arrays_to_table(xyxy, conf, cls, class_names):
+    """
+    Build a columnar table (dict of equal-length arrays) of all detections
+    in one shot; class names are resolved by array lookup
+    """
+    cls = np.asarray(cls, dtype=np.int64).reshape(-1)
+    xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+    names = class_name_lookup(class_names, int(cls.max()) + 1 if len(cls) else 0)
+    return {
+        "class_id": cls,
+        "class_name": names[cls],
+        "confidence": np.round(np.asarray(conf, dtype=np.float64).reshape(-1), 4),
+        "x1": np.round(xyxy[:, 0], 2),
+        "y1": np.round(xyxy[:, 1], 2),
+        "x2": np.round(xyxy[:, 2], 2),
+        "y2": np.round(xyxy[:, 3], 2),
+    }
+
+
+def arrays_to_detections(xyxy, conf, cls, class_names):
+    """Convert detection arrays into a list of JSON-friendly detection dicts"""
+    table = arrays_to_table(xyxy, conf, cls, class_names)
+    boxes = np.stack([table["x1"], table["y1"], table["x2"], table["y2"]], axis=1).tolist()
+    return [
+        {"class_id": class_id, "class_name": name, "confidence": confidence, "box": box}
+        for class_id, name, confidence, box in zip(
+            table["class_id"].tolist(), table["class_name"].tolist(), table["confidence"].tolist(), boxes
+        )
+    ]
+
+
+def detections_to_table(detections):
+    """Columnar table for a list of detection dicts (e.g. results served from the cache)"""
+    boxes = np.array([d["box"] for d in detections], dtype=np.float64).reshape(-1, 4)
+    return {
+        "class_name": np.array([d["class_name"] for d in detections], dtype=object),
+        "confidence": np.array([d["confidence"] for d in detections], dtype=np.float64),
+        "x1": boxes[:, 0],
+        "y1": boxes[:, 1],
+        "x2": boxes[:, 2],
+        "y2": boxes[:, 3],
+    }
+
+
+def result_to_detections(result, class_names):
+    """
+    Convert a single ultralytics result into a list of JSON-friendly
+    detection dicts (class, confidence and xyxy box in pixels)
+    """
+    return arrays_to_detections(*result_to_arrays(result), class_names)
+
+
+def run_detection(model, images, conf=DEFAULT_CONF):
+    """
+    Run one batched predict call over a list of images and return
+    one list of detections per image, in input order
+    """
+    if not images:
+        return []
+    results = model.predict(source=list(images), conf=conf, device=DEFAULT_DEVICE, verbose=False)
+    return [result_to_detections(result, model.names) for result in results]
+
+
+def draw_detections(image, detections, inplace=False):
+    """
+    Draw detection boxes and labels onto an image. Works for RGB or BGR
+    input (the box colour is the same in both), so callers can draw
+    straight into the array they display. Draws on a copy unless inplace.
+    """
+    annotated = image if inplace else image.copy()
+    if CV2_AVAILABLE:
+        for det in detections:
+            x1, y1, x2, y2 = (int(v) for v in det["box"])
+            cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            label = f"{det['class_name']} {det['confidence']:.2f}"
+            cv2.putText(annotated, label, (x1, max(y1 - 6, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+        return annotated
+
+    from PIL import ImageDraw
+    canvas = Image.fromarray(annotated)
+    draw = ImageDraw.Draw(canvas)
+    for det in detections:
+        x1, y1, x2, y2 = det["box"]
+        draw.rectangle([x1, y1, x2, y2], outline=(0, 255, 0), width=2)
+        draw.text((x1, max(y1 - 12, 0)), f"{det['class_name']} {det['confidence']:.2f}", fill=(0, 255, 0))
+    annotated[...] = np.asarray(canvas)
+    return annotated
@@ -0,0 +1,411 @@
+import argparse
+from datetime import date, datetime, timezone
+import glob
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Root of the store; set DETECTION_STORE_DIR to an empty string to stop recording detections
+DETECTION_STORE_DIR = os.environ.get("DETECTION_STORE_DIR", "detection_store")
+# Site recorded for detections that don't name one
+DEFAULT_SITE = os.environ.get("DETECTION_SITE", "default")
+DEFAULT_QUERY_LIMIT = 1000
+
+# Site names become directory names, so reduce them to a safe slug
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS images (
+        id INTEGER PRIMARY KEY,
+        image_hash TEXT NOT NULL,
+        model TEXT NOT NULL,
+        site TEXT NOT NULL,
+        day TEXT NOT NULL,
+        captured_at REAL NOT NULL,
+        source TEXT,
+        width INTEGER,
+        height INTEGER,
+        detection_count INTEGER NOT NULL,
+        UNIQUE (image_hash, model)
+    );
+    CREATE INDEX IF NOT EXISTS images_day ON images (day);
+    CREATE TABLE IF NOT EXISTS detections (
+        image_id INTEGER NOT NULL REFERENCES images (id) ON DELETE CASCADE,
+        class_id INTEGER NOT NULL,
+        class_name TEXT NOT NULL,
+        confidence REAL NOT NULL,
+        x1 REAL NOT NULL, y1 REAL NOT NULL, x2 REAL NOT NULL, y2 REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS detections_class ON detections (class_name, confidence);
+    CREATE INDEX IF NOT EXISTS detections_confidence ON detections (confidence);
+    CREATE INDEX IF NOT EXISTS detections_image ON detections (image_id);
+"""
+
+
+# Which partition holds each (image, weights) pair, so re-recording an
+# image under another site or month moves it instead of duplicating it
+CATALOG_NAME = "catalog.sqlite"
+_CATALOG_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS images (
+        image_hash TEXT NOT NULL,
+        model TEXT NOT NULL,
+        partition TEXT NOT NULL,
+        PRIMARY KEY (image_hash, model)
+    );
+"""
+
+
+def site_slug(site):
+    return _UNSAFE.sub("_", str(site)).strip("._") or "_"
+
+
+def _day_of(timestamp):
+    # Days and months are UTC so a partition never depends on the server's timezone
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def _as_day(value):
+    """Normalize a date, datetime or ISO string to 'YYYY-MM-DD' (None passes through)"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    return date.fromisoformat(str(value)[:10]).strftime("%Y-%m-%d")
+
+
+class DetectionStore:
+    """
+    Persistent store of detection results for historical queries.
+
+    Results are partitioned into one SQLite file per site and month
+    (<root>/<site>/<YYYY-MM>.sqlite). Each holds an images table (content
+    hash, weights digest, day, source, size) and a detections table with
+    one row per box, indexed on class, confidence and image hash. Queries
+    only open the partitions that overlap the requested sites and dates,
+    so audits like "which sites had no FireExtinguisher last month" never
+    touch raw images or rerun the model.
+
+    Each image and weights digest is kept once across all partitions: a
+    small catalog (<root>/catalog.sqlite) records where it lives, and
+    recording it again replaces the earlier row wherever that was.
+    """
+
+    def __init__(self, root=DETECTION_STORE_DIR):
+        self.root = root
+        self._connections = {}
+        self._catalog_db = None
+        self._catalog_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def _connect(self, path):
+        with self._lock:
+            db = self._connections.get(path)
+            if db is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                db = sqlite3.connect(path, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA foreign_keys=ON")
+                db.executescript(_SCHEMA)
+                db.commit()
+                self._connections[path] = db
+            return db
+
+    def _catalog(self):
+        """The catalog connection, built from the partitions when it is new"""
+        with self._catalog_lock:
+            if self._catalog_db is None:
+                os.makedirs(self.root, exist_ok=True)
+                db = sqlite3.connect(os.path.join(self.root, CATALOG_NAME), check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.executescript(_CATALOG_SCHEMA)
+                db.commit()
+                if db.execute("SELECT 1 FROM images LIMIT 1").fetchone() is None:
+                    self._rebuild_catalog(db)
+                self._catalog_db = db
+            return self._catalog_db
+
+    def _rebuild_catalog(self, catalog):
+        """
+        Index a store written before the catalog existed, keeping only the
+        newest copy of any image that was recorded in several partitions
+        """
+        newest, stale = {}, []
+        for path in self._partitions():
+            db = self._connect(path)
+            with self._lock:
+                rows = db.execute("SELECT image_hash, model, captured_at FROM images").fetchall()
+            for image_hash, model, captured_at in rows:
+                key = (image_hash, model)
+                if key in newest and newest[key][1] >= captured_at:
+                    stale.append((path, key))
+                    continue
+                if key in newest:
+                    stale.append((newest[key][0], key))
+                newest[key] = (path, captured_at)
+        self._delete(stale)
+        with self._lock, catalog:
+            catalog.executemany("INSERT OR REPLACE INTO images (image_hash, model, partition) VALUES (?, ?, ?)",
+                                [(h, m, os.path.relpath(path, self.root)) for (h, m), (path, _) in newest.items()])
+
+    def _delete(self, entries):
+        """Remove (partition path, (image_hash, model)) rows; their boxes go with them"""
+        by_partition = {}
+        for path, key in entries:
+            by_partition.setdefault(path, []).append(key)
+        for path, keys in by_partition.items():
+            if not os.path.exists(path):
+                continue
+            db = self._connect(path)
+            with self._lock, db:
+                db.executemany("DELETE FROM images WHERE image_hash = ? AND model = ?", keys)
+
+    def _partition_path(self, site, day):
+        return os.path.join(self.root, site_slug(site), f"{day[:7]}.sqlite")
+
+    def _partitions(self, start=None, end=None, sites=None):
+        """Partition files that can hold rows for the given sites and day range"""
+        slugs = None if sites is None else {site_slug(site) for site in sites}
+        first, last = (start or "0000-00")[:7], (end or "9999-99")[:7]
+        paths = []
+        for path in sorted(glob.glob(os.path.join(self.root, "*", "*.sqlite"))):
+            month = os.path.splitext(os.path.basename(path))[0]
+            if first <= month <= last and (slugs is None or os.path.basename(os.path.dirname(path)) in slugs):
+                paths.append(path)
+        return paths
+
+    def record(self, image_hash, detections, model, site=DEFAULT_SITE, captured_at=None, source=None,
+               width=None, height=None):
+        """Store one image's detections (replacing any earlier result for the same image and weights)"""
+        self.record_many([{
+            "image_hash": image_hash, "detections": detections, "model": model, "site": site,
+            "captured_at": captured_at, "source": source, "width": width, "height": height,
+        }])
+
+    def record_many(self, records):
+        """Store several images' results, one transaction per partition"""
+        by_partition = {}
+        for record in records:
+            captured_at = record.get("captured_at") or time.time()
+            site = record.get("site") or DEFAULT_SITE
+            day = _day_of(captured_at)
+            by_partition.setdefault(self._partition_path(site, day), []).append((record, site, day, captured_at))
+
+        # Drop copies recorded earlier in other partitions (another site or month)
+        catalog = self._catalog()
+        placed = {}
+        for path, items in by_partition.items():
+            for record, _, _, _ in items:
+                placed[(record["image_hash"], record["model"])] = path
+        with self._lock:
+            previous = {key: catalog.execute("SELECT partition FROM images WHERE image_hash = ? AND model = ?",
+                                             key).fetchone() for key in placed}
+        self._delete([(os.path.join(self.root, row[0]), key) for key, row in previous.items()
+                      if row is not None and os.path.join(self.root, row[0]) != placed[key]])
+
+        for path, items in by_partition.items():
+            db = self._connect(path)
+            with self._lock, db:
+                for record, site, day, captured_at in items:
+                    detections = record["detections"]
+                    db.execute("DELETE FROM images WHERE image_hash = ? AND model = ?",
+                               (record["image_hash"], record["model"]))
+                    image_id = db.execute(
+                        "INSERT INTO images (image_hash, model, site, day, captured_at, source, width, height, "
+                        "detection_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (record["image_hash"], record["model"], site, day, captured_at, record.get("source"),
+                         record.get("width"), record.get("height"), len(detections))
+                    ).lastrowid
+                    db.executemany(
+                        "INSERT INTO detections (image_id, class_id, class_name, confidence, x1, y1, x2, y2) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [(image_id, d["class_id"], d["class_name"], d["confidence"], *d["box"]) for d in detections]
+                    )
+
+        with self._lock, catalog:
+            catalog.executemany("INSERT OR REPLACE INTO images (image_hash, model, partition) VALUES (?, ?, ?)",
+                                [(*key, os.path.relpath(path, self.root)) for key, path in placed.items()])
+
+    def _query(self, sql, params, start=None, end=None, sites=None):
+        # Opening the catalog clears duplicates out of a store written before it existed
+        self._catalog()
+        rows = []
+        for path in self._partitions(start, end, sites):
+            db = self._connect(path)
+            with self._lock:
+                cursor = db.execute(sql, params)
+                columns = [c[0] for c in cursor.description]
+                rows.extend(dict(zip(columns, row)) for row in cursor.fetchall())
+        return rows
+
+    @staticmethod
+    def _image_filters(start, end, sites):
+        clauses, params = [], []
+        if start:
+            clauses.append("i.day >= ?")
+            params.append(start)
+        if end:
+            clauses.append("i.day <= ?")
+            params.append(end)
+        if sites:
+            clauses.append(f"i.site IN ({','.join('?' * len(sites))})")
+            params.extend(sites)
+        return clauses, params
+
+    def detections(self, start=None, end=None, sites=None, classes=None, min_conf=None, image_hash=None,
+                   limit=DEFAULT_QUERY_LIMIT):
+        """Stored boxes matching the filters, newest first (start and end days are inclusive)"""
+        start, end = _as_day(start), _as_day(end)
+        clauses, params = self._image_filters(start, end, sites)
+        if classes:
+            clauses.append(f"d.class_name IN ({','.join('?' * len(classes))})")
+            params.extend(classes)
+        if min_conf is not None:
+            clauses.append("d.confidence >= ?")
+            params.append(float(min_conf))
+        if image_hash:
+            clauses.append("i.image_hash = ?")
+            params.append(image_hash)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = (f"SELECT i.site, i.day, i.captured_at, i.source, i.image_hash, i.model, d.class_id, d.class_name, "
+               f"d.confidence, d.x1, d.y1, d.x2, d.y2 FROM detections d JOIN images i ON i.id = d.image_id "
+               f"{where} ORDER BY i.captured_at DESC LIMIT ?")
+        rows = self._query(sql, params + [int(limit)], start, end, sites)
+        rows.sort(key=lambda row: row["captured_at"], reverse=True)
+        return rows[:limit]
+
+    def counts(self, start=None, end=None, sites=None, classes=None, min_conf=None, by=("site", "class_name")):
+        """
+        Aggregate stored detections: number of boxes and of distinct images
+        per group. by may combine "site", "day", "month" and "class_name".
+        """
+        start, end = _as_day(start), _as_day(end)
+        columns = {"site": "i.site", "day": "i.day", "month": "substr(i.day, 1, 7)", "class_name": "d.class_name"}
+        unknown = set(by) - set(columns)
+        if unknown:
+            raise ValueError(f"Cannot group by {', '.join(sorted(unknown))}; expected some of {sorted(columns)}")
+        clauses, params = self._image_filters(start, end, sites)
+        if classes:
+            clauses.append(f"d.class_name IN ({','.join('?' * len(classes))})")
+            params.extend(classes)
+        if min_conf is not None:
+            clauses.append("d.confidence >= ?")
+            params.append(float(min_conf))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        select = ", ".join(f"{columns[name]} AS {name}" for name in by)
+        group = f"GROUP BY {', '.join(columns[name] for name in by)}" if by else ""
+        sql = (f"SELECT {select + ', ' if select else ''}COUNT(*) AS detections, "
+               f"COUNT(DISTINCT i.id) AS images FROM detections d JOIN images i ON i.id = d.image_id "
+               f"{where} {group}")
+
+        # The catalog keeps each image in one partition, so per-partition distinct counts add up exactly
+        merged = {}
+        for row in self._query(sql, params, start, end, sites):
+            key = tuple(row[name] for name in by)
+            entry = merged.setdefault(key, {**{name: row[name] for name in by}, "detections": 0, "images": 0})
+            entry["detections"] += row["detections"]
+            entry["images"] += row["images"]
+        return sorted(merged.values(), key=lambda entry: tuple(str(entry[name]) for name in by))
+
+    def sites_without(self, class_name, start=None, end=None, min_conf=None, sites=None):
+        """
+        Sites with stored images in the day range but no detection of
+        class_name (sites with no images in the range are not listed)
+        """
+        start, end = _as_day(start), _as_day(end)
+        clauses, params = self._image_filters(start, end, sites)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        conf_clause = "AND d.confidence >= ?" if min_conf is not None else ""
+        sql = (f"SELECT i.site AS site, COUNT(*) AS images, SUM(EXISTS ("
+               f"SELECT 1 FROM detections d WHERE d.image_id = i.id AND d.class_name = ? {conf_clause})) AS hits "
+               f"FROM images i {where} GROUP BY i.site")
+        extra = [class_name] + ([float(min_conf)] if min_conf is not None else [])
+        totals = {}
+        for row in self._query(sql, extra + params, start, end, sites):
+            images, hits = totals.get(row["site"], (0, 0))
+            totals[row["site"]] = (images + row["images"], hits + (row["hits"] or 0))
+        return [{"site": site, "images": images} for site, (images, hits) in sorted(totals.items()) if not hits]
+
+    def lookup(self, image_hash, model):
+        """Stored detections for an image and weights digest, or None if it was never recorded"""
+        catalog = self._catalog()
+        with self._lock:
+            row = catalog.execute("SELECT partition FROM images WHERE image_hash = ? AND model = ?",
+                                  (image_hash, model)).fetchone()
+        paths = [os.path.join(self.root, row[0])] if row is not None else []
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            db = self._connect(path)
+            with self._lock:
+                row = db.execute("SELECT id FROM images WHERE image_hash = ? AND model = ?",
+                                 (image_hash, model)).fetchone()
+                if row is None:
+                    continue
+                boxes = db.execute("SELECT class_id, class_name, confidence, x1, y1, x2, y2 FROM detections "
+                                   "WHERE image_id = ?", (row[0],)).fetchall()
+            return [{"class_id": class_id, "class_name": name, "confidence": confidence, "box": [x1, y1, x2, y2]}
+                    for class_id, name, confidence, x1, y1, x2, y2 in boxes]
+        return None
+
+    def close(self):
+        with self._lock:
+            for db in self._connections.values():
+                db.close()
+            self._connections.clear()
+            if self._catalog_db is not None:
+                self._catalog_db.close()
+                self._catalog_db = None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_detection_store():
+    """Return the process-wide DetectionStore, or None when DETECTION_STORE_DIR is empty"""
+    global _store
+    if not DETECTION_STORE_DIR:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = DetectionStore(DETECTION_STORE_DIR)
+    return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query stored detection results")
+    parser.add_argument("--store", default=DETECTION_STORE_DIR or "detection_store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("detections", "counts", "missing"):
+        command = commands.add_parser(name)
+        command.add_argument("--start", help="first day, YYYY-MM-DD (inclusive)")
+        command.add_argument("--end", help="last day, YYYY-MM-DD (inclusive)")
+        command.add_argument("--site", action="append", dest="sites")
+        command.add_argument("--min-conf", type=float)
+        if name == "missing":
+            command.add_argument("--class", dest="class_name", required=True)
+        else:
+            command.add_argument("--class", action="append", dest="classes")
+    commands.choices["detections"].add_argument("--image-hash")
+    commands.choices["detections"].add_argument("--limit", type=int, default=DEFAULT_QUERY_LIMIT)
+    commands.choices["counts"].add_argument("--by", nargs="+", default=["site", "class_name"])
+    args = parser.parse_args()
+
+    store = DetectionStore(args.store)
+    if args.command == "detections":
+        rows = store.detections(args.start, args.end, args.sites, args.classes, args.min_conf,
+                                args.image_hash, args.limit)
+    elif args.command == "counts":
+        rows = store.counts(args.start, args.end, args.sites, args.classes, args.min_conf, tuple(args.by))
+    else:
+        rows = store.sites_without(args.class_name, args.start, args.end, args.min_conf, args.sites)
+    for row in rows:
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
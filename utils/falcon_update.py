@@ -1,4 +1,19 @@
 import requests, os
+import threading
+import time
+
+# Remote update endpoint; when unset the model directory is polled instead
+FALCON_UPDATE_URL = os.environ.get("FALCON_UPDATE_URL")
+FALCON_POLL_INTERVAL = float(os.environ.get("FALCON_POLL_INTERVAL", 300))
+
+
+def invalidate_cached_results(new_model_path: str):
+    """Drop cached detections that were not produced by the new weights"""
+    try:
+        from utils.result_cache import get_result_cache, weights_digest
+        get_result_cache().retain_weights(weights_digest(new_model_path))
+    except Exception as e:
+        print(f"[Falcon Update] Could not invalidate result cache: {e}")
 
 def check_falcon_update(current_model_path: str):
     """
@@ -15,15 +30,19 @@ def check_falcon_update(current_model_path: str):
         model_dir = os.path.dirname(current_model_path)
         model_files = [f for f in os.listdir(model_dir) if f.endswith('.pt') and f != os.path.basename(current_model_path)]
         
-        if model_files:
-            # If we have other model files, assume the latest one is an update
+        # Only files written after the current weights count as updates
+        current_mtime = os.path.getmtime(current_model_path) if os.path.exists(current_model_path) else 0
+        model_files_with_time = [(f, os.path.getmtime(os.path.join(model_dir, f))) for f in model_files]
+        model_files_with_time = [(f, t) for f, t in model_files_with_time if t > current_mtime]
+        
+        if model_files_with_time:
             # Sort by modification time to get the newest
-            model_files_with_time = [(f, os.path.getmtime(os.path.join(model_dir, f))) for f in model_files]
             model_files_with_time.sort(key=lambda x: x[1], reverse=True)
             newest_model = model_files_with_time[0][0]
             
             new_model_path = os.path.join(model_dir, newest_model)
             print(f"[Falcon Update] Found newer model: {new_model_path}")
+            invalidate_cached_results(new_model_path)
             return new_model_path
             
         # If no newer model files exist, check if we can download one
@@ -44,4 +63,122 @@ def check_falcon_update(current_model_path: str):
         print(f"[Falcon Update] Error checking for updates: {e}")
 
     print("[Falcon Update] No updates found")
-    return current_model_path
\ No newline at end of file
+    return current_model_path
+
+
+def download_weights(url: str, dest_path: str, sha256: str = None):
+    """
+    Download weights to dest_path through the artifact fetcher: parallel
+    ranged chunks, resume after interruption, SHA-256 verification and an
+    atomic rename, so a partial download never looks complete
+    """
+    from utils.artifact_fetch import HttpSource, fetch_artifact
+    return fetch_artifact(HttpSource(url), os.path.basename(dest_path), sha256=sha256,
+                          cache_dir=os.path.dirname(dest_path) or ".")
+
+
+class FalconUpdater:
+    """
+    Background model updater.
+
+    Polls FALCON_UPDATE_URL (conditional GET with ETag / If-Modified-Since)
+    for a JSON document like {"version": "...", "model_url": "...",
+    "sha256": "..."}, or the current model's directory when no URL is set.
+    New weights are downloaded, loaded and warmed up on this thread, then
+    swapped into the model registry in one assignment, so requests that
+    are already running finish on the old model.
+    """
+
+    def __init__(self, registry, model_dir="models", url=FALCON_UPDATE_URL, interval=FALCON_POLL_INTERVAL):
+        self.registry = registry
+        self.model_dir = model_dir
+        self.url = url
+        self.interval = interval
+        self._etag = None
+        self._last_modified = None
+        self._version = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.status = {"state": "idle", "last_checked": None, "last_error": None, "version": None}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="falcon-updater", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def trigger(self):
+        """Ask for an immediate check without waiting for it"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check_once()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def check_once(self):
+        """Run one update check; returns the new weights path if the model was swapped"""
+        self.status["state"] = "checking"
+        try:
+            new_model_path = self._check_remote() if self.url else self._check_local()
+            if new_model_path:
+                self.status["state"] = "warming"
+                self.registry.swap(new_model_path)
+                invalidate_cached_results(new_model_path)
+                print(f"[Falcon Update] Now serving {new_model_path}")
+            self.status["last_error"] = None
+            return new_model_path
+        except Exception as e:
+            self.status["last_error"] = str(e)
+            print(f"[Falcon Update] Background update failed: {e}")
+            return None
+        finally:
+            self.status["state"] = "idle"
+            self.status["last_checked"] = time.time()
+
+    def _check_local(self):
+        current_model_path = self.registry.model_path
+        if not current_model_path:
+            return None
+        new_model_path = check_falcon_update(current_model_path)
+        return new_model_path if new_model_path != current_model_path else None
+
+    def _check_remote(self):
+        headers = {}
+        if self._etag:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified:
+            headers["If-Modified-Since"] = self._last_modified
+
+        response = requests.get(self.url, headers=headers, timeout=30)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        data = response.json()
+
+        version = str(data.get("version", ""))
+        if not data.get("model_url") or (version and version == self._version):
+            self._remember_validators(response)
+            return None
+
+        os.makedirs(self.model_dir, exist_ok=True)
+        dest_path = os.path.join(self.model_dir, f"best_{version or int(time.time())}.pt")
+        if not os.path.exists(dest_path):
+            print(f"[Falcon Update] Downloading model version {version or 'latest'}...")
+            download_weights(data["model_url"], dest_path, sha256=data.get("sha256"))
+
+        # Only remember the validators once the download succeeded, so a failure is retried
+        self._remember_validators(response)
+        self._version = version
+        self.status["version"] = version
+        return dest_path
+
+    def _remember_validators(self, response):
+        self._etag = response.headers.get("ETag")
+        self._last_modified = response.headers.get("Last-Modified")
@@ -0,0 +1,42 @@
+import re
+import subprocess
+import sys
+
+# Heavy modules on the detection path, profiled by default
+DEFAULT_MODULES = ["streamlit", "numpy", "PIL", "cv2", "torch", "ultralytics"]
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_imports(modules=None, top=25, timeout=300):
+    """
+    Import the given modules in a fresh interpreter with `-X importtime`
+    and return the slowest imports as dicts, sorted by cumulative time.
+    Modules that fail to import are skipped.
+    """
+    modules = modules or DEFAULT_MODULES
+    # Plain import statements: importlib.import_module hides the top-level entry from -X importtime
+    code = "".join(f"try:\n    import {name}\nexcept Exception:\n    pass\n" for name in modules)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, timeout=timeout
+    )
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append({
+                "module": name,
+                "depth": len(indent) // 2,
+                "self_ms": round(int(self_us) / 1000, 1),
+                "cumulative_ms": round(int(cumulative_us) / 1000, 1),
+            })
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows[:top]
+
+
+if __name__ == "__main__":
+    for row in profile_imports(sys.argv[1:] or None):
+        print(f"{row['cumulative_ms']:>10.1f} ms  {'  ' * row['depth']}{row['module']}")
@@ -0,0 +1,213 @@
+from collections import OrderedDict
+import io
+import os
+import threading
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from utils.detection import CV2_AVAILABLE, decode_image_array
+from utils.result_cache import content_hash
+
+if CV2_AVAILABLE:
+    import cv2
+
+# JPEGs are decoded at a reduced scale (1/2, 1/4 or 1/8) as long as the
+# longer side stays at least this big; the model resizes to its imgsz anyway
+INGEST_MODEL_SIDE = int(os.environ.get("INGEST_MODEL_SIDE", 1280))
+# Longest side of the images sent to the browser
+DISPLAY_MAX_SIDE = int(os.environ.get("DISPLAY_MAX_SIDE", 1280))
+# Browser previews are encoded as "webp" (falling back to JPEG if unsupported) or "jpeg"
+PREVIEW_FORMAT = os.environ.get("PREVIEW_FORMAT", "webp").lower()
+PREVIEW_QUALITY = int(os.environ.get("PREVIEW_QUALITY", 80))
+# Memory budget for ingested images kept across reruns
+INGEST_CACHE_MB = float(os.environ.get("INGEST_CACHE_MB", 128))
+
+
+def probe_size(data: bytes):
+    """(width, height) of an image as displayed (EXIF orientation applied), read from its header only"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            # Orientations 5-8 are rotated by 90 degrees
+            if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                width, height = height, width
+    except Exception as e:
+        raise ValueError(f"unsupported or corrupt image data: {e}")
+    return width, height
+
+
+def _decode_reduced(data, model_side):
+    """
+    Decode a JPEG with draft mode, letting libjpeg skip straight to the
+    largest 1/2, 1/4 or 1/8 scale whose longer side is still model_side or
+    more. Returns (BGR array, scale) or None when no reduction is possible.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.format != "JPEG":
+            return None
+        width, height = image.size
+        if max(width, height) < 2 * model_side:
+            return None
+        ratio = model_side / max(width, height)
+        image.draft("RGB", (max(1, int(width * ratio)), max(1, int(height * ratio))))
+        scale = width / image.size[0]
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    except Exception as e:
+        raise ValueError(f"unsupported or corrupt image data: {e}")
+    return np.ascontiguousarray(np.asarray(image)[:, :, ::-1]), scale
+
+
+def resize_to_fit(image_bgr, max_side):
+    """Downscale so the longer side is at most max_side; returns (image, scale)"""
+    height, width = image_bgr.shape[:2]
+    if max(height, width) <= max_side:
+        return image_bgr, 1.0
+    ratio = max_side / max(height, width)
+    size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+    if CV2_AVAILABLE:
+        resized = cv2.resize(image_bgr, size, interpolation=cv2.INTER_AREA)
+    else:
+        resized = np.asarray(Image.fromarray(image_bgr[:, :, ::-1]).resize(size, Image.BILINEAR))[:, :, ::-1]
+    return np.ascontiguousarray(resized), width / size[0]
+
+
+def encode_preview(image_bgr, fmt=PREVIEW_FORMAT, quality=PREVIEW_QUALITY):
+    """Encode a BGR image for the browser; returns (bytes, format actually used)"""
+    if fmt == "webp":
+        if CV2_AVAILABLE:
+            ok, buffer = cv2.imencode(".webp", image_bgr, [cv2.IMWRITE_WEBP_QUALITY, quality])
+            if ok:
+                return buffer.tobytes(), "webp"
+        else:
+            out = io.BytesIO()
+            try:
+                Image.fromarray(image_bgr[:, :, ::-1]).save(out, "WEBP", quality=quality)
+                return out.getvalue(), "webp"
+            except (KeyError, OSError):
+                # Pillow built without libwebp
+                pass
+    if CV2_AVAILABLE:
+        ok, buffer = cv2.imencode(".jpg", image_bgr, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if ok:
+            return buffer.tobytes(), "jpeg"
+    out = io.BytesIO()
+    Image.fromarray(image_bgr[:, :, ::-1]).save(out, "JPEG", quality=quality)
+    return out.getvalue(), "jpeg"
+
+
+def scale_detections(detections, scale):
+    """Detections with their boxes multiplied by scale"""
+    if scale == 1.0:
+        return detections
+    return [dict(d, box=[round(v * scale, 2) for v in d["box"]]) for d in detections]
+
+
+class IngestedImage:
+    """
+    One upload, decoded once: a model input (possibly at reduced scale),
+    a size-capped display rendition and its encoded preview.
+
+    Scales are original pixels per pixel of the rendition, so detections
+    on model_input map back with to_original() and onto the display
+    rendition with to_display().
+    """
+
+    __slots__ = ("content_hash", "width", "height", "model_input", "model_scale",
+                 "display", "display_scale", "preview", "preview_format")
+
+    def __init__(self, content_hash, width, height, model_input, model_scale, display, display_scale,
+                 preview, preview_format):
+        self.content_hash = content_hash
+        self.width = width
+        self.height = height
+        self.model_input = model_input
+        self.model_scale = model_scale
+        self.display = display
+        self.display_scale = display_scale
+        self.preview = preview
+        self.preview_format = preview_format
+
+    @property
+    def nbytes(self):
+        display = self.display.nbytes if self.display is not self.model_input else 0
+        return self.model_input.nbytes + display + len(self.preview)
+
+    def to_original(self, detections):
+        return scale_detections(detections, self.model_scale)
+
+    def to_display(self, detections):
+        return scale_detections(detections, 1 / self.display_scale)
+
+
+class IngestCache:
+    """LRU of IngestedImage objects bounded by their total size in bytes"""
+
+    def __init__(self, max_bytes=INGEST_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            return None
+
+    def put(self, key, ingested):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key).nbytes
+            self._entries[key] = ingested
+            self._bytes += ingested.nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._bytes -= self._entries.popitem(last=False)[1].nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_ingest_cache():
+    """Return the process-wide IngestCache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = IngestCache()
+    return _cache
+
+
+def ingest_image(data: bytes, model_side=INGEST_MODEL_SIDE, display_side=DISPLAY_MAX_SIDE, image_hash=None):
+    """
+    Decode raw image bytes once into an IngestedImage, reusing the cached
+    one for the same content and settings. model_side=None keeps the model
+    input at full resolution (e.g. for tiled inference). EXIF orientation
+    is applied on both decode paths. Raises ValueError for non-images.
+    """
+    image_hash = image_hash or content_hash(data)
+    key = (image_hash, model_side, display_side, PREVIEW_FORMAT, PREVIEW_QUALITY)
+    cache = get_ingest_cache()
+    ingested = cache.get(key)
+    if ingested is not None:
+        return ingested
+
+    reduced = _decode_reduced(data, model_side) if model_side else None
+    if reduced is not None:
+        model_input, model_scale = reduced
+    else:
+        model_input, model_scale = decode_image_array(data), 1.0
+    height, width = (round(side * model_scale) for side in model_input.shape[:2])
+
+    display, display_scale = resize_to_fit(model_input, display_side)
+    preview, preview_format = encode_preview(display)
+    ingested = IngestedImage(image_hash, width, height, model_input, model_scale,
+                             display, display_scale * model_scale, preview, preview_format)
+    cache.put(key, ingested)
+    return ingested
@@ -0,0 +1,188 @@
+import os
+import threading
+
+# Latency buckets in seconds, tuned for CPU inference of a YOLOv8m-sized model
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        super().__init__(name, help_text)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Gauge that is either set explicitly or read from a callback at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, callback=None):
+        super().__init__(name, help_text)
+        self._values = {}
+        self._callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self._callback is not None:
+            try:
+                return [(self.name, (), self._callback())]
+            except Exception:
+                return []
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, series in self._series.items():
+                for bound, count in zip(self.buckets, series["counts"]):
+                    samples.append((f"{self.name}_bucket", key + (("le", str(bound)),), count))
+                samples.append((f"{self.name}_bucket", key + (("le", "+Inf"),), series["count"]))
+                samples.append((f"{self.name}_sum", key, round(series["sum"], 6)))
+                samples.append((f"{self.name}_count", key, series["count"]))
+        return samples
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name, help_text, callback=None):
+        return self._register(Gauge(name, help_text, callback))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def resident_memory_bytes():
+    """Current RSS of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _batcher_queue_depth():
+    from utils import batching
+    return batching._batcher.queue_depth() if batching._batcher is not None else 0
+
+
+def _cache_hit_ratio():
+    from utils import result_cache
+    return round(result_cache._cache.hit_rate(), 4) if result_cache._cache is not None else 0.0
+
+
+def _model_ready():
+    from utils.model_registry import get_model_registry
+    return 1 if get_model_registry().ready else 0
+
+
+REGISTRY = MetricsRegistry()
+
+INFERENCE_SECONDS = REGISTRY.histogram(
+    "ssod_inference_seconds", "Time spent in one batched predict call")
+REQUEST_LATENCY_SECONDS = REGISTRY.histogram(
+    "ssod_request_latency_seconds", "Time from queueing an image to its result, including batching wait")
+BATCH_SIZE = REGISTRY.histogram(
+    "ssod_batch_size", "Images per batched predict call", buckets=BATCH_SIZE_BUCKETS)
+STAGE_SECONDS = REGISTRY.histogram(
+    "ssod_stage_seconds", "Time spent in each traced stage of a detection request")
+CACHE_LOOKUPS = REGISTRY.counter(
+    "ssod_result_cache_lookups_total", "Result cache lookups by outcome (hit or miss)")
+REGISTRY.gauge("ssod_queue_depth", "Images waiting in the micro-batching queue", callback=_batcher_queue_depth)
+REGISTRY.gauge("ssod_result_cache_hit_ratio", "Result cache hit rate since start", callback=_cache_hit_ratio)
+REGISTRY.gauge("ssod_model_ready", "1 when the model is loaded and warmed up", callback=_model_ready)
+REGISTRY.gauge("ssod_process_resident_memory_bytes", "Resident memory of the process", callback=resident_memory_bytes)
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+
+# numpy, torch and ultralytics are imported lazily so importing the
+# registry stays cheap on the app's startup path
+
+# Size of the dummy frame used for the warm-up forward pass
+WARMUP_IMGSZ = int(os.environ.get("WARMUP_IMGSZ", 640))
+# Input size used when a predict call doesn't ask for one and the weights don't record one
+DEFAULT_IMGSZ = 640
+
+
+def serialize_predict(model):
+    """
+    Route every predict() on a shared model through one lock.
+
+    Ultralytics keeps one predictor per model and writes each call's conf
+    and imgsz into predictor.args before taking its own lock. Concurrent
+    callers with different settings could otherwise run with each other's
+    arguments: the batcher, tiling pre-passes, adaptive low-resolution
+    passes, video, bulk jobs and the router. imgsz also sticks between
+    calls, so calls that leave it out are given the model's default
+    rather than whatever the previous call used.
+    """
+    if getattr(model, "_predict_lock", None) is not None:
+        return model
+    lock = threading.RLock()
+    predict = model.predict
+    overrides = getattr(model, "overrides", None) or {}
+    default_imgsz = overrides.get("imgsz") or DEFAULT_IMGSZ
+
+    def locked_predict(*args, **kwargs):
+        kwargs.setdefault("imgsz", default_imgsz)
+        with lock:
+            return predict(*args, **kwargs)
+
+    # model(...) calls self.predict, so it goes through the lock as well
+    model.predict = locked_predict
+    model._predict_lock = lock
+    return model
+
+
+def build_model(model_path):
+    """
+    Construct a YOLO model from a weights file using the configured
+    inference backend, with its predict calls serialized
+    """
+    from utils.backends import load_backend_model
+    return serialize_predict(load_backend_model(model_path))
+
+
+def warm_up(model, imgsz=WARMUP_IMGSZ):
+    """Run one forward pass on a blank frame so the first real request isn't cold"""
+    import numpy as np
+    from utils.detection import DEFAULT_DEVICE
+    dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    start = time.perf_counter()
+    model.predict(source=dummy, device=DEFAULT_DEVICE, verbose=False)
+    print(f"[Model Registry] Warm-up took {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+class ModelRegistry:
+    """
+    Holds the one model instance shared by every session and request
+    thread in the process. Its predict calls are serialized (see
+    serialize_predict); the micro-batcher is what turns concurrent
+    requests into shared forward passes.
+
+    Loading is serialized so concurrent callers never build the same
+    weights twice. A new model is built and warmed up before it replaces
+    the current one, so callers that already hold a handle keep using the
+    old model until they are done with it.
+    """
+
+    def __init__(self):
+        self._model = None
+        self._model_path = None
+        self._warmed = False
+        self._load_lock = threading.Lock()
+        self._state = "idle"
+        self._error = None
+        self._loaded = threading.Event()
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def model_path(self):
+        return self._model_path
+
+    @property
+    def state(self):
+        """Load state: idle, loading, ready or failed"""
+        return self._state
+
+    @property
+    def error(self):
+        """Why the last background load failed, if it did"""
+        return self._error
+
+    @property
+    def ready(self):
+        """True once a model is loaded and has been warmed up"""
+        return self._model is not None and self._warmed
+
+    def get(self):
+        """Return a handle to the current model (None if nothing is loaded)"""
+        return self._model
+
+    def load(self, model_path, warmup=True):
+        """Load model_path unless it is already the resident model, and return the model"""
+        model_path = str(model_path)
+        with self._load_lock:
+            if self._model is not None and self._model_path == model_path:
+                return self._model
+            print(f"[Model Registry] Loading model from: {model_path}")
+            model = build_model(model_path)
+            if warmup:
+                warm_up(model)
+            # Single reference assignment: in-flight callers keep their old handle
+            self._model, self._model_path, self._warmed = model, model_path, warmup
+            self._state = "ready"
+            self._loaded.set()
+            return model
+
+    def load_in_background(self, resolve_path):
+        """
+        Resolve the weights with resolve_path() (which may download them)
+        and load them on a daemon thread, returning immediately
+        """
+        if self._state in ("loading", "ready"):
+            return
+        self._state, self._error = "loading", None
+        self._loaded.clear()
+
+        def worker():
+            try:
+                model_path = resolve_path()
+                if not model_path:
+                    raise FileNotFoundError("No model (.pt) file found. Please add your trained weights.")
+                self.load(model_path)
+            except BaseException as e:
+                self._error = e
+                self._state = "failed"
+                print(f"[Model Registry] Background load failed: {e}")
+            finally:
+                self._loaded.set()
+
+        threading.Thread(target=worker, name="model-loader", daemon=True).start()
+
+    def wait_until_loaded(self, timeout=None):
+        """Block until a pending background load has finished; returns the model (or None)"""
+        self._loaded.wait(timeout)
+        return self._model
+
+    def swap(self, model_path, warmup=True):
+        """Replace the resident model with new weights (alias of load for clarity at call sites)"""
+        return self.load(model_path, warmup=warmup)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry():
+    """Return the process-wide ModelRegistry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
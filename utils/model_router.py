@@ -0,0 +1,301 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+from utils.detection import CV2_AVAILABLE, DEFAULT_CONF, DEFAULT_DEVICE, arrays_to_detections, box_iou, result_to_arrays
+from utils.metrics import REGISTRY
+from utils.model_registry import build_model, get_model_registry, warm_up
+
+# Extra weights kept resident next to the primary model, as
+# "name=path:percent,name=path:percent". The primary gets the remaining traffic.
+MODEL_VARIANTS = os.environ.get("MODEL_VARIANTS", "")
+# "ab" routes each request to one model; "ensemble" runs every model and fuses their boxes
+ROUTER_MODE = os.environ.get("ROUTER_MODE", "ab").lower()
+# Input size shared by every model in an ensemble (images are letterboxed to it once)
+ENSEMBLE_IMGSZ = int(os.environ.get("ENSEMBLE_IMGSZ", 640))
+# Boxes from different models with at least this IoU (and the same class) are the same object
+ENSEMBLE_IOU = float(os.environ.get("ENSEMBLE_IOU", 0.55))
+
+PRIMARY = "primary"
+# Request header that pins a request to one model, bypassing the percentage split
+VARIANT_HEADER = "X-Model-Variant"
+
+AGREEMENT_BUCKETS = (0.0, 0.25, 0.5, 0.75, 0.9, 1.0)
+
+MODEL_INFERENCE_SECONDS = REGISTRY.histogram(
+    "ssod_model_inference_seconds", "Predict time per request, by model")
+MODEL_REQUESTS = REGISTRY.counter(
+    "ssod_model_requests_total", "Requests served, by model and routing mode")
+ENSEMBLE_AGREEMENT = REGISTRY.histogram(
+    "ssod_ensemble_agreement", "Share of fused ensemble boxes each model also found", buckets=AGREEMENT_BUCKETS)
+
+
+def parse_variants(spec):
+    """Parse MODEL_VARIANTS into a list of (name, path, percent)"""
+    variants = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, sep, rest = item.partition("=")
+        if not sep or not name.strip():
+            raise ValueError(f"Model variant '{item}' must look like name=path[:percent]")
+        path, colon, percent = rest.rpartition(":")
+        if not colon:
+            # No percentage given: header-only variant
+            path, percent = rest, 0.0
+        else:
+            try:
+                percent = float(percent)
+            except ValueError:
+                # The colon is part of the path (e.g. a Windows drive)
+                path, percent = rest, 0.0
+        variants.append((name.strip(), path.strip(), percent))
+    names = [name for name, _, _ in variants]
+    if PRIMARY in names or len(set(names)) != len(names):
+        raise ValueError(f"Model variant names must be unique and not '{PRIMARY}'")
+    if sum(percent for _, _, percent in variants) > 100:
+        raise ValueError("Model variant percentages add up to more than 100")
+    return variants
+
+
+def letterbox(image, imgsz=ENSEMBLE_IMGSZ):
+    """
+    Resize a BGR image to fit imgsz x imgsz, keeping its aspect ratio, and
+    pad it with grey. Returns (padded, scale, (pad_x, pad_y)).
+    """
+    height, width = image.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    new_w, new_h = max(1, round(width * scale)), max(1, round(height * scale))
+    if CV2_AVAILABLE:
+        import cv2
+        resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    else:
+        from PIL import Image
+        resized = np.asarray(Image.fromarray(image).resize((new_w, new_h), Image.BILINEAR))
+    pad_x, pad_y = (imgsz - new_w) // 2, (imgsz - new_h) // 2
+    padded = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    padded[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = resized
+    return padded, scale, (pad_x, pad_y)
+
+
+def fuse_ensemble(per_model, iou_threshold=ENSEMBLE_IOU, conf_threshold=None):
+    """
+    Weighted box fusion across models.
+
+    per_model is one (xyxy, conf, cls) tuple per model. Same-class boxes
+    from different models that overlap by iou_threshold are averaged,
+    weighted by confidence. A fused box's confidence is the mean over all
+    models, counting 0 for a model that missed it, so boxes only some
+    models agree on are down-weighted, and fused boxes below
+    conf_threshold are dropped. Returns ((xyxy, conf, cls), agreement)
+    where agreement[i] is the share of kept fused boxes model i found.
+    """
+    n_models = len(per_model)
+    xyxy = np.concatenate([arrays[0] for arrays in per_model]).reshape(-1, 4)
+    conf = np.concatenate([arrays[1] for arrays in per_model])
+    cls = np.concatenate([arrays[2] for arrays in per_model])
+    source = np.concatenate([np.full(len(arrays[1]), i) for i, arrays in enumerate(per_model)]).astype(np.int64)
+    if not len(xyxy):
+        return (xyxy.astype(np.float32), conf.astype(np.float32), cls.astype(np.int64)), [1.0] * n_models
+
+    order = np.argsort(-conf)
+    fused_boxes, fused_conf, fused_cls = [], [], []
+    found = np.zeros(n_models, dtype=np.int64)
+    while order.size:
+        best = order[0]
+        iou = box_iou(xyxy[best], xyxy[order])[0]
+        members = order[(iou >= iou_threshold) & (cls[order] == cls[best])]
+        # At most one box per model: its most confident match
+        _, first = np.unique(source[members], return_index=True)
+        members = members[first]
+        weights = conf[members]
+        order = order[~np.isin(order, members)]
+        score = weights.sum() / n_models
+        # Averaging in the models that missed a box can take it below the caller's threshold
+        if conf_threshold is not None and score < conf_threshold:
+            continue
+        fused_boxes.append((xyxy[members] * weights[:, None]).sum(axis=0) / weights.sum())
+        fused_conf.append(score)
+        fused_cls.append(cls[best])
+        found[source[members]] += 1
+
+    if not fused_boxes:
+        return (np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64)), [1.0] * n_models
+    agreement = (found / len(fused_boxes)).tolist()
+    fused = (np.array(fused_boxes, dtype=np.float32), np.array(fused_conf, dtype=np.float32),
+             np.array(fused_cls, dtype=np.int64))
+    return fused, agreement
+
+
+class ModelRouter:
+    """
+    Keeps several weights resident and decides which serves a request.
+
+    The primary model is whatever the ModelRegistry holds (so hot swaps
+    still apply); variants from MODEL_VARIANTS are loaded next to it. In
+    "ab" mode each request goes to one model, picked by the X-Model-Variant
+    header or else by hashing the request ID into the percentage split. In
+    "ensemble" mode every model sees every image: each image is decoded and
+    letterboxed once, the models run concurrently on the shared input and
+    their boxes are fused. Per-model latency and agreement are kept for
+    /models and exported as metrics.
+    """
+
+    def __init__(self, variants=None, mode=ROUTER_MODE, imgsz=ENSEMBLE_IMGSZ, iou_threshold=ENSEMBLE_IOU):
+        if mode not in ("ab", "ensemble"):
+            raise ValueError(f"Unknown ROUTER_MODE '{mode}', expected 'ab' or 'ensemble'")
+        self.mode = mode
+        self.imgsz = imgsz
+        self.iou_threshold = iou_threshold
+        self.variants = parse_variants(MODEL_VARIANTS) if variants is None else list(variants)
+        self._models = {}
+        self._load_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+        self._executor = None
+
+    @property
+    def enabled(self):
+        return bool(self.variants)
+
+    @property
+    def names(self):
+        return [PRIMARY] + [name for name, _, _ in self.variants]
+
+    def load(self, warmup=True):
+        """Build and warm up every variant that isn't resident yet"""
+        with self._load_lock:
+            for name, path, _ in self.variants:
+                if name not in self._models:
+                    print(f"[Model Router] Loading variant '{name}' from: {path}")
+                    model = build_model(path)
+                    if warmup:
+                        warm_up(model)
+                    self._models[name] = model
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=len(self.names), thread_name_prefix="ensemble")
+
+    def model(self, name):
+        """The model serving a variant (the registry's model for the primary)"""
+        if name == PRIMARY:
+            return get_model_registry().get()
+        if name not in self._models:
+            self.load()
+        return self._models[name]
+
+    def route(self, request_id, requested=None):
+        """
+        Name of the model that serves a request in "ab" mode. A known
+        variant in the header wins; otherwise the request ID picks a
+        bucket, so a client reusing its ID stays on the same model.
+        """
+        if requested in self.names:
+            return requested
+        bucket = int(hashlib.sha1(str(request_id).encode()).hexdigest()[:8], 16) % 10000 / 100
+        for name, _, percent in self.variants:
+            if bucket < percent:
+                return name
+            bucket -= percent
+        return PRIMARY
+
+    def record(self, name, seconds, images=1, agreement=None):
+        """Record one request's predict time (and ensemble agreement) for a model"""
+        MODEL_INFERENCE_SECONDS.observe(seconds, model=name)
+        MODEL_REQUESTS.inc(model=name, mode=self.mode)
+        if agreement is not None:
+            ENSEMBLE_AGREEMENT.observe(agreement, model=name)
+        with self._stats_lock:
+            stats = self._stats.setdefault(name, {"requests": 0, "images": 0, "seconds": 0.0,
+                                                  "agreement_sum": 0.0, "agreement_count": 0})
+            stats["requests"] += 1
+            stats["images"] += images
+            stats["seconds"] += seconds
+            if agreement is not None:
+                stats["agreement_sum"] += agreement
+                stats["agreement_count"] += 1
+
+    def stats(self):
+        """Per-model request counts, mean latency and mean ensemble agreement"""
+        with self._stats_lock:
+            snapshot = {name: dict(stats) for name, stats in self._stats.items()}
+        percents = {name: percent for name, _, percent in self.variants}
+        percents[PRIMARY] = 100 - sum(percents.values())
+        paths = {name: path for name, path, _ in self.variants}
+        paths[PRIMARY] = get_model_registry().model_path
+        report = {}
+        for name in self.names:
+            stats = snapshot.get(name, {})
+            requests = stats.get("requests", 0)
+            report[name] = {
+                "path": paths[name],
+                "traffic_percent": percents[name] if self.mode == "ab" else 100,
+                "loaded": self.model(name) is not None if name == PRIMARY else name in self._models,
+                "requests": requests,
+                "images": stats.get("images", 0),
+                "mean_ms": round(stats["seconds"] / requests * 1000, 2) if requests else None,
+                "mean_agreement": (round(stats["agreement_sum"] / stats["agreement_count"], 4)
+                                   if stats.get("agreement_count") else None),
+            }
+        return {"mode": self.mode, "models": report}
+
+    def ensemble_digest(self, digest_of):
+        """Cache key component for the ensemble: every member's weights digest"""
+        return "ensemble:" + "+".join(digest_of(self.model(name)) for name in self.names)
+
+    def _predict_letterboxed(self, name, batch, conf):
+        model = self.model(name)
+        start = time.perf_counter()
+        results = model.predict(source=batch, conf=conf, imgsz=self.imgsz, device=DEFAULT_DEVICE, verbose=False)
+        return [result_to_arrays(result) for result in results], time.perf_counter() - start
+
+    def ensemble_detect_arrays(self, images, conf=DEFAULT_CONF):
+        """Run every model over a list of BGR images and return fused (xyxy, conf, cls) per image"""
+        if not images:
+            return []
+        self.load()
+        # Letterbox once; every model gets the same already-sized input
+        boxed = [letterbox(image, self.imgsz) for image in images]
+        batch = [padded for padded, _, _ in boxed]
+        futures = {name: self._executor.submit(self._predict_letterboxed, name, batch, conf) for name in self.names}
+        per_model = {name: future.result() for name, future in futures.items()}
+
+        outputs, agreements = [], {name: [] for name in self.names}
+        for i, (image, (_, scale, (pad_x, pad_y))) in enumerate(zip(images, boxed)):
+            height, width = image.shape[:2]
+            unboxed = []
+            for name in self.names:
+                xyxy, scores, classes = per_model[name][0][i]
+                # Map boxes from letterboxed coordinates back onto the original image
+                xyxy = (xyxy - np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)) / scale
+                xyxy = np.clip(xyxy, 0, [width, height, width, height]).astype(np.float32)
+                unboxed.append((xyxy, scores, classes))
+            fused, agreement = fuse_ensemble(unboxed, self.iou_threshold, conf)
+            outputs.append(fused)
+            for name, share in zip(self.names, agreement):
+                agreements[name].append(share)
+
+        for name in self.names:
+            self.record(name, per_model[name][1], len(images), float(np.mean(agreements[name])))
+        return outputs
+
+    def ensemble_detect(self, images, conf=DEFAULT_CONF):
+        """ensemble_detect_arrays, returned as detection dicts (class names from the primary model)"""
+        names = self.model(PRIMARY).names
+        return [arrays_to_detections(xyxy, scores, classes, names)
+                for xyxy, scores, classes in self.ensemble_detect_arrays(images, conf)]
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_model_router():
+    """Return the process-wide ModelRouter (configured from MODEL_VARIANTS and ROUTER_MODE)"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter()
+    return _router
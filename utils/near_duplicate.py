@@ -0,0 +1,284 @@
+from collections import OrderedDict
+import itertools
+import os
+import threading
+import time
+
+import numpy as np
+
+from utils.detection import CV2_AVAILABLE
+from utils.metrics import REGISTRY
+
+if CV2_AVAILABLE:
+    import cv2
+
+# Set NEAR_DUPLICATES=0 to run every frame through the detector
+NEAR_DUPLICATES = os.environ.get("NEAR_DUPLICATES", "1").lower() not in ("0", "false", "no")
+# "dhash" (gradient hash, cheapest) or "phash" (DCT hash, more robust to exposure changes)
+NEAR_DUP_HASH = os.environ.get("NEAR_DUP_HASH", "dhash").lower()
+# Frames whose 64-bit hashes differ in at most this many bits reuse each other's detections
+NEAR_DUP_THRESHOLD = int(os.environ.get("NEAR_DUP_THRESHOLD", 6))
+# Memory bound: recent frames kept per (source, model) and number of sources tracked
+NEAR_DUP_CAPACITY = int(os.environ.get("NEAR_DUP_CAPACITY", 32))
+NEAR_DUP_MAX_SOURCES = int(os.environ.get("NEAR_DUP_MAX_SOURCES", 128))
+# Freshness: reuse a frame's detections for at most this long and this many times
+NEAR_DUP_MAX_AGE_S = float(os.environ.get("NEAR_DUP_MAX_AGE_S", 60))
+NEAR_DUP_MAX_REUSE = int(os.environ.get("NEAR_DUP_MAX_REUSE", 25))
+
+HASH_BITS = 64
+# Width of the grey thumbnail kept per frame for hashing and motion estimation
+THUMB_WIDTH = 96
+# A reused frame whose content moved further than this fraction of its size is treated as new
+MAX_SHIFT_FRACTION = 0.1
+
+NEAR_DUP_LOOKUPS = REGISTRY.counter(
+    "ssod_near_duplicate_lookups_total", "Frames checked against recent frames, by outcome (reused, miss)")
+
+
+def thumbnail(image_bgr, width=THUMB_WIDTH):
+    """Small greyscale copy of a frame, used for hashing and motion estimation"""
+    height = max(8, round(image_bgr.shape[0] * width / image_bgr.shape[1]))
+    if CV2_AVAILABLE:
+        grey = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(grey, (width, height), interpolation=cv2.INTER_AREA)
+    from PIL import Image
+    return np.asarray(Image.fromarray(image_bgr[:, :, ::-1]).convert("L").resize((width, height), Image.BILINEAR))
+
+
+def _resize(grey, size):
+    if CV2_AVAILABLE:
+        return cv2.resize(grey, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+    from PIL import Image
+    return np.asarray(Image.fromarray(grey).resize(size, Image.BILINEAR), dtype=np.float32)
+
+
+def _bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.reshape(-1)).tobytes(), "big")
+
+
+def dhash(grey):
+    """64-bit difference hash: whether each pixel of a 9x8 shrink is brighter than its right neighbour"""
+    small = _resize(grey, (9, 8))
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def phash(grey):
+    """64-bit perceptual hash: low 8x8 DCT frequencies of a 32x32 shrink compared to their median"""
+    small = _resize(grey, (32, 32))
+    if CV2_AVAILABLE:
+        coefficients = cv2.dct(small)[:8, :8]
+    else:
+        n = np.arange(32)
+        basis = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / 64)
+        coefficients = (basis @ small @ basis.T)[:8, :8]
+    return _bits_to_int(coefficients > np.median(coefficients[1:].reshape(-1)))
+
+
+HASHES = {"dhash": dhash, "phash": phash}
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class MultiIndexHash:
+    """
+    Hamming-radius search over 64-bit hashes by multi-index hashing.
+
+    Each hash is split into radius + 1 chunks, each indexed in its own
+    table. Two hashes within `radius` bits of each other must agree
+    exactly on at least one chunk, so a lookup only checks the entries
+    sharing a chunk with the query instead of every stored hash. Entries
+    can be removed, which keeps the index bounded under LRU eviction.
+    """
+
+    def __init__(self, radius, bits=HASH_BITS):
+        chunks = max(1, min(radius + 1, bits))
+        bounds = np.linspace(0, bits, chunks + 1).astype(int)
+        self._chunks = [(int(lo), (1 << int(hi - lo)) - 1) for lo, hi in zip(bounds[:-1], bounds[1:])]
+        self._tables = [{} for _ in self._chunks]
+
+    def _parts(self, value):
+        return [(value >> shift) & mask for shift, mask in self._chunks]
+
+    def add(self, key, value):
+        for table, part in zip(self._tables, self._parts(value)):
+            table.setdefault(part, set()).add(key)
+
+    def remove(self, key, value):
+        for table, part in zip(self._tables, self._parts(value)):
+            bucket = table.get(part)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del table[part]
+
+    def candidates(self, value):
+        found = set()
+        for table, part in zip(self._tables, self._parts(value)):
+            found.update(table.get(part, ()))
+        return found
+
+
+class _Anchor:
+    """A frame that was actually run through the detector"""
+    __slots__ = ("hash", "thumb", "shape", "detections", "created", "reuses")
+
+    def __init__(self, value, thumb, shape, detections):
+        self.hash = value
+        self.thumb = thumb
+        self.shape = shape
+        self.detections = detections
+        self.created = time.monotonic()
+        self.reuses = 0
+
+
+class FrameIndex:
+    """Recent detected frames of one (source, model) pair, most recently used last"""
+
+    def __init__(self, capacity=NEAR_DUP_CAPACITY, threshold=NEAR_DUP_THRESHOLD):
+        self.capacity = max(1, capacity)
+        self.threshold = threshold
+        self._anchors = OrderedDict()
+        self._index = MultiIndexHash(threshold)
+        self._ids = itertools.count()
+
+    def nearest(self, value, shape):
+        """The closest fresh anchor of the same frame size within the threshold, or None"""
+        now = time.monotonic()
+        best, best_distance = None, self.threshold + 1
+        for key in self._index.candidates(value):
+            anchor = self._anchors[key]
+            if anchor.shape != shape or now - anchor.created > NEAR_DUP_MAX_AGE_S:
+                continue
+            if anchor.reuses >= NEAR_DUP_MAX_REUSE:
+                continue
+            distance = hamming(value, anchor.hash)
+            if distance < best_distance:
+                best, best_distance = key, distance
+        if best is None:
+            return None
+        self._anchors.move_to_end(best)
+        return self._anchors[best]
+
+    def add(self, anchor):
+        key = next(self._ids)
+        self._anchors[key] = anchor
+        self._index.add(key, anchor.hash)
+        while len(self._anchors) > self.capacity:
+            old_key, old = self._anchors.popitem(last=False)
+            self._index.remove(old_key, old.hash)
+
+    def __len__(self):
+        return len(self._anchors)
+
+
+def _estimate_shift(previous, current):
+    """Global translation of current relative to previous, in thumbnail pixels"""
+    if not CV2_AVAILABLE:
+        return 0.0, 0.0
+    (dx, dy), _ = cv2.phaseCorrelate(previous.astype(np.float32), current.astype(np.float32))
+    return dx, dy
+
+
+def _shift_detections(detections, dx, dy, width, height):
+    if not dx and not dy:
+        return detections
+    shifted = []
+    for detection in detections:
+        x1, y1, x2, y2 = detection["box"]
+        box = [min(max(x1 + dx, 0), width), min(max(y1 + dy, 0), height),
+               min(max(x2 + dx, 0), width), min(max(y2 + dy, 0), height)]
+        shifted.append(dict(detection, box=[round(v, 2) for v in box]))
+    return shifted
+
+
+class NearDuplicateCache:
+    """
+    Skips inference for frames that are near-duplicates of a recent one.
+
+    Each incoming frame is reduced to a grey thumbnail and a 64-bit
+    perceptual hash. If a frame from the same source, detected with the
+    same weights, is within the Hamming threshold, its detections are
+    reused, shifted by the global motion between the two thumbnails (phase
+    correlation). Only frames that were really detected become anchors,
+    and an anchor is only reused for NEAR_DUP_MAX_AGE_S seconds and
+    NEAR_DUP_MAX_REUSE times, so results never drift far from a real
+    forward pass. Memory is bounded by NEAR_DUP_CAPACITY frames per source
+    and NEAR_DUP_MAX_SOURCES sources, evicted least recently used.
+    """
+
+    def __init__(self, threshold=NEAR_DUP_THRESHOLD, method=NEAR_DUP_HASH, capacity=NEAR_DUP_CAPACITY,
+                 max_sources=NEAR_DUP_MAX_SOURCES, motion=True):
+        if method not in HASHES:
+            raise ValueError(f"Unknown NEAR_DUP_HASH '{method}', expected one of {sorted(HASHES)}")
+        self.threshold = threshold
+        self.hash = HASHES[method]
+        self.capacity = capacity
+        self.max_sources = max(1, max_sources)
+        self.motion = motion
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _index_for(self, key):
+        index = self._indexes.get(key)
+        if index is None:
+            index = self._indexes[key] = FrameIndex(self.capacity, self.threshold)
+            while len(self._indexes) > self.max_sources:
+                self._indexes.popitem(last=False)
+        self._indexes.move_to_end(key)
+        return index
+
+    def detect(self, source, model_version, images, run):
+        """
+        Return detections for a list of BGR frames from one source. Frames
+        with no recent near-duplicate are passed to run(frames), which must
+        return their detections in order. Also returns the positions of the
+        frames whose detections were reused.
+        """
+        thumbs = [thumbnail(image) for image in images]
+        hashes = [self.hash(thumb) for thumb in thumbs]
+        key = (source, model_version)
+        results = [None] * len(images)
+        with self._lock:
+            index = self._index_for(key)
+            for i, (image, thumb, value) in enumerate(zip(images, thumbs, hashes)):
+                anchor = index.nearest(value, image.shape[:2])
+                if anchor is None:
+                    continue
+                dx, dy = _estimate_shift(anchor.thumb, thumb) if self.motion else (0.0, 0.0)
+                if abs(dx) > MAX_SHIFT_FRACTION * thumb.shape[1] or abs(dy) > MAX_SHIFT_FRACTION * thumb.shape[0]:
+                    continue
+                scale = image.shape[1] / thumb.shape[1]
+                height, width = image.shape[:2]
+                results[i] = _shift_detections(anchor.detections, dx * scale, dy * scale, width, height)
+                anchor.reuses += 1
+
+        misses = [i for i, result in enumerate(results) if result is None]
+        reused = [i for i, result in enumerate(results) if result is not None]
+        NEAR_DUP_LOOKUPS.inc(len(reused), outcome="reused")
+        NEAR_DUP_LOOKUPS.inc(len(misses), outcome="miss")
+        if misses:
+            computed = run([images[i] for i in misses])
+            with self._lock:
+                index = self._index_for(key)
+                for i, detections in zip(misses, computed):
+                    results[i] = detections
+                    index.add(_Anchor(hashes[i], thumbs[i], images[i].shape[:2], detections))
+        return results, reused
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_near_duplicate_cache():
+    """Return the process-wide NearDuplicateCache, or None when NEAR_DUPLICATES=0"""
+    global _cache
+    if not NEAR_DUPLICATES:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = NearDuplicateCache()
+    return _cache
@@ -0,0 +1,216 @@
+"""
+INT8 quantization pipeline with an accuracy-regression gate.
+
+Exports the fp32 weights to ONNX, quantizes them to INT8 (dynamic, or
+static with calibration images from the dataset in configs/data.yaml),
+evaluates mAP@0.5 for both variants and promotes the INT8 model only if
+the drop stays within the configured budget. The decision is written to
+a manifest next to the weights, which the inference backends read at
+load time.
+
+Usage:
+    python -m utils.quantize --weights models/best.pt --data configs/data.yaml --mode static --budget 0.01
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+from utils.detection import DEFAULT_DEVICE
+from utils.result_cache import weights_digest
+
+# Largest mAP@0.5 drop (absolute) the INT8 variant may have and still be promoted
+DEFAULT_MAP_BUDGET = float(os.environ.get("QUANT_MAP_BUDGET", 0.01))
+DEFAULT_CALIBRATION_IMAGES = int(os.environ.get("QUANT_CALIBRATION_IMAGES", 100))
+DEFAULT_IMGSZ = 640
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def variants_manifest_path(weights_path):
+    stem, _ = os.path.splitext(str(weights_path))
+    return stem + ".variants.json"
+
+
+def int8_artifact_path(weights_path):
+    stem, _ = os.path.splitext(str(weights_path))
+    return stem + ".int8.onnx"
+
+
+def read_variants_manifest(weights_path):
+    """Return the promotion manifest for a weights file, or None if there isn't one"""
+    path = variants_manifest_path(weights_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[Quantize] Ignoring unreadable manifest {path}: {e}")
+        return None
+
+
+def promoted_variant_path(weights_path):
+    """
+    Path of the promoted INT8 model for these weights, or None when fp32
+    should be served (no manifest, not promoted, or the weights changed
+    since the manifest was written)
+    """
+    manifest = read_variants_manifest(weights_path)
+    if not manifest or manifest.get("promoted") != "int8":
+        return None
+    int8_path = manifest.get("int8_path")
+    if not int8_path or not os.path.exists(int8_path):
+        return None
+    if manifest.get("weights_sha256") != weights_digest(weights_path):
+        return None
+    return int8_path
+
+
+def calibration_images(data_yaml, limit=DEFAULT_CALIBRATION_IMAGES, split="val"):
+    """List up to `limit` image paths from a split of a YOLO data.yaml"""
+    import yaml  # type: ignore
+    with open(data_yaml) as f:
+        data = yaml.safe_load(f)
+
+    root = data.get("path", ".")
+    if not os.path.isabs(root):
+        root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(data_yaml)), root))
+    split_dir = data.get(split) or data.get("train")
+    split_dir = split_dir if os.path.isabs(split_dir) else os.path.join(root, split_dir)
+
+    images = []
+    for dirpath, _, files in os.walk(split_dir):
+        for file in sorted(files):
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                images.append(os.path.join(dirpath, file))
+                if len(images) >= limit:
+                    return images
+    return images
+
+
+def letterbox_tensor(image_path, imgsz=DEFAULT_IMGSZ):
+    """Letterbox an image the way YOLO does and return a 1x3xHxW float32 tensor"""
+    image = Image.open(image_path).convert("RGB")
+    scale = min(imgsz / image.width, imgsz / image.height)
+    resized = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.BILINEAR)
+    canvas = Image.new("RGB", (imgsz, imgsz), (114, 114, 114))
+    canvas.paste(resized, ((imgsz - resized.width) // 2, (imgsz - resized.height) // 2))
+    tensor = np.asarray(canvas, dtype=np.float32).transpose(2, 0, 1) / 255.0
+    return tensor[np.newaxis]
+
+
+class _CalibrationReader:
+    """onnxruntime CalibrationDataReader over dataset images"""
+
+    def __init__(self, input_name, image_paths, imgsz):
+        self.input_name = input_name
+        self.image_paths = iter(image_paths)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        path = next(self.image_paths, None)
+        if path is None:
+            return None
+        return {self.input_name: letterbox_tensor(path, self.imgsz)}
+
+    def rewind(self):
+        pass
+
+
+def quantize_onnx(onnx_path, output_path, mode="dynamic", data_yaml=None,
+                  calibration_limit=DEFAULT_CALIBRATION_IMAGES, imgsz=DEFAULT_IMGSZ):
+    """Write an INT8 copy of an ONNX model using dynamic or static quantization"""
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static  # type: ignore
+
+    if mode == "dynamic":
+        quantize_dynamic(onnx_path, output_path, weight_type=QuantType.QUInt8)
+        return output_path
+
+    if mode != "static":
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    if not data_yaml:
+        raise ValueError("Static quantization needs a data.yaml for calibration images")
+    images = calibration_images(data_yaml, calibration_limit)
+    if not images:
+        raise FileNotFoundError(f"No calibration images found for {data_yaml}")
+
+    import onnxruntime as ort  # type: ignore
+    input_name = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    print(f"[Quantize] Calibrating on {len(images)} images")
+    quantize_static(
+        onnx_path, output_path, _CalibrationReader(input_name, images, imgsz),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True
+    )
+    return output_path
+
+
+def evaluate_map50(model_path, data_yaml, imgsz=DEFAULT_IMGSZ):
+    """mAP@0.5 of a model on the validation split of data_yaml"""
+    from ultralytics import YOLO  # type: ignore
+    metrics = YOLO(str(model_path), task="detect").val(
+        data=data_yaml, imgsz=imgsz, device=DEFAULT_DEVICE, plots=False, verbose=False
+    )
+    return float(metrics.box.map50)
+
+
+def quantize_and_gate(weights_path, data_yaml, mode="static", budget=DEFAULT_MAP_BUDGET,
+                      calibration_limit=DEFAULT_CALIBRATION_IMAGES, imgsz=DEFAULT_IMGSZ):
+    """
+    Quantize the weights, evaluate both variants and write the promotion
+    manifest. Returns the manifest dict.
+    """
+    from utils.backends import export_model
+
+    onnx_path = export_model(weights_path, "onnx")
+    int8_path = quantize_onnx(onnx_path, int8_artifact_path(weights_path), mode=mode,
+                              data_yaml=data_yaml, calibration_limit=calibration_limit, imgsz=imgsz)
+
+    map50_fp32 = evaluate_map50(weights_path, data_yaml, imgsz)
+    map50_int8 = evaluate_map50(int8_path, data_yaml, imgsz)
+    drop = map50_fp32 - map50_int8
+    promoted = "int8" if drop <= budget else "fp32"
+
+    manifest = {
+        "promoted": promoted,
+        "weights_sha256": weights_digest(weights_path),
+        "int8_path": int8_path,
+        "mode": mode,
+        "map50_fp32": round(map50_fp32, 4),
+        "map50_int8": round(map50_int8, 4),
+        "map50_drop": round(drop, 4),
+        "budget": budget
+    }
+    with open(variants_manifest_path(weights_path), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    if promoted == "int8":
+        print(f"[Quantize] Promoted INT8 variant (mAP@0.5 {map50_fp32:.4f} -> {map50_int8:.4f})")
+    else:
+        print(f"[Quantize] Kept fp32: mAP@0.5 drop {drop:.4f} exceeds budget {budget:.4f}")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize YOLO weights to INT8 behind an mAP@0.5 gate")
+    parser.add_argument("--weights", default="models/best.pt")
+    parser.add_argument("--data", default="configs/data.yaml")
+    parser.add_argument("--mode", choices=("dynamic", "static"), default="static")
+    parser.add_argument("--budget", type=float, default=DEFAULT_MAP_BUDGET,
+                        help="maximum allowed absolute mAP@0.5 drop")
+    parser.add_argument("--calibration-images", type=int, default=DEFAULT_CALIBRATION_IMAGES)
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+    args = parser.parse_args()
+
+    manifest = quantize_and_gate(args.weights, args.data, mode=args.mode, budget=args.budget,
+                                 calibration_limit=args.calibration_images, imgsz=args.imgsz)
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils.metrics import CACHE_LOOKUPS
+
+# Cache sizing, overridable per deployment
+DEFAULT_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_SIZE", 512))
+DEFAULT_MAX_DISK_ENTRIES = int(os.environ.get("RESULT_CACHE_DISK_SIZE", 50000))
+
+_digest_memo = {}
+_digest_lock = threading.Lock()
+
+
+def content_hash(data: bytes):
+    """SHA-256 of raw image bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def weights_digest(model_path):
+    """
+    SHA-256 of a weights file, memoized on (path, size, mtime) so the
+    file is only re-read when it actually changes on disk
+    """
+    path = os.path.abspath(str(model_path))
+    stat = os.stat(path)
+    memo_key = (path, stat.st_size, stat.st_mtime_ns)
+    with _digest_lock:
+        if memo_key in _digest_memo:
+            return _digest_memo[memo_key]
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    with _digest_lock:
+        _digest_memo[memo_key] = digest
+    return digest
+
+
+def model_weights_path(model):
+    """Best-effort path of the weights a loaded YOLO model was built from"""
+    path = getattr(model, "ckpt_path", None)
+    if not path and hasattr(model, "overrides"):
+        path = model.overrides.get("model")
+    return str(path) if path else None
+
+
+def model_digest(model):
+    """Weights hash for a loaded model, or a per-instance fallback if the file is unknown"""
+    path = model_weights_path(model)
+    if path and os.path.exists(path):
+        return weights_digest(path)
+    return f"instance-{id(model)}"
+
+
+class ResultCache:
+    """
+    Two-tier cache of detection results keyed by
+    (image content hash, weights hash, conf threshold, imgsz).
+
+    The memory tier is a bounded LRU. The optional disk tier is a SQLite
+    table that survives restarts; its values must be JSON-serializable.
+    Entries for a given set of weights can be dropped with
+    invalidate_weights() / retain_weights() when the model is swapped.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, db_path=None, max_disk_entries=DEFAULT_MAX_DISK_ENTRIES):
+        self.max_entries = max(1, int(max_entries))
+        self.max_disk_entries = max(1, int(max_disk_entries))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, weights TEXT NOT NULL, value TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_weights ON results (weights)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(image_hash, weights_hash, conf, imgsz=None):
+        return (image_hash, weights_hash, round(float(conf), 4), imgsz)
+
+    @staticmethod
+    def _disk_key(key):
+        return json.dumps(key)
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._record(hit=True)
+                return self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM results WHERE key = ?", (self._disk_key(key),)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE results SET last_used = ? WHERE key = ?", (time.time(), self._disk_key(key))
+                    )
+                    self._db.commit()
+                    value = json.loads(row[0])
+                    self._put_memory(key, value)
+                    self._record(hit=True)
+                    return value
+
+            self._record(hit=False)
+            return None
+
+    def _record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        CACHE_LOOKUPS.inc(outcome="hit" if hit else "miss")
+
+    def put(self, key, value):
+        """Store value in the memory tier and, if enabled, the disk tier"""
+        with self._lock:
+            self._put_memory(key, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, weights, value, last_used) VALUES (?, ?, ?, ?)",
+                    (self._disk_key(key), key[1], json.dumps(value), time.time())
+                )
+                self._db.execute(
+                    "DELETE FROM results WHERE key IN ("
+                    "SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,)
+                )
+                self._db.commit()
+
+    def _put_memory(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_weights(self, weights_hash):
+        """Drop every entry computed with the given weights"""
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == weights_hash]:
+                del self._entries[key]
+            if self._db is not None:
+                self._db.execute("DELETE FROM results WHERE weights = ?", (weights_hash,))
+                self._db.commit()
+
+    def retain_weights(self, weights_hash):
+        """Drop every entry that was not computed with the given weights"""
+        with self._lock:
+            for key in [k for k in self._entries if k[1] != weights_hash]:
+                del self._entries[key]
+            if self._db is not None:
+                self._db.execute("DELETE FROM results WHERE weights != ?", (weights_hash,))
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Return the process-wide ResultCache (disk tier enabled by RESULT_CACHE_DB)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache(db_path=os.environ.get("RESULT_CACHE_DB"))
+    return _cache
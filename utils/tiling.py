@@ -0,0 +1,139 @@
+import os
+
+import numpy as np
+
+from utils.detection import DEFAULT_CONF, DEFAULT_DEVICE, arrays_to_detections, box_iou, result_to_arrays
+
+# Tiling defaults, overridable per deployment
+DEFAULT_TILE_SIZE = int(os.environ.get("TILE_SIZE", 640))
+DEFAULT_TILE_OVERLAP = float(os.environ.get("TILE_OVERLAP", 0.2))
+DEFAULT_TILE_BATCH = int(os.environ.get("TILE_BATCH", 16))
+# Images with more pixels than this are tiled by default in the UI
+TILING_MIN_PIXELS = int(os.environ.get("TILING_MIN_PIXELS", 4_000_000))
+# Low threshold for the pre-pass, so faint candidates still keep their tile alive
+PREPASS_CONF = float(os.environ.get("TILE_PREPASS_CONF", 0.05))
+
+
+def _tile_starts(length, tile_size, step):
+    if length <= tile_size:
+        return [0]
+    starts = list(range(0, length - tile_size, step))
+    starts.append(length - tile_size)
+    return starts
+
+
+def make_tiles(height, width, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_TILE_OVERLAP):
+    """Overlapping tile windows covering the image, as an (N, 4) xyxy int array"""
+    step = max(1, int(tile_size * (1 - overlap)))
+    xs = _tile_starts(width, tile_size, step)
+    ys = _tile_starts(height, tile_size, step)
+    return np.array(
+        [[x, y, min(x + tile_size, width), min(y + tile_size, height)] for y in ys for x in xs],
+        dtype=np.int64
+    )
+
+
+def tiles_with_candidates(tiles, boxes):
+    """Boolean mask of tiles that intersect at least one candidate box"""
+    if len(boxes) == 0:
+        return np.zeros(len(tiles), dtype=bool)
+    tiles = tiles.astype(np.float32)[:, None, :]
+    boxes = boxes[None, :, :]
+    overlaps_x = (boxes[..., 0] < tiles[..., 2]) & (boxes[..., 2] > tiles[..., 0])
+    overlaps_y = (boxes[..., 1] < tiles[..., 3]) & (boxes[..., 3] > tiles[..., 1])
+    return (overlaps_x & overlaps_y).any(axis=1)
+
+
+def _class_offset_boxes(xyxy, cls):
+    # Shift each class into its own coordinate range so one pass is class-aware
+    offset = float(xyxy.max()) + 1.0 if len(xyxy) else 0.0
+    return xyxy + (cls.astype(np.float32) * offset)[:, None]
+
+
+def class_aware_nms(xyxy, conf, cls, iou_threshold=0.5):
+    """Indices of boxes kept by per-class non-maximum suppression"""
+    shifted = _class_offset_boxes(xyxy, cls)
+    order = np.argsort(-conf)
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        if order.size == 1:
+            break
+        iou = box_iou(shifted[best], shifted[order[1:]])[0]
+        order = order[1:][iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def weighted_box_fusion(xyxy, conf, cls, iou_threshold=0.5):
+    """
+    Fuse overlapping same-class boxes into confidence-weighted averages.
+    Returns new (xyxy, conf, cls) arrays.
+    """
+    shifted = _class_offset_boxes(xyxy, cls)
+    order = np.argsort(-conf)
+    fused_boxes, fused_conf, fused_cls = [], [], []
+    while order.size:
+        iou = box_iou(shifted[order[0]], shifted[order])[0]
+        members = order[iou > iou_threshold]
+        weights = conf[members]
+        fused_boxes.append((xyxy[members] * weights[:, None]).sum(axis=0) / weights.sum())
+        fused_conf.append(weights.max())
+        fused_cls.append(cls[order[0]])
+        order = order[iou <= iou_threshold]
+    if not fused_boxes:
+        return xyxy, conf, cls
+    return np.array(fused_boxes, dtype=np.float32), np.array(fused_conf, dtype=np.float32), np.array(fused_cls)
+
+
+def tiled_detect(model, image_bgr, conf=DEFAULT_CONF, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_TILE_OVERLAP,
+                 merge="nms", iou_threshold=0.5, skip_empty=True, tile_batch=DEFAULT_TILE_BATCH):
+    """Sliced inference for high-resolution images, returned as detection dicts (see tiled_detect_arrays)"""
+    xyxy, scores, classes = tiled_detect_arrays(model, image_bgr, conf, tile_size, overlap, merge,
+                                                iou_threshold, skip_empty, tile_batch)
+    return arrays_to_detections(xyxy, scores, classes, model.names)
+
+
+def tiled_detect_arrays(model, image_bgr, conf=DEFAULT_CONF, tile_size=DEFAULT_TILE_SIZE,
+                        overlap=DEFAULT_TILE_OVERLAP, merge="nms", iou_threshold=0.5, skip_empty=True,
+                        tile_batch=DEFAULT_TILE_BATCH):
+    """
+    Sliced inference for high-resolution images.
+
+    A low-resolution pre-pass over the whole image finds candidate regions
+    (and large objects that tiles would cut in half). Tiles that contain no
+    candidates are skipped, the rest run as batched predict calls at full
+    resolution, and all boxes are mapped back to image coordinates and
+    merged with class-aware NMS or weighted box fusion.
+    """
+    height, width = image_bgr.shape[:2]
+    prepass = model.predict(source=image_bgr, conf=min(conf, PREPASS_CONF), device=DEFAULT_DEVICE, verbose=False)[0]
+    pre_xyxy, pre_conf, pre_cls = result_to_arrays(prepass)
+
+    tiles = make_tiles(height, width, tile_size, overlap)
+    confident = pre_conf >= conf
+    all_xyxy, all_conf, all_cls = [pre_xyxy[confident]], [pre_conf[confident]], [pre_cls[confident]]
+    if len(tiles) > 1:
+        if skip_empty:
+            tiles = tiles[tiles_with_candidates(tiles, pre_xyxy)]
+
+        for start in range(0, len(tiles), tile_batch):
+            chunk = tiles[start:start + tile_batch]
+            crops = [image_bgr[y0:y1, x0:x1] for x0, y0, x1, y1 in chunk]
+            results = model.predict(source=crops, conf=conf, imgsz=tile_size, device=DEFAULT_DEVICE, verbose=False)
+            for (x0, y0, _, _), result in zip(chunk, results):
+                xyxy, tile_conf, tile_cls = result_to_arrays(result)
+                all_xyxy.append(xyxy + np.array([x0, y0, x0, y0], dtype=np.float32))
+                all_conf.append(tile_conf)
+                all_cls.append(tile_cls)
+
+    xyxy = np.concatenate(all_xyxy)
+    scores = np.concatenate(all_conf)
+    classes = np.concatenate(all_cls)
+    if len(xyxy):
+        if merge == "wbf":
+            xyxy, scores, classes = weighted_box_fusion(xyxy, scores, classes, iou_threshold)
+        else:
+            keep = class_aware_nms(xyxy, scores, classes, iou_threshold)
+            xyxy, scores, classes = xyxy[keep], scores[keep], classes[keep]
+    return xyxy, scores, classes
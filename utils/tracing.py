@@ -0,0 +1,161 @@
+from contextlib import contextmanager
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+from utils.metrics import STAGE_SECONDS
+
+# One JSON line per traced request on stdout; set TRACE_LOG=0 to silence
+TRACE_LOG = os.environ.get("TRACE_LOG", "1").lower() not in ("0", "false", "no")
+TRACE_PROFILE_DIR = os.environ.get("TRACE_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "ssod-profiles"))
+PROFILE_TOP = 25
+PROFILE_LOCK_TIMEOUT = 5
+
+# Caller-supplied IDs end up in file names, so only accept simple tokens
+_REQUEST_ID = re.compile(r"[A-Za-z0-9_.-]{1,64}")
+
+# cProfile can only be active once per process at a time
+_profile_lock = threading.Lock()
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:12]
+
+
+class RequestTrace:
+    """
+    Timing spans for one request, identified by a request ID.
+
+    Wrap each stage in `with trace.span("decode"):`. Stages measured
+    elsewhere (e.g. ultralytics' own preprocess/inference/NMS split) can
+    be added with add(). When profiling is requested, the whole request
+    runs under cProfile and the stats are dumped to
+    TRACE_PROFILE_DIR/<request_id>.prof. finish() must always be called,
+    or the profiler stays enabled and blocks later profiled requests.
+    """
+
+    def __init__(self, name, request_id=None, profile=None):
+        self.name = name
+        if not request_id or not _REQUEST_ID.fullmatch(request_id) or request_id.startswith("."):
+            request_id = new_request_id()
+        self.request_id = request_id
+        self.spans = []
+        self.profile_path = None
+        self.profile_summary = None
+        self._start = time.perf_counter()
+        self._finished_ms = None
+        self._profiler = None
+        self._thread_profilers = []
+
+        # A requested profile waits briefly for another one to finish, then runs unprofiled
+        if profile and _profile_lock.acquire(timeout=PROFILE_LOCK_TIMEOUT):
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    @property
+    def profiling(self):
+        return self._profiler is not None
+
+    def profiled(self, fn):
+        """
+        Wrap fn so that, when this request is profiled, it is also profiled
+        on whichever thread ends up calling it (e.g. an admission slot). Its
+        stats are merged into the request's profile.
+        """
+        if self._profiler is None:
+            return fn
+
+        def run(*args, **kwargs):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+ allows one active profiler per process, and it already covers every thread
+                return fn(*args, **kwargs)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.disable()
+                self._thread_profilers.append(profiler)
+
+        return run
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(stage, start, time.perf_counter())
+
+    def add(self, stage, duration_ms):
+        """Record a stage measured outside this trace"""
+        end = time.perf_counter()
+        self._record(stage, end - duration_ms / 1000, end)
+
+    def add_ultralytics_speed(self, result, prefix="predict"):
+        """Split a predict span using the per-image speed dict ultralytics attaches to results"""
+        for stage, ms in (getattr(result, "speed", None) or {}).items():
+            if ms is not None:
+                self.add(f"{prefix}.{stage}", ms)
+
+    def _record(self, stage, start, end):
+        self.spans.append({
+            "stage": stage,
+            "start_ms": round((start - self._start) * 1000, 2),
+            "duration_ms": round((end - start) * 1000, 2),
+        })
+        STAGE_SECONDS.observe(end - start, stage=stage)
+
+    @property
+    def total_ms(self):
+        if self._finished_ms is not None:
+            return self._finished_ms
+        return round((time.perf_counter() - self._start) * 1000, 2)
+
+    def timings(self):
+        """Stage name -> duration in ms (repeated stages are summed)"""
+        totals = {}
+        for span in self.spans:
+            totals[span["stage"]] = round(totals.get(span["stage"], 0.0) + span["duration_ms"], 2)
+        return totals
+
+    def finish(self, **fields):
+        """Stop the profiler (if running), emit the structured log line and return it as a dict"""
+        if self._finished_ms is None:
+            self._finished_ms = round((time.perf_counter() - self._start) * 1000, 2)
+            if self._profiler is not None:
+                self._profiler.disable()
+                self._dump_profile()
+                self._profiler = None
+                _profile_lock.release()
+
+        record = {
+            "event": "request_trace",
+            "name": self.name,
+            "request_id": self.request_id,
+            "total_ms": self._finished_ms,
+            "spans": self.spans,
+            **fields,
+        }
+        if self.profile_path:
+            record["profile"] = self.profile_path
+        if TRACE_LOG:
+            print(json.dumps(record), flush=True)
+        return record
+
+    def _dump_profile(self):
+        os.makedirs(TRACE_PROFILE_DIR, exist_ok=True)
+        self.profile_path = os.path.join(TRACE_PROFILE_DIR, f"{self.request_id}.prof")
+        out = io.StringIO()
+        stats = pstats.Stats(self._profiler, *self._thread_profilers, stream=out)
+        stats.dump_stats(self.profile_path)
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+        self.profile_summary = out.getvalue()
@@ -0,0 +1,274 @@
+from collections import namedtuple
+import math
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from utils.detection import DEFAULT_CONF, DEFAULT_DEVICE, box_iou, draw_detections, result_to_detections
+from utils.near_duplicate import get_near_duplicate_cache
+from utils.result_cache import model_digest
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+# Streaming defaults, overridable per deployment
+DEFAULT_TARGET_FPS = float(os.environ.get("VIDEO_TARGET_FPS", 5))
+DEFAULT_BATCH_SIZE = int(os.environ.get("VIDEO_BATCH_SIZE", 4))
+DEFAULT_QUEUE_SIZE = int(os.environ.get("VIDEO_QUEUE_SIZE", 8))
+
+FrameResult = namedtuple("FrameResult", ["frame_index", "timestamp", "frame", "detections", "track_ids"])
+
+_END = object()
+
+
+class IoUTracker:
+    """
+    Lightweight per-class IoU tracker so a video reports each physical
+    object once instead of once per frame.
+
+    Detections are greedily matched to live tracks of the same class by
+    IoU. Tracks not matched for max_age processed frames are retired.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=5, min_hits=2):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.tracks = {}
+        self._next_id = 1
+        self._step = 0
+
+    def update(self, timestamp, detections):
+        """Match one frame's detections to tracks and return their track ids"""
+        self._step += 1
+        track_ids = [None] * len(detections)
+        live = {tid: t for tid, t in self.tracks.items() if self._step - t["last_step"] <= self.max_age}
+
+        for class_id in {d["class_id"] for d in detections}:
+            det_idx = [i for i, d in enumerate(detections) if d["class_id"] == class_id]
+            trk_ids = [tid for tid, t in live.items() if t["class_id"] == class_id]
+            if trk_ids:
+                iou = box_iou([detections[i]["box"] for i in det_idx], [live[t]["box"] for t in trk_ids])
+                # Greedy matching, best IoU first
+                for flat in np.argsort(-iou, axis=None):
+                    d, t = np.unravel_index(flat, iou.shape)
+                    if iou[d, t] < self.iou_threshold:
+                        break
+                    if track_ids[det_idx[d]] is None and trk_ids[t] is not None:
+                        track_ids[det_idx[d]] = trk_ids[t]
+                        trk_ids[t] = None
+
+            for i in det_idx:
+                if track_ids[i] is None:
+                    track_ids[i] = self._new_track(class_id, detections[i], timestamp)
+                else:
+                    self._extend_track(track_ids[i], detections[i], timestamp)
+        return track_ids
+
+    def _new_track(self, class_id, detection, timestamp):
+        track_id = self._next_id
+        self._next_id += 1
+        self.tracks[track_id] = {
+            "class_id": class_id,
+            "class_name": detection["class_name"],
+            "box": detection["box"],
+            "first_seen": timestamp,
+            "last_seen": timestamp,
+            "last_step": self._step,
+            "hits": 1,
+            "max_confidence": detection["confidence"],
+        }
+        return track_id
+
+    def _extend_track(self, track_id, detection, timestamp):
+        track = self.tracks[track_id]
+        track["box"] = detection["box"]
+        track["last_seen"] = timestamp
+        track["last_step"] = self._step
+        track["hits"] += 1
+        track["max_confidence"] = max(track["max_confidence"], detection["confidence"])
+
+    def summary(self):
+        """One row per tracked object seen in at least min_hits frames"""
+        return [
+            {
+                "track_id": tid,
+                "class_name": t["class_name"],
+                "first_seen_s": round(t["first_seen"], 2),
+                "last_seen_s": round(t["last_seen"], 2),
+                "frames": t["hits"],
+                "max_confidence": round(t["max_confidence"], 4),
+            }
+            for tid, t in sorted(self.tracks.items())
+            if t["hits"] >= self.min_hits
+        ]
+
+
+class FramePacer:
+    """
+    Adaptive frame skipping: keep every Nth source frame, where N follows
+    the lower of the target FPS and what inference can currently sustain
+    """
+
+    def __init__(self, source_fps, target_fps):
+        self.source_fps = source_fps if source_fps and source_fps > 0 else 30.0
+        self.target_fps = target_fps
+        self.stride = max(1, math.ceil(self.source_fps / target_fps))
+        self._seconds_per_frame = None
+        self._next_index = 0
+
+    def should_process(self, frame_index):
+        if frame_index < self._next_index:
+            return False
+        self._next_index = frame_index + self.stride
+        return True
+
+    def record(self, frames, seconds):
+        """Feed back measured inference time and recompute the stride"""
+        per_frame = seconds / max(frames, 1)
+        if self._seconds_per_frame is None:
+            self._seconds_per_frame = per_frame
+        else:
+            self._seconds_per_frame = 0.8 * self._seconds_per_frame + 0.2 * per_frame
+        capacity_fps = 1.0 / max(self._seconds_per_frame, 1e-6)
+        self.stride = max(1, math.ceil(self.source_fps / min(self.target_fps, capacity_fps)))
+
+
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+
+def stream_detections(model, source, conf=DEFAULT_CONF, target_fps=DEFAULT_TARGET_FPS,
+                      batch_size=DEFAULT_BATCH_SIZE, queue_size=DEFAULT_QUEUE_SIZE, tracker=None, admit=None):
+    """
+    Run detection over a video file, stream URL (e.g. rtsp://) or camera
+    index and yield a FrameResult per processed frame.
+
+    Decode and inference run on their own threads, connected to the
+    annotation stage (this generator) by bounded queues, so decoding the
+    next frames overlaps with inference on the current batch. Frames that
+    are near-duplicates of a recently detected one reuse its detections
+    instead of running the model. Pass a tracker to read per-object
+    results from tracker.summary() afterwards. admit(fn, stop), if given,
+    runs each batch's inference, e.g. on an admission slot
+    (AdmissionQueue.run_patiently).
+    """
+    if not CV2_AVAILABLE:
+        raise RuntimeError("Video detection requires OpenCV")
+
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video source: {source}")
+
+    tracker = tracker if tracker is not None else IoUTracker()
+    pacer = FramePacer(capture.get(cv2.CAP_PROP_FPS), target_fps)
+    decoded = queue.Queue(maxsize=queue_size)
+    inferred = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+    near_duplicates = get_near_duplicate_cache()
+    model_version = (model_digest(model), conf)
+
+    def predict(frames):
+        results = model.predict(source=frames, conf=conf, device=DEFAULT_DEVICE, verbose=False)
+        return [result_to_detections(result, model.names) for result in results]
+
+    def decode_stage():
+        frame_index = 0
+        try:
+            while not stop.is_set():
+                # grab() is cheap; only frames we keep are fully decoded
+                if not capture.grab():
+                    break
+                if pacer.should_process(frame_index):
+                    ok, frame = capture.retrieve()
+                    if ok and not _put(decoded, (frame_index, frame_index / pacer.source_fps, frame), stop):
+                        break
+                frame_index += 1
+        except Exception as e:
+            errors.append(e)
+        finally:
+            capture.release()
+            _put(decoded, _END, stop)
+
+    def inference_stage():
+        finished = False
+        try:
+            while not finished and not stop.is_set():
+                item = _get(decoded, stop)
+                if item is _END:
+                    break
+                batch = [item]
+                while len(batch) < batch_size:
+                    try:
+                        item = decoded.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _END:
+                        finished = True
+                        break
+                    batch.append(item)
+
+                start = time.perf_counter()
+                frames = [frame for _, _, frame in batch]
+
+                def infer():
+                    if near_duplicates is not None:
+                        return near_duplicates.detect(str(source), model_version, frames, predict)[0]
+                    return predict(frames)
+
+                batch_detections = admit(infer, stop) if admit is not None else infer()
+                pacer.record(len(batch), time.perf_counter() - start)
+                for (frame_index, timestamp, frame), detections in zip(batch, batch_detections):
+                    if not _put(inferred, (frame_index, timestamp, frame, detections), stop):
+                        return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            _put(inferred, _END, stop)
+
+    threads = [
+        threading.Thread(target=decode_stage, name="video-decode", daemon=True),
+        threading.Thread(target=inference_stage, name="video-inference", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = inferred.get()
+            if item is _END:
+                break
+            frame_index, timestamp, frame, detections = item
+            track_ids = tracker.update(timestamp, detections)
+            yield FrameResult(frame_index, timestamp, draw_detections(frame, detections), detections, track_ids)
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        for q in (decoded, inferred):
+            while not q.empty():
+                q.get_nowait()
+        for thread in threads:
+            thread.join(timeout=5)
@@ -0,0 +1,511 @@
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import itertools
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from utils.adaptive import ADAPTIVE_DECISIONS
+from utils.admission import REQUEST_DEADLINE_MS
+from utils.detection import DEFAULT_CONF, DEFAULT_DEVICE, arrays_to_detections
+from utils.metrics import BATCH_SIZE, INFERENCE_SECONDS, REGISTRY, REQUEST_LATENCY_SECONDS
+
+# Number of inference worker processes; 0 keeps inference in the serving process
+DEFAULT_WORKERS = int(os.environ.get("INFERENCE_WORKERS", 0))
+# Torch/ONNX threads per worker; defaults to an even split of the cores
+DEFAULT_WORKER_THREADS = int(os.environ.get("WORKER_THREADS", 0))
+# Pin each worker to its own block of cores (Linux only)
+PIN_CPUS = os.environ.get("WORKER_PIN_CPUS", "1").lower() not in ("0", "false", "no")
+# Shared-memory slot size; larger images are pickled through the task queue instead
+DEFAULT_SLOT_MB = int(os.environ.get("WORKER_SLOT_MB", 32))
+DEFAULT_SLOTS_PER_WORKER = int(os.environ.get("WORKER_SLOTS_PER_WORKER", 4))
+DEFAULT_MAX_RETRIES = int(os.environ.get("WORKER_MAX_RETRIES", 2))
+WORKER_MAX_BATCH = int(os.environ.get("BATCH_MAX_SIZE", 8))
+
+# Tail of every slot reserved for results: rows of (x1, y1, x2, y2, conf, cls) float32
+RESULT_BYTES = 64 * 1024
+_RESULT_ROW_BYTES = 6 * 4
+# A worker that dies this many times in a row before becoming ready is not restarted again
+MAX_STARTUP_FAILURES = 3
+# tmpfs backing POSIX shared memory (64 MB by default in Docker)
+SHM_DIR = "/dev/shm"
+# Share of its free space the slots may take, leaving room for torch and other users
+SHM_BUDGET = 0.75
+# Slots are shrunk to fit SHM_DIR, but not below this; smaller than that the pool isn't started
+MIN_SLOT_MB = 2
+
+WORKER_RESTARTS = REGISTRY.counter("ssod_worker_restarts_total", "Inference worker processes restarted after a crash")
+
+
+def _pin_cpus(index, threads):
+    """Give worker index its own block of cores, wrapping around if there are more workers than cores"""
+    if not PIN_CPUS or not hasattr(os, "sched_setaffinity"):
+        return
+    cores = sorted(os.sched_getaffinity(0))
+    start = (index * threads) % len(cores)
+    block = [cores[(start + i) % len(cores)] for i in range(min(threads, len(cores)))]
+    os.sched_setaffinity(0, block)
+
+
+def _shm_free_bytes():
+    """Free space in SHM_DIR, or None where it can't be measured"""
+    try:
+        stat = os.statvfs(SHM_DIR)
+    except (AttributeError, OSError):
+        return None
+    return stat.f_bavail * stat.f_frsize
+
+
+def _worker_main(index, model_path, threads, shm_name, slot_bytes, task_queue, result_queue):
+    """Entry point of a worker process: load the model once, then serve tasks until told to stop"""
+    # Must be set before torch / onnxruntime are imported
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    _pin_cpus(index, threads)
+
+    from utils import backends
+    from utils.adaptive import adaptive_detect_arrays
+    from utils.detection import result_to_arrays
+    from utils.model_registry import build_model, warm_up
+    backends.INTRA_OP_THREADS = threads
+    backends.INTER_OP_THREADS = 1
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buffer = shm.buf
+    model = build_model(model_path)
+    warm_up(model)
+    result_queue.put(("ready", index, dict(model.names)))
+
+    def image_of(task):
+        if task["inline"] is not None:
+            return task["inline"]
+        # Zero-copy view of the frame the parent wrote into the slot
+        return np.ndarray(task["shape"], dtype=np.uint8, buffer=buffer, offset=task["slot"] * slot_bytes)
+
+    def write_result(task, xyxy, conf, cls):
+        rows = np.concatenate([xyxy, conf[:, None], cls[:, None].astype(np.float32)], axis=1).astype(np.float32)
+        rows = rows[:RESULT_BYTES // _RESULT_ROW_BYTES]
+        offset = (task["slot"] + 1) * slot_bytes - RESULT_BYTES
+        np.ndarray(rows.shape, dtype=np.float32, buffer=buffer, offset=offset)[:] = rows
+        return len(rows), (rows if task["inline"] is not None else None)
+
+    stopping = False
+    while not stopping:
+        task = task_queue.get()
+        if task is None:
+            break
+        # Drain whatever else is already queued into the same forward pass
+        tasks = [task]
+        while len(tasks) < WORKER_MAX_BATCH:
+            try:
+                task = task_queue.get_nowait()
+            except queue.Empty:
+                break
+            if task is None:
+                stopping = True
+                break
+            tasks.append(task)
+
+        groups = {}
+        for task in tasks:
+            groups.setdefault((task["conf"], task["adaptive"]), []).append(task)
+        for (conf, adaptive), group in groups.items():
+            start = time.perf_counter()
+            try:
+                images = [image_of(t) for t in group]
+                if adaptive:
+                    outputs = [(out.xyxy, out.conf, out.cls, (out.decision, out.reason))
+                               for out in adaptive_detect_arrays(model, images, conf)]
+                else:
+                    results = model.predict(source=images, conf=conf, device=DEFAULT_DEVICE, verbose=False)
+                    outputs = [(*result_to_arrays(result), None) for result in results]
+            except Exception as e:
+                for task in group:
+                    result_queue.put(("error", index, (task["id"], task["attempt"]), str(e)))
+                continue
+            result_queue.put(("batch", index, len(group), time.perf_counter() - start))
+            for task, (xyxy, scores, classes, decision) in zip(group, outputs):
+                count, inline_rows = write_result(task, xyxy, scores, classes)
+                result_queue.put(("done", index, (task["id"], task["attempt"]), count, inline_rows, decision))
+
+    # Drop the views into the slots so the mapping can be released
+    images = results = outputs = None
+    try:
+        buffer.release()
+        shm.close()
+    except BufferError:
+        # The predictor still holds the last batch; the mapping goes away with the process
+        pass
+
+
+class _Job:
+    __slots__ = ("id", "slot", "shape", "conf", "adaptive", "inline", "future", "worker", "attempts", "enqueued_at")
+
+    def __init__(self, job_id, slot, shape, conf, adaptive, inline):
+        self.id = job_id
+        self.slot = slot
+        self.shape = shape
+        self.conf = conf
+        self.adaptive = adaptive
+        self.inline = inline
+        self.future = Future()
+        self.worker = None
+        self.attempts = 0
+        self.enqueued_at = time.perf_counter()
+
+    def task(self):
+        return {"id": self.id, "attempt": self.attempts, "slot": self.slot, "shape": self.shape,
+                "conf": self.conf, "adaptive": self.adaptive, "inline": self.inline}
+
+
+class _Worker:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.tasks = None
+        self.ready = False
+        self.startup_failures = 0
+        self.inflight = set()
+
+
+class WorkerPool:
+    """
+    Pool of inference worker processes, each holding its own copy of the
+    model with a pinned thread count.
+
+    Frames are copied once into a shared-memory slot and read in place by
+    the worker; results come back through the tail of the same slot, so
+    only small task descriptors go through the queues. Frames larger than
+    a slot are pickled through the task queue instead. Slots are shrunk
+    to fit the free space in SHM_DIR; if even MIN_SLOT_MB slots don't
+    fit, RuntimeError is raised. Each worker batches
+    whatever is queued for it. Work is sent to the least busy worker. A
+    worker that dies is restarted and its in-flight requests are retried
+    on the pool, up to max_retries times.
+    """
+
+    def __init__(self, model_path, workers=DEFAULT_WORKERS, threads=DEFAULT_WORKER_THREADS,
+                 slot_mb=DEFAULT_SLOT_MB, slots_per_worker=DEFAULT_SLOTS_PER_WORKER,
+                 max_retries=DEFAULT_MAX_RETRIES):
+        self.model_path = str(model_path)
+        self.num_workers = max(1, int(workers))
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.num_workers)
+        self.max_retries = max_retries
+        self.num_slots = self.num_workers * max(1, int(slots_per_worker))
+        slot_mb = max(1, int(slot_mb))
+        free = _shm_free_bytes()
+        if free is not None:
+            # Writing past what tmpfs can hold is a SIGBUS in this process, not an error
+            fit_mb = (int(free * SHM_BUDGET) // self.num_slots - RESULT_BYTES) >> 20
+            if fit_mb < MIN_SLOT_MB:
+                raise RuntimeError(f"{SHM_DIR} has {free >> 20} MB free, too little for {self.num_slots} "
+                                   f"worker slots (raise the container's --shm-size)")
+            if fit_mb < slot_mb:
+                print(f"[Worker Pool] Only {free >> 20} MB free in {SHM_DIR}; shrinking slots "
+                      f"from {slot_mb} MB to {fit_mb} MB")
+                slot_mb = fit_mb
+        self.slot_bytes = slot_mb * (1 << 20) + RESULT_BYTES
+        self.class_names = None
+
+        self._ctx = mp.get_context("spawn")
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * self.num_slots)
+        self._free_slots = queue.Queue()
+        for slot in range(self.num_slots):
+            self._free_slots.put(slot)
+        self._results = self._ctx.Queue()
+        self._jobs = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._closed = False
+        self._stopped = False
+        self._failed = None
+
+        self._workers = [_Worker(i) for i in range(self.num_workers)]
+        for worker in self._workers:
+            self._start_worker(worker)
+        self._collector = threading.Thread(target=self._collect, name="worker-pool", daemon=True)
+        self._collector.start()
+
+    @property
+    def ready(self):
+        """True once every worker has loaded and warmed up its model"""
+        return all(w.ready for w in self._workers)
+
+    @property
+    def failed(self):
+        """Why the pool gave up (a worker kept failing to start), or None"""
+        return self._failed
+
+    def alive_workers(self):
+        return sum(1 for w in self._workers if w.process.is_alive())
+
+    def wait_until_ready(self, timeout=None):
+        self._ready.wait(timeout)
+        if self._failed:
+            raise RuntimeError(self._failed)
+        return self.ready
+
+    def submit_async(self, image, conf=DEFAULT_CONF, adaptive=False, timeout=None):
+        """
+        Queue one BGR uint8 frame and return a Future for its list of
+        detections. adaptive=True runs the adaptive resolution policy
+        (utils.adaptive) in the worker instead of one fixed-size pass.
+        Waits at most timeout seconds (default REQUEST_DEADLINE_MS) for a
+        free slot, then raises TimeoutError.
+        """
+        if self._closed:
+            raise RuntimeError("WorkerPool is closed")
+        if self._failed:
+            raise RuntimeError(self._failed)
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        timeout = REQUEST_DEADLINE_MS / 1000 if timeout is None else timeout
+        try:
+            # Every slot stays taken while a worker is wedged, so don't wait past the caller's deadline
+            slot = self._free_slots.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            raise TimeoutError(f"no free inference worker slot within {timeout:.1f} s")
+        inline = None
+        if image.nbytes <= self.slot_bytes - RESULT_BYTES:
+            offset = slot * self.slot_bytes
+            np.ndarray(image.shape, dtype=np.uint8, buffer=self._shm.buf, offset=offset)[:] = image
+        else:
+            # Too big for a slot: pickle this one through the queue (the slot still carries the result)
+            inline = image
+        job = _Job(next(self._ids), slot, image.shape, conf, adaptive, inline)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._dispatch(job)
+        return job.future
+
+    def submit(self, image, conf=DEFAULT_CONF, timeout=None, adaptive=False):
+        return self.submit_many([image], conf, timeout, adaptive)[0]
+
+    def submit_many(self, images, conf=DEFAULT_CONF, timeout=None, adaptive=False):
+        """
+        Queue several frames and return their detections in input order.
+        timeout (default REQUEST_DEADLINE_MS) bounds the whole call,
+        waiting for slots and for results alike.
+        """
+        timeout = REQUEST_DEADLINE_MS / 1000 if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        futures = [self.submit_async(image, conf, adaptive, deadline - time.monotonic()) for image in images]
+        try:
+            return [future.result(max(deadline - time.monotonic(), 0)) for future in futures]
+        except FutureTimeoutError:
+            # Before Python 3.11 this is not the builtin TimeoutError
+            raise TimeoutError(f"inference workers did not answer within {timeout:.1f} s")
+
+    def close(self, drain_timeout=30):
+        """Stop accepting work, let in-flight requests finish, then stop every worker and release the shared memory"""
+        self._closed = True
+        deadline = time.monotonic() + drain_timeout
+        while self._jobs and time.monotonic() < deadline and not self._failed:
+            time.sleep(0.05)
+        self._stopped = True
+        for worker in self._workers:
+            try:
+                worker.tasks.put(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._collector.join(timeout=5)
+        with self._lock:
+            for job in list(self._jobs.values()):
+                self._finish(job, exception=RuntimeError("WorkerPool closed"))
+        self._shm.close()
+        self._shm.unlink()
+
+    def _start_worker(self, worker):
+        worker.tasks = self._ctx.Queue()
+        worker.ready = False
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker.index, self.model_path, self.threads, self._shm.name, self.slot_bytes,
+                  worker.tasks, self._results),
+            name=f"inference-worker-{worker.index}",
+            daemon=True
+        )
+        worker.process.start()
+
+    def _dispatch(self, job):
+        """Send job to the least busy live worker (caller holds the lock)"""
+        candidates = [w for w in self._workers if w.process.is_alive()] or self._workers
+        worker = min(candidates, key=lambda w: len(w.inflight))
+        job.worker = worker.index
+        worker.inflight.add(job.id)
+        worker.tasks.put(job.task())
+
+    def _finish(self, job, result=None, exception=None):
+        """Resolve a job and free its slot (caller holds the lock)"""
+        self._jobs.pop(job.id, None)
+        if job.worker is not None:
+            self._workers[job.worker].inflight.discard(job.id)
+        self._free_slots.put(job.slot)
+        if job.future.done():
+            return
+        if exception is not None:
+            job.future.set_exception(exception)
+        else:
+            REQUEST_LATENCY_SECONDS.observe(time.perf_counter() - job.enqueued_at)
+            job.future.set_result(result)
+
+    def _read_result(self, job, count, inline_rows):
+        if inline_rows is None:
+            offset = (job.slot + 1) * self.slot_bytes - RESULT_BYTES
+            inline_rows = np.ndarray((count, 6), dtype=np.float32, buffer=self._shm.buf, offset=offset).copy()
+        return arrays_to_detections(inline_rows[:, :4], inline_rows[:, 4], inline_rows[:, 5].astype(np.int64),
+                                    self.class_names or {})
+
+    def _collect(self):
+        while not self._stopped:
+            try:
+                message = self._results.get(timeout=0.5)
+            except queue.Empty:
+                message = None
+            except (OSError, EOFError):
+                return
+            if message is not None:
+                self._handle(message)
+            self._check_workers()
+
+    def _handle(self, message):
+        kind, index = message[0], message[1]
+        with self._lock:
+            worker = self._workers[index]
+            if kind == "ready":
+                worker.ready, worker.startup_failures = True, 0
+                self.class_names = message[2]
+                if self.ready:
+                    self._ready.set()
+            elif kind == "batch":
+                BATCH_SIZE.observe(message[2])
+                INFERENCE_SECONDS.observe(message[3])
+            elif kind in ("done", "error"):
+                job_id, attempt = message[2]
+                job = self._jobs.get(job_id)
+                if job is None or job.worker != index or job.attempts != attempt:
+                    # Stale reply from a worker whose job was already retried elsewhere
+                    return
+                if kind == "done":
+                    if message[5] is not None:
+                        # Adaptive decisions are made in the worker; count them in this process's metrics
+                        decision, reason = message[5]
+                        ADAPTIVE_DECISIONS.inc(decision=decision, reason=reason)
+                    self._finish(job, result=self._read_result(job, message[3], message[4]))
+                else:
+                    self._finish(job, exception=RuntimeError(message[3]))
+
+    def _check_workers(self):
+        with self._lock:
+            if self._stopped:
+                return
+            for worker in self._workers:
+                if worker.process.is_alive():
+                    continue
+                exitcode = worker.process.exitcode
+                if not worker.ready:
+                    worker.startup_failures += 1
+                orphaned = [self._jobs[job_id] for job_id in worker.inflight if job_id in self._jobs]
+                worker.inflight.clear()
+
+                if worker.startup_failures >= MAX_STARTUP_FAILURES:
+                    self._failed = (f"inference worker {worker.index} failed to start "
+                                    f"{worker.startup_failures} times (exit code {exitcode})")
+                    print(f"[Worker Pool] {self._failed}")
+                    self._ready.set()
+                    for job in list(self._jobs.values()):
+                        self._finish(job, exception=RuntimeError(self._failed))
+                    return
+
+                print(f"[Worker Pool] Worker {worker.index} exited with code {exitcode}; restarting "
+                      f"and retrying {len(orphaned)} requests")
+                WORKER_RESTARTS.inc()
+                self._start_worker(worker)
+                for job in orphaned:
+                    job.attempts += 1
+                    if job.attempts > self.max_retries:
+                        self._finish(job, exception=RuntimeError(
+                            f"inference worker crashed {job.attempts} times while running this request"))
+                    else:
+                        self._dispatch(job)
+
+
+_pool = None
+_pending_path = None
+# Weights whose pool failed to start; not retried until the weights change
+_failed_path = None
+_pool_lock = threading.Lock()
+
+REGISTRY.gauge("ssod_worker_pool_alive", "Live inference worker processes",
+               callback=lambda: _pool.alive_workers() if _pool is not None else 0)
+
+
+def _replace_pool(model_path):
+    """Start a pool for new weights and retire the old one once the new workers are warm"""
+    global _pool, _pending_path
+    pool = None
+    try:
+        pool = WorkerPool(model_path)
+        pool.wait_until_ready()
+    except (RuntimeError, OSError) as e:
+        print(f"[Worker Pool] Keeping the current workers, new weights failed to load: {e}")
+        if pool is not None:
+            pool.close(drain_timeout=0)
+        with _pool_lock:
+            _pending_path = None
+        return
+    with _pool_lock:
+        previous, _pool, _pending_path = _pool, pool, None
+    print(f"[Worker Pool] Now serving {model_path}")
+    previous.close()
+
+
+def get_worker_pool(model_path=None):
+    """
+    Return the process-wide WorkerPool, or None when INFERENCE_WORKERS is 0.
+
+    The pool is started on first use with model_path. When a later call
+    passes different weights (e.g. after a model update), a new pool is
+    warmed up in the background and replaces the current one, which keeps
+    serving until then. A pool whose workers keep failing to start is
+    retired, and callers fall back to in-process inference (None) until
+    different weights are passed. The same happens when the pool can't be
+    started at all, e.g. when /dev/shm is too small for its slots.
+    """
+    global _pool, _pending_path, _failed_path
+    if DEFAULT_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is not None and _pool.failed:
+            print(f"[Worker Pool] Falling back to in-process inference: {_pool.failed}")
+            _failed_path, failed = _pool.model_path, _pool
+            _pool = None
+            threading.Thread(target=failed.close, kwargs={"drain_timeout": 0}, name="worker-pool-close",
+                             daemon=True).start()
+        if _pool is None:
+            if model_path is None or str(model_path) == _failed_path:
+                return None
+            try:
+                _pool, _failed_path = WorkerPool(model_path), None
+            except (RuntimeError, OSError) as e:
+                print(f"[Worker Pool] Falling back to in-process inference: {e}")
+                _failed_path = str(model_path)
+                return None
+        elif model_path is not None and str(model_path) not in (_pool.model_path, _pending_path):
+            _pending_path = str(model_path)
+            threading.Thread(target=_replace_pool, args=(_pending_path,), name="worker-pool-swap",
+                             daemon=True).start()
+        return _pool
+
+
+def pool_ready():
+    """False while an enabled worker pool is still starting; True when ready, failed over or not in use"""
+    return _pool is None or _pool.ready or bool(_pool.failed)